@@ -0,0 +1,93 @@
+import argparse
+import pytesdaq.io.hdf5 as hdf5
+import pytesdaq.config.settings as settings
+from glob import glob
+import os
+
+if __name__ == "__main__":
+
+
+    # ========================
+    # Input arguments
+    # ========================
+    parser = argparse.ArgumentParser(description='Convert HDF5 run (one dataset per event) '
+                                     'into packed [event, chan, sample] layout')
+    parser.add_argument('--input_path', type = str,
+                        help = 'Input run directory or file')
+    parser.add_argument('--output_path', type = str,
+                        help = 'Output directory')
+    parser.add_argument('--chunk_size', type = float, default=1,
+                        help = 'Approximate chunk size in MB [default: 1]')
+    parser.add_argument('--compression', type = str,
+                        help = ('Compression filter ("none", "gzip", "lzf", "lz4", "zstd", '
+                                '"blosc_lz4", "blosc_zstd") [default: from setup.ini]'))
+    parser.add_argument('--compression_level', type = int,
+                        help = 'Compression level [default: from setup.ini]')
+    parser.add_argument('--shuffle', action="store_true",
+                        help='Byte shuffle pre-filter [default: from setup.ini]')
+    parser.add_argument('--delta', action="store_true",
+                        help='Delta encoding of traces [default: from setup.ini]')
+    parser.add_argument('--setup_file', type = str,
+                        help = 'Setup file [default: pytesdaq/config/setup.ini]')
+    parser.add_argument('--overwrite', action="store_true", help='Overwrite existing files')
+    args = parser.parse_args()
+
+
+    if not args.input_path or not args.output_path:
+        print('ERROR: Input and output path required! Type "python pack_hdf5.py --help"')
+        exit(1)
+
+    # input files
+    if os.path.isdir(args.input_path):
+        file_list = sorted(glob(os.path.join(args.input_path, '*.hdf5')))
+    elif os.path.isfile(args.input_path):
+        file_list = [args.input_path]
+    else:
+        print('ERROR: Input "' + args.input_path + '" not found!')
+        exit(1)
+
+    if not file_list:
+        print('ERROR: No HDF5 files found in "' + args.input_path + '"!')
+        exit(1)
+        
+    # compression (setup.ini if not provided)
+    config = settings.Config(setup_file=args.setup_file)
+    compression = config.get_hdf5_compression()
+    if args.compression:
+        compression['compression'] = args.compression
+        compression['compression_level'] = args.compression_level
+        compression['shuffle'] = args.shuffle
+        compression['delta'] = args.delta
+    else:
+        if args.compression_level is not None:
+            compression['compression_level'] = args.compression_level
+        if args.shuffle:
+            compression['shuffle'] = True
+        if args.delta:
+            compression['delta'] = True
+    
+    # output directory
+    if not os.path.isdir(args.output_path):
+        os.makedirs(args.output_path)
+
+        
+    # ========================
+    # Convert
+    # ========================
+    for file_name in file_list:
+
+        output_file = os.path.join(args.output_path, os.path.basename(file_name))
+        if os.path.abspath(output_file)==os.path.abspath(file_name):
+            print('ERROR: Output file identical to input file (' + file_name + ')!')
+            exit(1)
+        if os.path.isfile(output_file) and not args.overwrite:
+            print('WARNING: ' + output_file + ' already exists. Skipping!')
+            continue
+
+        nb_events = hdf5.convert_to_packed(file_name, output_file,
+                                           chunk_size=args.chunk_size*1e6,
+                                           **compression)
+
+        print('INFO: ' + os.path.basename(file_name) + ' converted ('
+              + ', '.join([adc + ': ' + str(nb) + ' events' for adc,nb in nb_events.items()])
+              + ')')
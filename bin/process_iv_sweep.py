@@ -0,0 +1,50 @@
+import argparse
+from pytesdaq.analyzer import iv_sweep
+import os
+
+if __name__ == "__main__":
+
+
+    # ========================
+    # Input arguments
+    # ========================
+    parser = argparse.ArgumentParser(description='Calculate IV curves (offsets/noise vs TES bias) from sequencer directory')
+    parser.add_argument('--data_path', type = str,
+                        help = 'IV sequencer directory')
+    parser.add_argument('--data_prefix', type = str, default='iv',
+                        help = 'File prefix [default: iv]')
+    parser.add_argument('--output_file', type = str,
+                        help = 'Result file name [default: [data_path]/iv_sweep_[adc_name].h5]')
+    parser.add_argument('--adc_name', type = str, default='adc1',
+                        help = 'ADC name [default: adc1]')
+    parser.add_argument('--detector_chans', type = str,
+                        help = 'Comma separated detector channels [default: all]')
+    parser.add_argument('--nevents', type = int, default=0,
+                        help = 'Maximum number of events per file [default: all]')
+    parser.add_argument('--batch_size', type = int, default=100,
+                        help = 'Number of events read at once [default: 100]')
+    parser.add_argument('--n_workers', type = int, default=1,
+                        help = 'Number of processes [default: 1]')
+    args = parser.parse_args()
+
+
+    if not args.data_path:
+        print('ERROR: Data directory required! Type "python process_iv_sweep.py --help"')
+        exit(1)
+
+    if not os.path.isdir(args.data_path):
+        print('ERROR: Data directory "' + args.data_path + '" not found!')
+        exit(1)
+
+    detector_chans = None
+    if args.detector_chans:
+        detector_chans = [chan.strip() for chan in args.detector_chans.split(',')]
+
+        
+    # ========================
+    # Process
+    # ========================
+    iv_sweep.process_iv_sweep(args.data_path, data_prefix=args.data_prefix,
+                              adc_name=args.adc_name, detector_chans=detector_chans,
+                              nevents=args.nevents, batch_size=args.batch_size,
+                              n_workers=args.n_workers, output_file=args.output_file)
@@ -0,0 +1,52 @@
+import argparse
+from pytesdaq.analyzer import noise
+import os
+
+if __name__ == "__main__":
+
+
+    # ========================
+    # Input arguments
+    # ========================
+    parser = argparse.ArgumentParser(description='Calculate run-level noise summary (average PSD, CSD, RMS)')
+    parser.add_argument('--input_path', type = str, nargs='+',
+                        help = 'Run directory(ies) or file(s)')
+    parser.add_argument('--output_file', type = str,
+                        help = 'Summary file name [default: [run_dir]/noise_summary_[adc_name].h5]')
+    parser.add_argument('--adc_name', type = str, default='adc1',
+                        help = 'ADC name [default: adc1]')
+    parser.add_argument('--detector_chans', type = str,
+                        help = 'Comma separated detector channels [default: all]')
+    parser.add_argument('--nevents', type = int, default=0,
+                        help = 'Maximum number of events [default: all]')
+    parser.add_argument('--batch_size', type = int, default=100,
+                        help = 'Number of events read at once [default: 100]')
+    parser.add_argument('--n_workers', type = int, default=1,
+                        help = 'Number of processes [default: 1]')
+    parser.add_argument('--adc', action="store_true", help='Keep ADC units (no conversion to volt)')
+    parser.add_argument('--no_csd', action="store_true", help='Do not calculate CSD')
+    args = parser.parse_args()
+
+
+    if not args.input_path:
+        print('ERROR: Input path required! Type "python process_noise.py --help"')
+        exit(1)
+
+    for input_path in args.input_path:
+        if not os.path.exists(input_path):
+            print('ERROR: Input path "' + input_path + '" not found!')
+            exit(1)
+
+    detector_chans = None
+    if args.detector_chans:
+        detector_chans = [chan.strip() for chan in args.detector_chans.split(',')]
+
+        
+    # ========================
+    # Process
+    # ========================
+    noise.process_noise(args.input_path, adc_name=args.adc_name,
+                        detector_chans=detector_chans, nevents=args.nevents,
+                        adctovolt=not args.adc, batch_size=args.batch_size,
+                        calc_csd=not args.no_csd, n_workers=args.n_workers,
+                        output_file=args.output_file)
@@ -0,0 +1,117 @@
+import argparse
+import numpy as np
+from pytesdaq.analyzer import retrigger
+import os
+
+
+
+def load_array(file_name):
+    """
+    Load 1D array from .npy or text file
+    """
+    if file_name.endswith('.npy'):
+        return np.load(file_name)
+    return np.loadtxt(file_name)
+
+
+
+if __name__ == "__main__":
+
+
+    # ========================
+    # Input arguments
+    # ========================
+    parser = argparse.ArgumentParser(description='Re-trigger continuous run (threshold, '
+                                     'matched filter, randoms)')
+    parser.add_argument('--input_path', type = str, nargs='+',
+                        help = 'Continuous run directory(ies) or file(s)')
+    parser.add_argument('--output_path', type = str,
+                        help = 'Output directory for triggered events')
+    parser.add_argument('--adc_name', type = str, default='adc1',
+                        help = 'ADC name [default: adc1]')
+    parser.add_argument('--trace_length', type = int,
+                        help = 'Triggered event length [samples]')
+    parser.add_argument('--pretrigger_length', type = int,
+                        help = 'Samples before trigger [default: trace length/2]')
+    parser.add_argument('--threshold', type = str,
+                        help = 'Threshold: single value or comma separated "chan:value" '
+                        '(negative = falling edge), ADC units or template amplitude')
+    parser.add_argument('--template_file', type = str,
+                        help = 'Matched filter template (.npy or text file)')
+    parser.add_argument('--psd_file', type = str,
+                        help = 'Noise PSD at template rfft frequencies (.npy or text file) '
+                        '[default: white noise]')
+    parser.add_argument('--trigger_offset', type = int,
+                        help = 'Template sample of trigger time [default: template maximum]')
+    parser.add_argument('--lowpass', type = float,
+                        help = 'Butterworth low pass cutoff [Hz] (no template)')
+    parser.add_argument('--highpass', type = float,
+                        help = 'Butterworth high pass cutoff [Hz] (no template)')
+    parser.add_argument('--holdoff', type = int,
+                        help = 'Threshold trigger holdoff [samples, default: post-trigger length]')
+    parser.add_argument('--random_rate', type = float, default=0,
+                        help = 'Random trigger rate [Hz] [default: 0 = no randoms]')
+    parser.add_argument('--data_prefix', type = str, default='trig',
+                        help = 'Output file prefix [default: trig]')
+    parser.add_argument('--compression', type = str,
+                        help = 'Output compression (e.g. "gzip", "lzf", "zstd") [default: none]')
+    parser.add_argument('--packed', action="store_true",
+                        help='Output packed [event, chan, sample] layout')
+    parser.add_argument('--batch_size', type = int, default=100,
+                        help = 'Number of events read at once [default: 100]')
+    parser.add_argument('--n_workers', type = int, default=1,
+                        help = 'Number of processes [default: 1]')
+    args = parser.parse_args()
+
+
+    if not args.input_path or not args.output_path or not args.trace_length:
+        print('ERROR: Input path, output path and trace length required! '
+              'Type "python retrigger.py --help"')
+        exit(1)
+
+    for input_path in args.input_path:
+        if not os.path.exists(input_path):
+            print('ERROR: Input path "' + input_path + '" not found!')
+            exit(1)
+
+    if not args.threshold and not args.random_rate:
+        print('ERROR: Threshold and/or random rate required!')
+        exit(1)
+
+    # threshold: single value or {channel: value}
+    threshold = None
+    if args.threshold:
+        if ':' in args.threshold:
+            threshold = dict()
+            for item in args.threshold.split(','):
+                chan, value = item.split(':')
+                threshold[chan.strip()] = float(value)
+        else:
+            threshold = float(args.threshold)
+
+    # matched filter
+    template = None
+    psd = None
+    if args.template_file:
+        template = load_array(args.template_file)
+        if args.psd_file:
+            psd = load_array(args.psd_file)
+
+    # compression
+    compression = None
+    if args.compression or args.packed:
+        compression = {'compression': args.compression, 'packed': args.packed}
+
+
+    # ========================
+    # Process
+    # ========================
+    retrigger.retrigger_run(args.input_path, args.output_path, args.trace_length,
+                            pretrigger_length=args.pretrigger_length,
+                            adc_name=args.adc_name, threshold=threshold,
+                            template=template, psd=psd,
+                            trigger_offset=args.trigger_offset,
+                            lowpass_freq=args.lowpass, highpass_freq=args.highpass,
+                            holdoff=args.holdoff, random_rate=args.random_rate,
+                            data_prefix=args.data_prefix, batch_size=args.batch_size,
+                            compression=compression, n_workers=args.n_workers)
@@ -1,5 +1,6 @@
 import argparse
 import pytesdaq.daq as daq
+from pytesdaq.daq.trigger import SoftwareTrigger
 import pytesdaq.config.settings as settings
 import pytesdaq.instruments.control as instrument
 from pytesdaq.utils import  arg_utils
@@ -36,6 +37,21 @@ if __name__ == "__main__":
     parser.add_argument('--channels', type = str,
                         help='Channels number (same all devices!):  string "a,b,c-d" [default from configuration setup file] ')
     parser.add_argument('--devices',help='ADC Devices number: string "a,b,c-d" [default from configuration setup file] ')
+
+    # software trigger (trigger type 3/4, "pydaqmx" driver)
+    parser.add_argument('--trace_length', type=int,
+                        help='Triggered event length [default: nb samples]')
+    parser.add_argument('--pretrigger_length', type=int,
+                        help='Samples before trigger [default: trace length/2]')
+    parser.add_argument('--threshold', type=str,
+                        help='Threshold(s) [ADC] for trigger type 4: single value or one per channel '
+                        '"a,b,None,..." (negative = falling edge)')
+    parser.add_argument('--holdoff', type=int,
+                        help='Threshold trigger holdoff [samples, default: post-trigger length]')
+    parser.add_argument('--trigger_lowpass', type=float,
+                        help='Threshold trigger low pass filter cutoff [Hz, default: no filter]')
+    parser.add_argument('--random_rate', type=float,
+                        help='Random trigger rate [Hz] (trigger type 3) [default: 1 Hz]')
  
     args = parser.parse_args()
 
@@ -169,6 +185,32 @@ if __name__ == "__main__":
     if det_config:
         mydaq.set_detector_config(det_config)
 
+    # software trigger
+    config = adc_config[adc_list[0]]
+    if config['trigger_type'] in [3,4] and daq_driver=='pydaqmx':
+        trace_length = config['nb_samples']
+        if args.trace_length:
+            trace_length = args.trace_length
+        trigger = SoftwareTrigger(len(config['channel_list']), config['sample_rate'],
+                                  trace_length, pretrigger_length=args.pretrigger_length)
+        if config['trigger_type']==4:
+            if not args.threshold:
+                print('ERROR: Threshold required for trigger type 4!')
+                exit()
+            threshold = [None if val.strip()=='None' else float(val)
+                         for val in args.threshold.split(',')]
+            if len(threshold)==1:
+                threshold = threshold[0]
+            trigger.set_threshold(threshold, holdoff=args.holdoff)
+            if args.trigger_lowpass:
+                trigger.set_filter(lowpass_freq=args.trigger_lowpass)
+        else:
+            random_rate = 1
+            if args.random_rate:
+                random_rate = args.random_rate
+            trigger.set_random_rate(random_rate)
+        mydaq.set_trigger(trigger)
+
     # run
     for irun in range(nb_runs):
         success = mydaq.run(run_time_seconds, run_type, run_comment)
@@ -0,0 +1,36 @@
+import argparse
+from pytesdaq.io.catalog import RunCatalog
+import os
+
+if __name__ == "__main__":
+
+
+    # ========================
+    # Input arguments
+    # ========================
+    parser = argparse.ArgumentParser(description='Build/update HDF5 run catalog')
+    parser.add_argument('--data_path', type = str,
+                        help = 'Data directory')
+    parser.add_argument('--catalog_file', type = str,
+                        help = 'Catalog file name (full path) [default: [data_path]/pytesdaq_catalog.db]')
+    parser.add_argument('--recursive', action="store_true", help='Include sub-directories')
+    parser.add_argument('--force', action="store_true", help='Rescan all files')
+    args = parser.parse_args()
+
+
+    if not args.data_path:
+        print('ERROR: Data directory required! Type "python update_catalog.py --help"')
+        exit(1)
+
+    if not os.path.isdir(args.data_path):
+        print('ERROR: Data directory "' + args.data_path + '" not found!')
+        exit(1)
+
+        
+    # ========================
+    # Update catalog
+    # ========================
+    catalog = RunCatalog(args.data_path, catalog_file=args.catalog_file,
+                         recursive=args.recursive)
+    catalog.update(force=args.force)
+    catalog.close()
@@ -1,6 +1,8 @@
 import time
 import numpy as np
 import qetpy as qp
+from pytesdaq.utils import calibration_utils
+from pytesdaq.analyzer import noise
 
 
 class Analyzer:
@@ -162,30 +164,25 @@ class Analyzer:
             return data_array
         
         
-        # intialize output
-        data_array_norm = np.zeros_like(data_array, dtype=np.float64)
-        
-        # loop and normalize
-        nb_channels = np.size(data_array,0)
-        for ichan in range(0,nb_channels):
-            chan_index = adc_config['selected_channel_index'][ichan]
-            cal_coeff = adc_config['adc_conversion_factor'][chan_index][::-1]
-            poly = np.poly1d(cal_coeff)
-            data_array_norm[ichan,:] = poly(data_array[ichan,:])
+        # convert to volt (all channels at once)
+        coeffs = calibration_utils.get_calibration_coeffs(
+            adc_config['adc_conversion_factor'],
+            adc_config['selected_channel_index'])
+        data_array_norm = calibration_utils.adc_to_volt(data_array, coeffs)
             
-            # normalize
-            if norm_list is not None:
-                data_array_norm[ichan,:] /= norm_list[ichan]
+        # normalize
+        if norm_list is not None:
+            data_array_norm /= np.asarray(norm_list, dtype=np.float64).reshape(-1,1)
                 
-            # unit
-            if unit=='mVolts':
-                data_array_norm[ichan,:] *= 1000
-            elif unit=='nVolts':
-                data_array_norm[ichan,:] *= 1e9
-            elif unit=='uAmps':
-                data_array_norm[ichan,:] *= 1e6
-            elif unit=='pAmps':
-                data_array_norm[ichan,:] *= 1e12
+        # unit
+        if unit=='mVolts':
+            data_array_norm *= 1000
+        elif unit=='nVolts':
+            data_array_norm *= 1e9
+        elif unit=='uAmps':
+            data_array_norm *= 1e6
+        elif unit=='pAmps':
+            data_array_norm *= 1e12
             
         
         return data_array_norm
@@ -202,24 +199,10 @@ class Analyzer:
         calculate PSD
         """
         
-        # initialize
-        psd_array = None
-        freq_array = None
-
-               
-        # loop channel and calculate psd
-        nb_channels = np.size(data_array,0)
-        for ichan in range(0,nb_channels):
-            trace_chan = data_array[ichan,:]
-            f_fold, psd_fold  = qp.calc_psd(trace_chan, fs=sample_rate,
-                                            folded_over=True)
-            if ichan==0:
-                psd_array = np.zeros((nb_channels,len(psd_fold)),
-                                     dtype=np.float64)
-                psd_array[ichan,:] =  psd_fold
-                self._freq_array = f_fold
-            else:
-                psd_array[ichan,:] =  psd_fold
+        # one-sided PSD, all channels at once
+        # (same as qetpy calc_psd with folded_over=True)
+        self._freq_array, psd_array = noise.calc_psd(
+            np.asarray(data_array, dtype=np.float64), sample_rate)
            
         return psd_array
 
@@ -0,0 +1,263 @@
+"""
+Offline IV sweep processing: TES baseline offsets and noise
+for each bias point of an IV/dIdV sequencer directory
+"""
+
+import os
+import re
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+import pytesdaq.io.hdf5 as hdf5
+from pytesdaq.analyzer import noise
+
+
+
+def find_iv_series(data_path, data_prefix='iv', adc_name='adc1', detector_chans=None):
+    """
+    Find IV series (one series = one TES bias point) in sequencer
+    directory and get bias, temperature and normalization of each
+    series from file metadata
+
+    Args:
+      data_path: string
+         sequencer directory (see Sequencer._create_directory)
+
+      data_prefix: string
+         file prefix (default: 'iv')
+
+      adc_name: string
+         ADC id (default: 'adc1')
+
+      detector_chans: list of string (optional)
+         detector channel names (default: all channels)
+
+    Return:
+      series_list: list of dict (sorted by temperature, bias)
+    """
+
+    file_list = sorted(_find_files(data_path, data_prefix))
+    if not file_list:
+        raise ValueError('No "' + data_prefix + '" files found in ' + data_path + '!')
+
+    # group files by series
+    reader = hdf5.H5Reader(verbose=False)
+    series_dict = dict()
+    for file_name in file_list:
+        metadata = reader.get_metadata(file_name)
+        if adc_name not in metadata.get('adc_list', list()):
+            continue
+        series = None
+        if 'series_num' in metadata:
+            series = str(metadata['series_num'])
+        else:
+            match = re.search(r'_(I\d+_D\d+_T\d+)_F\d+', os.path.basename(file_name))
+            if match is not None:
+                series = match.group(1)
+        if series is None:
+            series = os.path.basename(file_name)
+        if series not in series_dict:
+            series_dict[series] = {'series': series, 'file_list': list(),
+                                   'metadata': metadata}
+        series_dict[series]['file_list'].append(file_name)
+
+    # series bias/temperature/norm
+    series_list = list()
+    for series, series_info in series_dict.items():
+
+        metadata = series_info.pop('metadata')
+        comment = str(metadata.get('comment', ''))
+        adc_metadata = metadata['groups'][adc_name]
+
+        # channels
+        connections = reader.get_connection_dict(adc_name=adc_name, metadata=metadata)
+        file_info = {'adc_metadata': adc_metadata, 'connections': connections}
+        chan_names = noise.get_channel_names(file_info, range(int(adc_metadata['nb_channels'])))
+        if detector_chans is not None:
+            chan_names = [chan for chan in chan_names if chan in detector_chans]
+            if not chan_names:
+                raise ValueError('Unable to find selected channel(s) in series ' + series + '!')
+
+        # detector config
+        detector_config = dict()
+        if ('detconfig' + adc_name[3:]) in metadata.get('group_list', list()):
+            detector_config = reader.get_detector_config(adc_name=adc_name, metadata=metadata)
+
+        # bias from comment (uA, all channels)
+        comment_bias = np.nan
+        match = re.search(r'TES bias\s*=\s*([-+]?[\d.]+(?:[eE][-+]?\d+)?)\s*uA', comment)
+        if match is not None:
+            comment_bias = float(match.group(1))*1e-6
+
+        # temperature from comment (mK)
+        temperature = np.nan
+        match = re.search(r'T\s*=\s*([-+]?[\d.]+(?:[eE][-+]?\d+)?)\s*mK', comment)
+        if match is not None:
+            temperature = float(match.group(1))
+
+        # per channel bias (detector config read back [A],
+        # run comment otherwise) and volt->amps norm
+        tes_bias = list()
+        norm = list()
+        for chan in chan_names:
+            settings = detector_config.get(chan, dict())
+            bias = settings.get('tes_bias', np.nan)
+            # missing: -999999 uA stored as -0.999999 A (control.read_all)
+            if bias is None or not np.isfinite(float(bias)) or float(bias)<=-0.999999:
+                bias = comment_bias
+            tes_bias.append(float(bias))
+            norm.append(float(settings.get('close_loop_norm', np.nan)))
+
+        if np.all(np.isnan(tes_bias)):
+            print('WARNING: No TES bias found for series ' + series + ', skipping!')
+            continue
+
+        series_info['channels'] = chan_names
+        series_info['tes_bias'] = np.asarray(tes_bias)
+        series_info['close_loop_norm'] = np.asarray(norm)
+        series_info['temperature'] = temperature
+        series_info['sample_rate'] = float(adc_metadata['sample_rate'])
+        series_list.append(series_info)
+
+    # sort: temperature then bias (decreasing, sweep order)
+    series_list.sort(key=lambda info: (np.nan_to_num(info['temperature']),
+                                       -np.nanmean(info['tes_bias'])))
+
+    return series_list
+
+
+
+def process_iv_sweep(data_path, data_prefix='iv', adc_name='adc1', detector_chans=None,
+                     nevents=0, batch_size=100, n_workers=1, output_file=None,
+                     verbose=True):
+    """
+    Calculate IV curves from IV sequencer directory: for each
+    bias point, baseline offset and noise of each channel converted
+    to TES current using detector config "close_loop_norm" stored
+    in files. Files of all bias points are processed in parallel.
+
+    Args:
+      data_path: string
+         sequencer directory
+
+      data_prefix: string
+         file prefix (default: 'iv')
+
+      adc_name: string
+         ADC id (default: 'adc1')
+
+      detector_chans: string or list of string (optional)
+         detector channel names (default: all channels)
+
+      nevents: integer
+         maximum number of events per file (default: 0 = all)
+
+      batch_size: integer
+         number of events read at once (default: 100)
+
+      n_workers: integer
+         number of processes (default: 1)
+
+      output_file: string (optional)
+         result file name. If None: "iv_sweep_[adc_name].h5" in
+         data_path. If False: not saved
+
+    Return:
+      iv_dict: dict, arrays [bias point, chan] (PSD [bias point, chan, freq])
+         'tes_bias' [A], 'offset' [A], 'offset_err' [A], 'noise_rms' [A],
+         'psd' [A^2/Hz], 'freq', 'temperature' [mK] ([bias point]),
+         'nb_events' ([bias point]), 'channels', 'series'
+    """
+
+    if detector_chans is not None and not isinstance(detector_chans, list):
+        detector_chans = [detector_chans]
+
+    series_list = find_iv_series(data_path, data_prefix=data_prefix, adc_name=adc_name,
+                                 detector_chans=detector_chans)
+    if not series_list:
+        raise ValueError('No IV series found in ' + data_path + '!')
+
+    chan_names = series_list[0]['channels']
+    for series_info in series_list:
+        if series_info['channels']!=chan_names:
+            raise ValueError('Inconsistent channels between series!')
+        if np.any(np.isnan(series_info['close_loop_norm'])):
+            raise ValueError('Detector config "close_loop_norm" not available for series '
+                             + series_info['series'] + '!')
+
+    # ---------------------
+    # Noise statistics (all
+    # files in parallel)
+    # ---------------------
+    task_list = list()
+    series_indices = list()
+    for iseries, series_info in enumerate(series_list):
+        for file_name in series_info['file_list']:
+            task_list.append((file_name, nevents, adc_name, detector_chans, True,
+                              batch_size, series_info['sample_rate'], False))
+            series_indices.append(iseries)
+
+    if verbose:
+        print('INFO: Processing ' + str(len(series_list)) + ' bias point(s), '
+              + str(len(task_list)) + ' file(s)')
+
+    stats_list = [None]*len(series_list)
+    if n_workers>1 and len(task_list)>1:
+        with ProcessPoolExecutor(max_workers=min(n_workers, len(task_list))) as executor:
+            file_stats_list = list(executor.map(noise.process_noise_file,
+                                                *zip(*task_list)))
+    else:
+        file_stats_list = [noise.process_noise_file(*task) for task in task_list]
+
+    for iseries, file_stats in zip(series_indices, file_stats_list):
+        if file_stats is None:
+            continue
+        if stats_list[iseries] is None:
+            stats_list[iseries] = file_stats
+        else:
+            stats_list[iseries].merge(file_stats)
+
+    # ---------------------
+    # IV curves (volts ->
+    # TES current)
+    # ---------------------
+    series_list = [info for info, stats in zip(series_list, stats_list) if stats is not None]
+    stats_list = [stats for stats in stats_list if stats is not None]
+
+    norm = np.array([info['close_loop_norm'] for info in series_list])
+    nb_events = np.array([stats.nb_events for stats in stats_list])
+    summary_list = [stats.get_summary() for stats in stats_list]
+
+    iv_dict = dict()
+    iv_dict['channels'] = chan_names
+    iv_dict['series'] = [info['series'] for info in series_list]
+    iv_dict['adc_name'] = adc_name
+    iv_dict['temperature'] = np.array([info['temperature'] for info in series_list])
+    iv_dict['nb_events'] = nb_events
+    iv_dict['tes_bias'] = np.array([info['tes_bias'] for info in series_list])
+    iv_dict['offset'] = np.array([summary['baseline_mean'] for summary in summary_list])/norm
+    iv_dict['offset_err'] = (np.array([summary['baseline_std'] for summary in summary_list])
+                             /np.sqrt(nb_events)[:,np.newaxis]/norm)
+    iv_dict['noise_rms'] = np.array([summary['rms_mean'] for summary in summary_list])/norm
+    if len(set(len(summary['freq']) for summary in summary_list))==1:
+        iv_dict['freq'] = summary_list[0]['freq']
+        iv_dict['psd'] = (np.array([summary['psd'] for summary in summary_list])
+                          /norm[:,:,np.newaxis]**2)
+
+    if output_file is None:
+        output_file = os.path.join(os.path.abspath(data_path),
+                                   'iv_sweep_' + adc_name + '.h5')
+    if output_file:
+        noise.write_noise_summary(iv_dict, output_file)
+        if verbose:
+            print('INFO: IV sweep results saved in ' + output_file)
+
+    return iv_dict
+
+
+
+def _find_files(data_path, data_prefix='iv'):
+    """
+    Get HDF5 files with prefix in directory
+    """
+    return [os.path.join(data_path, file_name) for file_name in os.listdir(data_path)
+            if file_name.startswith(data_prefix) and file_name.endswith('.hdf5')]
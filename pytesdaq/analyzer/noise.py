@@ -0,0 +1,462 @@
+"""
+Run-level noise summary: streaming average PSD/CSD and RMS over
+all events of one or several runs (bounded memory, parallel over files)
+"""
+
+import os
+import h5py
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+import pytesdaq.io.hdf5 as hdf5
+
+
+
+class NoiseStats:
+    """
+    Online (Welford) per-channel statistics of noise traces:
+    mean/variance of PSD and of event RMS/baseline, mean CSD.
+    Batches of events are accumulated with the parallel version
+    of Welford algorithm, so that statistics of different files
+    can be merged (see merge).
+
+    PSD calculated with calc_psd (also used by Analyzer.calc_psd):
+    one-sided PSD [unit^2/Hz]
+    """
+
+    def __init__(self, nb_channels, nb_samples, sample_rate, calc_csd=True):
+        """
+        Args:
+          nb_channels: integer
+          nb_samples: integer
+          sample_rate: float
+          calc_csd: bool
+             accumulate cross spectral density (default: True)
+        """
+
+        self._nb_channels = int(nb_channels)
+        self._nb_samples = int(nb_samples)
+        self._sample_rate = float(sample_rate)
+        self._calc_csd = calc_csd
+
+        # frequencies and one-sided PSD factor (CSD)
+        self._freq_array = np.fft.rfftfreq(self._nb_samples, d=1.0/self._sample_rate)
+        self._psd_factor = _get_psd_factor(self._nb_samples, self._sample_rate)
+
+        # running statistics
+        nb_freqs = len(self._freq_array)
+        self._nb_events = 0
+        self._psd_mean = np.zeros((self._nb_channels, nb_freqs), dtype=np.float64)
+        self._psd_m2 = np.zeros((self._nb_channels, nb_freqs), dtype=np.float64)
+        self._rms_mean = np.zeros(self._nb_channels, dtype=np.float64)
+        self._rms_m2 = np.zeros(self._nb_channels, dtype=np.float64)
+        self._baseline_mean = np.zeros(self._nb_channels, dtype=np.float64)
+        self._baseline_m2 = np.zeros(self._nb_channels, dtype=np.float64)
+        self._csd_mean = None
+        if self._calc_csd:
+            self._csd_mean = np.zeros((self._nb_channels, self._nb_channels, nb_freqs),
+                                      dtype=np.complex128)
+
+
+
+    @property
+    def nb_events(self):
+        return self._nb_events
+
+    @property
+    def freq_array(self):
+        return self._freq_array
+
+    @property
+    def psd(self):
+        return self._psd_mean
+
+    @property
+    def csd(self):
+        return self._csd_mean
+
+    @property
+    def psd_std(self):
+        return np.sqrt(self._get_variance(self._psd_m2))
+
+
+
+    def update(self, data_array):
+        """
+        Add batch of events
+
+        Args:
+          data_array: 3D array [event, chan, sample]
+             (2D array [chan, sample] for a single event)
+        """
+
+        data_array = np.asarray(data_array)
+        if data_array.ndim==2:
+            data_array = data_array[np.newaxis,:,:]
+        nb_events = data_array.shape[0]
+        if nb_events==0:
+            return
+        if data_array.shape[1:]!=(self._nb_channels, self._nb_samples):
+            raise ValueError('Unexpected data shape ' + str(data_array.shape[1:]) + ', expected '
+                             + str((self._nb_channels, self._nb_samples)) + '!')
+
+        # baseline/RMS
+        baseline = np.mean(data_array, axis=2, dtype=np.float64)
+        rms = np.std(data_array, axis=2, dtype=np.float64)
+
+        # PSD (one FFT per trace, vectorized over batch)
+        fft_array = np.fft.rfft(data_array, axis=2)
+        psd = calc_psd(data_array, self._sample_rate, fft_array=fft_array)[1]
+
+        # CSD batch mean
+        csd_mean = None
+        if self._calc_csd:
+            csd_mean = np.einsum('eif,ejf->ijf', fft_array, np.conj(fft_array))
+            csd_mean *= self._psd_factor/nb_events
+
+        self._merge_batch(nb_events,
+                          (np.mean(psd, axis=0), _sum_squares(psd)),
+                          (np.mean(rms, axis=0), _sum_squares(rms)),
+                          (np.mean(baseline, axis=0), _sum_squares(baseline)),
+                          csd_mean)
+
+
+
+    def merge(self, other):
+        """
+        Merge statistics from another NoiseStats object
+        (e.g. different file)
+        """
+
+        if other is None or other.nb_events==0:
+            return
+        if (other._nb_channels!=self._nb_channels or other._nb_samples!=self._nb_samples
+            or other._sample_rate!=self._sample_rate):
+            raise ValueError('Unable to merge noise statistics with different '
+                             'number of channels/samples or sample rate!')
+
+        self._merge_batch(other._nb_events,
+                          (other._psd_mean, other._psd_m2),
+                          (other._rms_mean, other._rms_m2),
+                          (other._baseline_mean, other._baseline_m2),
+                          other._csd_mean if self._calc_csd else None)
+
+
+
+    def get_summary(self):
+        """
+        Get summary dictionary (see write_noise_summary)
+        """
+
+        summary = dict()
+        summary['nb_events'] = self._nb_events
+        summary['sample_rate'] = self._sample_rate
+        summary['nb_samples'] = self._nb_samples
+        summary['freq'] = self._freq_array
+        summary['psd'] = self._psd_mean
+        summary['psd_std'] = self.psd_std
+        summary['rms_mean'] = self._rms_mean
+        summary['rms_std'] = np.sqrt(self._get_variance(self._rms_m2))
+        summary['baseline_mean'] = self._baseline_mean
+        summary['baseline_std'] = np.sqrt(self._get_variance(self._baseline_m2))
+        if self._calc_csd:
+            summary['csd'] = self._csd_mean
+
+        return summary
+
+
+
+    def _merge_batch(self, nb_events, psd_stats, rms_stats, baseline_stats, csd_mean):
+        """
+        Combine running statistics with batch statistics
+        (Chan et al. parallel algorithm)
+        """
+
+        nb_events_tot = self._nb_events + nb_events
+        weight = nb_events/nb_events_tot
+        weight_m2 = self._nb_events*nb_events/nb_events_tot
+
+        for mean, m2, stats in [(self._psd_mean, self._psd_m2, psd_stats),
+                                (self._rms_mean, self._rms_m2, rms_stats),
+                                (self._baseline_mean, self._baseline_m2, baseline_stats)]:
+            delta = stats[0] - mean
+            mean += delta*weight
+            m2 += stats[1] + delta**2*weight_m2
+
+        if csd_mean is not None:
+            self._csd_mean += (csd_mean-self._csd_mean)*weight
+
+        self._nb_events = nb_events_tot
+
+
+
+    def _get_variance(self, m2):
+        if self._nb_events<2:
+            return np.zeros_like(m2)
+        return m2/(self._nb_events-1)
+
+
+
+
+def calc_psd(data_array, sample_rate, fft_array=None):
+    """
+    One-sided (folded) PSD along last axis, vectorized over
+    other axes (same as qetpy calc_psd with folded_over=True
+    for each trace)
+
+    Args:
+      data_array: array [..., sample]
+      sample_rate: float
+      fft_array: (optional) rfft of data_array along last
+         axis, if already calculated
+
+    Return:
+      freq_array: 1D array
+      psd_array: array [..., freq] [unit^2/Hz]
+    """
+
+    nb_samples = np.shape(data_array)[-1]
+    if fft_array is None:
+        fft_array = np.fft.rfft(data_array, axis=-1)
+
+    freq_array = np.fft.rfftfreq(nb_samples, d=1.0/sample_rate)
+    psd_array = ((fft_array.real**2 + fft_array.imag**2)
+                 *_get_psd_factor(nb_samples, sample_rate))
+
+    return freq_array, psd_array
+
+
+
+
+def process_noise(filepath, adc_name='adc1', detector_chans=None, nevents=0,
+                  adctovolt=True, batch_size=100, calc_csd=True, n_workers=1,
+                  output_file=None, verbose=True):
+    """
+    Stream all events of run(s) in batches and calculate run-level
+    noise summary (mean PSD, CSD, RMS). Summary is saved next
+    to the run (see output_file)
+
+    Args:
+      filepath: string or list
+         file/path or list of files/paths
+
+      adc_name: string
+         ADC id (default: 'adc1')
+
+      detector_chans: string/int or list of string/int (optional)
+         detector channel names (default: all channels)
+
+      nevents: integer
+         maximum number of events (default: 0 = all events)
+
+      adctovolt: bool
+         convert ADC to volt (default: True)
+
+      batch_size: integer
+         number of events read at once (default: 100)
+
+      calc_csd: bool
+         calculate cross spectral density (default: True)
+
+      n_workers: integer
+         number of processes, files are processed in parallel
+         (default: 1)
+
+      output_file: string (optional)
+         summary file name. If None: "noise_summary_[adc_name].h5"
+         in the directory of first file (".h5" so that it is not 
+         included in raw data file list). If False: not saved
+
+    Return:
+      summary: dict
+    """
+
+    # ---------------------
+    # Files
+    # ---------------------
+    if isinstance(filepath, str):
+        filepath = [filepath]
+    reader = hdf5.H5Reader(verbose=False)
+    reader.set_files(filepath)
+    file_list = list(reader._file_list)
+    if not file_list:
+        raise ValueError('No file found!')
+
+    if detector_chans is not None and not isinstance(detector_chans, list):
+        detector_chans = [detector_chans]
+
+    read_info = reader._get_read_info(adc_name=adc_name, detector_chans=detector_chans,
+                                      nevents=nevents)
+    file_info_list = read_info['file_info_list']
+
+    # channels and sample rate
+    adc_metadata = file_info_list[0]['adc_metadata']
+    sample_rate = float(adc_metadata['sample_rate'])
+    chan_names = get_channel_names(file_info_list[0], read_info['array_indices'])
+    for file_info in file_info_list:
+        if float(file_info['adc_metadata']['sample_rate'])!=sample_rate:
+            raise ValueError('Unable to process files with different sample rate!')
+
+    # number of events per file
+    task_list = list()
+    nb_events_left = read_info['nb_events']
+    for file_info in file_info_list:
+        nb_events_file = min(file_info['nb_events'], nb_events_left)
+        nb_events_left -= nb_events_file
+        if nb_events_file>0:
+            task_list.append((file_info['file_name'], nb_events_file, adc_name,
+                              detector_chans, adctovolt, batch_size, sample_rate,
+                              calc_csd))
+
+    if verbose:
+        print('INFO: Processing ' + str(read_info['nb_events']) + ' events from '
+              + str(len(task_list)) + ' file(s)')
+
+    # ---------------------
+    # Accumulate
+    # ---------------------
+    noise_stats = NoiseStats(read_info['nb_channels'], read_info['nb_samples'],
+                             sample_rate, calc_csd=calc_csd)
+
+    if n_workers>1 and len(task_list)>1:
+        with ProcessPoolExecutor(max_workers=min(n_workers, len(task_list))) as executor:
+            for file_stats in executor.map(_process_file_worker, task_list):
+                noise_stats.merge(file_stats)
+    else:
+        for task in task_list:
+            noise_stats.merge(_process_file_worker(task))
+
+    # ---------------------
+    # Summary
+    # ---------------------
+    summary = noise_stats.get_summary()
+    summary['channels'] = chan_names
+    summary['adc_name'] = adc_name
+    summary['unit'] = 'Volts' if adctovolt else 'ADC'
+    summary['file_list'] = [task[0] for task in task_list]
+
+    if output_file is None:
+        output_file = os.path.join(os.path.dirname(os.path.abspath(file_list[0])),
+                                   'noise_summary_' + adc_name + '.h5')
+    if output_file:
+        write_noise_summary(summary, output_file)
+        if verbose:
+            print('INFO: Noise summary saved in ' + output_file)
+
+    return summary
+
+
+
+def write_noise_summary(summary, file_name):
+    """
+    Write noise summary dictionary (see process_noise) in HDF5 file:
+    arrays stored as datasets, other parameters as file attributes
+    """
+
+    with h5py.File(file_name, 'w') as file:
+        for key, value in summary.items():
+            if isinstance(value, np.ndarray):
+                file.create_dataset(key, data=value)
+            elif isinstance(value, list):
+                file.attrs[key] = np.array([str(item) for item in value], dtype=h5py.string_dtype())
+            else:
+                file.attrs[key] = value
+
+
+
+def read_noise_summary(file_name):
+    """
+    Read noise summary HDF5 file
+
+    Return:
+      summary: dict
+    """
+
+    summary = dict()
+    with h5py.File(file_name, 'r') as file:
+        for key, value in file.attrs.items():
+            if isinstance(value, np.ndarray) and value.dtype==object:
+                value = [item.decode() if isinstance(item, bytes) else item for item in value]
+            summary[key] = value
+        for key in file.keys():
+            summary[key] = file[key][()]
+
+    return summary
+
+
+
+def get_channel_names(file_info, array_indices):
+    """
+    Detector channel names of selected array indices
+    (ADC channel name if no detector connection)
+    """
+
+    adc_chan_list = np.atleast_1d(file_info['adc_metadata']['adc_channel_indices'])
+    connections = file_info['connections']
+    chan_names = list()
+    for index in array_indices:
+        adc_chan = int(adc_chan_list[index])
+        chan_name = 'adc' + str(adc_chan)
+        if adc_chan in connections.get('adc_chans', list()):
+            ind = connections['adc_chans'].index(adc_chan)
+            if ind<len(connections['detector_chans']):
+                chan_name = connections['detector_chans'][ind]
+        chan_names.append(chan_name)
+
+    return chan_names
+
+
+
+def process_noise_file(file_name, nb_events, adc_name, detector_chans, adctovolt,
+                       batch_size, sample_rate, calc_csd=True):
+    """
+    Noise statistics of a single file (see process_noise for
+    arguments)
+
+    Return:
+      NoiseStats object (None if no events)
+    """
+
+    reader = hdf5.H5Reader(verbose=False)
+    noise_stats = None
+    for data_array in reader.iter_batches(batch_size, filepath=file_name, nevents=nb_events,
+                                          adc_name=adc_name, detector_chans=detector_chans,
+                                          adctovolt=adctovolt, reuse_buffer=True):
+        if noise_stats is None:
+            noise_stats = NoiseStats(data_array.shape[1], data_array.shape[2],
+                                     sample_rate, calc_csd=calc_csd)
+        noise_stats.update(data_array)
+    reader.close()
+
+    return noise_stats
+
+
+
+def _get_psd_factor(nb_samples, sample_rate):
+    """
+    One-sided folding factor (2 except DC and Nyquist
+    frequency for even number of samples) divided by 
+    PSD normalization (sample_rate*nb_samples)
+    """
+    nb_freqs = nb_samples//2+1
+    factor = np.full(nb_freqs, 2.0/(sample_rate*nb_samples))
+    factor[0] /= 2.0
+    if nb_samples%2==0:
+        factor[-1] /= 2.0
+    return factor
+
+
+
+def _sum_squares(values):
+    """
+    Sum of squared deviations from mean (axis 0)
+    """
+    deviation = values - np.mean(values, axis=0)
+    return np.sum(deviation**2, axis=0)
+
+
+
+def _process_file_worker(args):
+    """
+    Noise statistics of a single file (process pool worker)
+    """
+    return process_noise_file(*args)
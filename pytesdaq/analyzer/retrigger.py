@@ -0,0 +1,416 @@
+"""
+Offline re-triggering of continuous runs: stream continuous
+files, apply software trigger (threshold, matched filter, randoms)
+and write triggered event files (same metadata layout)
+"""
+
+import os
+import re
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+import pytesdaq.io.hdf5 as hdf5
+import pytesdaq.io.hdf5_writer as hdf5_writer
+from pytesdaq.daq.trigger import SoftwareTrigger
+
+
+# ADC group metadata added by reader/writer (not copied)
+ADC_METADATA_SKIPPED = ['dataset_list', 'nb_datasets', 'nb_events', 'nb_channels',
+                        'adc_channel_indices', 'trigger_index']
+
+
+def retrigger_run(filepath, output_path, trace_length, pretrigger_length=None,
+                  adc_name='adc1', threshold=None, template=None, psd=None,
+                  trigger_offset=None, lowpass_freq=None, highpass_freq=None,
+                  holdoff=None, random_rate=0, random_seed=None, data_prefix='trig',
+                  batch_size=100, compression=None, n_workers=1, verbose=True):
+    """
+    Re-trigger continuous run: consecutive events of each file
+    are processed as a continuous stream (block boundaries handled,
+    see trigger.SoftwareTrigger). Triggered events of each input file
+    are written in one output file with the same series and dump
+    number, run/ADC/detector configuration metadata copied from
+    input file. Events overlapping consecutive files are written
+    in the second file (last samples of previous file used, only if
+    file first event directly follows previous file last event: sample
+    counter, else event number, else event time). Files are processed
+    in parallel.
+
+    Args:
+      filepath: string or list
+         file/path or list of files/paths (continuous run)
+
+      output_path: string
+         output directory (created if needed)
+
+      trace_length: integer
+         triggered event length [samples]
+
+      pretrigger_length: integer (optional)
+         samples before trigger (default: trace_length/2)
+
+      adc_name: string
+         ADC id (default: 'adc1')
+
+      threshold: float, list or dict (optional)
+         threshold trigger: single threshold, one per channel (None =
+         not used) or {channel name: threshold}, negative = falling
+         edge. ADC units, or pulse amplitude (template units) if
+         template provided
+
+      template: 1D array (optional)
+         matched filter pulse template (optimal filter if "psd")
+
+      psd: 1D array (optional)
+         noise PSD [ADC^2/Hz] at template rfft frequencies
+
+      trigger_offset: integer (optional)
+         template sample of trigger time (default: template maximum)
+
+      lowpass_freq, highpass_freq: float (optional)
+         Butterworth filter cutoff [Hz] (no template)
+
+      holdoff: integer (optional)
+         threshold trigger holdoff [samples] (default: post-trigger length)
+
+      random_rate: float
+         random trigger rate [Hz] (default: 0 = no randoms)
+
+      random_seed: integer (optional)
+
+      data_prefix: string
+         output file prefix (default: 'trig')
+
+      batch_size: integer
+         number of continuous events read at once (default: 100)
+
+      compression: dict (optional)
+         H5Writer.set_compression arguments
+
+      n_workers: integer
+         number of processes (default: 1)
+
+    Return:
+      dict: 'file_list', 'nb_events' (written), 'nb_threshold_triggers',
+            'nb_random_triggers', 'nb_incomplete' (events not written:
+            missing samples at run start/end or data gaps)
+    """
+
+    if threshold is None and not random_rate:
+        raise ValueError('Threshold and/or random rate required!')
+
+    if isinstance(filepath, str):
+        filepath = [filepath]
+    reader = hdf5.H5Reader(verbose=False)
+    reader.set_files(filepath)
+    file_list = list(reader._file_list)
+    if not file_list:
+        raise ValueError('No file found!')
+
+    if not os.path.isdir(output_path):
+        os.makedirs(output_path)
+
+    # trigger configuration
+    trigger_config = dict()
+    trigger_config['trace_length'] = int(trace_length)
+    trigger_config['pretrigger_length'] = pretrigger_length
+    trigger_config['threshold'] = threshold
+    trigger_config['template'] = template
+    trigger_config['psd'] = psd
+    trigger_config['trigger_offset'] = trigger_offset
+    trigger_config['lowpass_freq'] = lowpass_freq
+    trigger_config['highpass_freq'] = highpass_freq
+    trigger_config['holdoff'] = holdoff
+    trigger_config['random_rate'] = random_rate
+    trigger_config['random_seed'] = random_seed
+
+    # tasks: file + previous file of same series
+    task_list = list()
+    for ifile, file_name in enumerate(file_list):
+        series_name, dump_num = _get_series(file_name)
+        output_file = os.path.join(os.path.abspath(output_path),
+                                   data_prefix + '_' + series_name + '_F'
+                                   + str(dump_num).zfill(4) + '.hdf5')
+        if os.path.abspath(file_name)==output_file:
+            raise ValueError('Output file identical to input file ' + file_name + '!')
+        previous_file = None
+        if ifile>0 and _get_series(file_list[ifile-1])[0]==series_name:
+            previous_file = file_list[ifile-1]
+        has_next = (ifile<len(file_list)-1
+                    and _get_series(file_list[ifile+1])[0]==series_name)
+        seed = None
+        if random_seed is not None:
+            seed = int(random_seed) + ifile
+        task_list.append((file_name, previous_file, has_next, output_path, data_prefix, adc_name,
+                          dict(trigger_config, random_seed=seed), batch_size, compression))
+
+    if verbose:
+        print('INFO: Re-triggering ' + str(len(task_list)) + ' file(s)')
+
+    if n_workers>1 and len(task_list)>1:
+        with ProcessPoolExecutor(max_workers=min(n_workers, len(task_list))) as executor:
+            result_list = list(executor.map(_retrigger_file_worker, task_list))
+    else:
+        result_list = [_retrigger_file_worker(task) for task in task_list]
+
+    # summary
+    summary = dict()
+    summary['file_list'] = list()
+    for key in ['nb_events', 'nb_threshold_triggers', 'nb_random_triggers', 'nb_incomplete']:
+        summary[key] = 0
+    for result in result_list:
+        summary['file_list'] += result['file_list']
+        for key in ['nb_events', 'nb_threshold_triggers', 'nb_random_triggers', 'nb_incomplete']:
+            summary[key] += result[key]
+
+    if verbose:
+        print('INFO: ' + str(summary['nb_events']) + ' triggered event(s) written in '
+              + str(len(summary['file_list'])) + ' file(s) ('
+              + str(summary['nb_threshold_triggers']) + ' threshold, '
+              + str(summary['nb_random_triggers']) + ' random, '
+              + str(summary['nb_incomplete']) + ' incomplete)')
+
+    return summary
+
+
+
+def create_trigger(trigger_config, nb_channels, sample_rate, channel_names=None):
+    """
+    Create SoftwareTrigger from configuration dictionary
+    (see retrigger_run arguments)
+
+    Args:
+      trigger_config: dict
+      nb_channels: integer
+      sample_rate: float
+      channel_names: list of string (optional)
+         channel names (threshold dictionary)
+
+    Return:
+      SoftwareTrigger
+    """
+
+    trigger = SoftwareTrigger(nb_channels, sample_rate, trigger_config['trace_length'],
+                              pretrigger_length=trigger_config.get('pretrigger_length'))
+
+    # threshold (per channel)
+    threshold = trigger_config.get('threshold')
+    if threshold is not None:
+        if isinstance(threshold, dict):
+            if channel_names is None:
+                raise ValueError('Channel names required for threshold dictionary!')
+            for chan in threshold:
+                if chan not in channel_names:
+                    raise ValueError('Unable to find channel ' + str(chan) + '!')
+            threshold = [threshold.get(chan) for chan in channel_names]
+        trigger.set_threshold(threshold, holdoff=trigger_config.get('holdoff'))
+
+    # filter
+    if trigger_config.get('template') is not None:
+        trigger.set_template(trigger_config['template'], psd=trigger_config.get('psd'),
+                             trigger_offset=trigger_config.get('trigger_offset'))
+    elif (trigger_config.get('lowpass_freq') is not None
+          or trigger_config.get('highpass_freq') is not None):
+        trigger.set_filter(lowpass_freq=trigger_config.get('lowpass_freq'),
+                           highpass_freq=trigger_config.get('highpass_freq'))
+
+    # randoms
+    if trigger_config.get('random_rate'):
+        trigger.set_random_rate(trigger_config['random_rate'],
+                                seed=trigger_config.get('random_seed'))
+
+    return trigger
+
+
+
+def _retrigger_file_worker(args):
+    """
+    Process pool worker: re-trigger a single file
+    """
+
+    (file_name, previous_file, has_next, output_path, data_prefix, adc_name,
+     trigger_config, batch_size, compression) = args
+
+    reader = hdf5.H5Reader(verbose=False)
+    metadata = reader.get_metadata(file_name)
+    if adc_name not in metadata.get('adc_list', list()):
+        raise ValueError('Unable to find ' + adc_name + ' in file ' + file_name + '!')
+    adc_metadata = metadata['groups'][adc_name]
+    nb_samples = int(adc_metadata['nb_samples'])
+    sample_rate = float(adc_metadata['sample_rate'])
+    nb_channels = int(adc_metadata['nb_channels'])
+
+    # trigger
+    connections = reader.get_connection_dict(adc_name=adc_name, metadata=metadata)
+    channel_names = None
+    if connections and len(connections.get('detector_chans', list()))==nb_channels:
+        channel_names = list(connections['detector_chans'])
+    trigger = create_trigger(trigger_config, nb_channels, sample_rate,
+                             channel_names=channel_names)
+
+    # ---------------------
+    # Previous file last
+    # samples: events overlapping
+    # files (events completed in 
+    # previous file not written)
+    # ---------------------
+    nb_incomplete_lost = 0
+    if previous_file is not None:
+        previous_metadata = reader.get_metadata(previous_file)
+        nb_events_previous = int(previous_metadata['groups'][adc_name]['nb_datasets'])
+        nb_warmup = min(nb_events_previous,
+                        -(-(trigger.history_length+trigger.trace_length)//nb_samples))
+        if nb_warmup>0:
+            reader.set_files([previous_file])
+            data_array, info_list = reader.read_events(
+                range(nb_events_previous-nb_warmup, nb_events_previous),
+                include_metadata=True, adc_name=adc_name)
+            reader.clear()
+            for ievent in range(nb_warmup):
+                trigger.process(data_array[ievent],
+                                sample_counter=_get_sample_counter(info_list[ievent],
+                                                                   nb_samples))
+
+            # carried only if file directly follows previous file,
+            # otherwise events pending at end of previous file
+            # (not counted by previous file) are incomplete
+            reader.set_files([file_name])
+            first_info = reader.read_events([0], include_metadata=True,
+                                            adc_name=adc_name)[1][0]
+            reader.clear()
+            if not _is_contiguous(info_list[-1], first_info, nb_samples, sample_rate):
+                nb_incomplete_lost = trigger.nb_pending
+                trigger.reset()
+                print('WARNING: File ' + os.path.basename(file_name) + ' not contiguous '
+                      'with previous file, trigger state reset: '
+                      + str(nb_incomplete_lost) + ' event(s) overlapping files lost!')
+    nb_incomplete_previous = trigger.nb_incomplete
+
+    # ---------------------
+    # Output file
+    # ---------------------
+    adc_config = dict()
+    for key, value in adc_metadata.items():
+        if key not in ADC_METADATA_SKIPPED:
+            adc_config[key] = value
+    adc_config['channel_list'] = [int(chan) for chan in adc_metadata['adc_channel_indices']]
+    adc_config['nb_samples'] = trigger.trace_length
+    adc_config['trigger_index'] = trigger.pretrigger_length
+    adc_config['trigger_type'] = 4 if trigger_config.get('threshold') is not None else 3
+
+    detector_config = None
+    config_name = 'detconfig' + adc_name[3:]
+    if config_name in metadata.get('group_list', list()):
+        detector_config = {adc_name: {key: value for key, value
+                                      in metadata['groups'][config_name].items()
+                                      if key not in ['dataset_list', 'nb_datasets']}}
+
+    series_name, dump_num = _get_series(file_name)
+    writer = hdf5_writer.H5Writer(verbose=False)
+    if compression is not None:
+        writer.set_compression(**compression)
+    writer.open(output_path, {adc_name: adc_config}, detector_config=detector_config,
+                data_prefix=data_prefix, run_type=metadata.get('run_type', 1),
+                run_comment=metadata.get('comment', str()),
+                run_purpose=metadata.get('run_purpose'),
+                facility=metadata.get('facility', 1),
+                nb_events_per_file=np.iinfo(np.int64).max,
+                series_name=series_name, series_num=metadata.get('series_num'),
+                dump_num=dump_num)
+
+    # ---------------------
+    # Stream file events
+    # ---------------------
+    nb_events = {3: 0, 4: 0}
+    stream_time = None
+    try:
+        for data_array, info_list in reader.iter_batches(batch_size, filepath=[file_name],
+                                                         include_metadata=True,
+                                                         adc_name=adc_name,
+                                                         reuse_buffer=True):
+            for ievent in range(data_array.shape[0]):
+
+                info = info_list[ievent]
+                sample_counter = _get_sample_counter(info, nb_samples)
+                event_dict = trigger.process(data_array[ievent], sample_counter=sample_counter)
+
+                # time of stream first sample
+                if stream_time is None and 'event_time' in info:
+                    stream_time = (float(info['event_time'])
+                                   - (trigger.sample_counter-nb_samples)/sample_rate)
+
+                for itrigger in range(len(event_dict['trigger_index'])):
+                    trigger_index = int(event_dict['trigger_index'][itrigger])
+                    trigger_type = int(event_dict['trigger_type'][itrigger])
+                    event_time = None
+                    if stream_time is not None:
+                        event_time = stream_time + trigger_index/sample_rate
+                    writer.write_event(event_dict['traces'][itrigger], adc_name=adc_name,
+                                       timeout=None, event_time=event_time,
+                                       trigger_type=trigger_type,
+                                       trigger_channel=int(event_dict['trigger_channel'][itrigger]),
+                                       trigger_amplitude=float(event_dict['trigger_amplitude'][itrigger]),
+                                       sample_counter=trigger_index-trigger.pretrigger_length)
+                    nb_events[trigger_type] += 1
+    finally:
+        output_list = writer.close()
+
+    # incomplete events: file start (no previous file), gaps
+    # (including with previous file), pending at end of series
+    nb_incomplete = trigger.nb_incomplete - nb_incomplete_previous + nb_incomplete_lost
+    if not has_next:
+        nb_incomplete += trigger.nb_pending
+
+    result = dict()
+    result['file_list'] = output_list
+    result['nb_events'] = nb_events[3] + nb_events[4]
+    result['nb_threshold_triggers'] = nb_events[4]
+    result['nb_random_triggers'] = nb_events[3]
+    result['nb_incomplete'] = nb_incomplete
+
+    return result
+
+
+
+def _get_sample_counter(info, nb_samples):
+    """
+    Sample index of continuous event first sample: "sample_counter"
+    (pydaqmx continuous run) or event number. None if not available
+    (events assumed consecutive)
+    """
+    if 'sample_counter' in info and int(info['sample_counter'])>=0:
+        return int(info['sample_counter'])
+    if 'event_num' in info:
+        return int(info['event_num'])*nb_samples
+    return None
+
+
+
+def _is_contiguous(last_info, first_info, nb_samples, sample_rate):
+    """
+    Check if continuous event (first_info) directly follows event
+    (last_info) of same series: "sample_counter" (pydaqmx continuous
+    run), else event number, else event time (half event length
+    tolerance). False if none available.
+    """
+    if (int(last_info.get('sample_counter', -1))>=0
+        and int(first_info.get('sample_counter', -1))>=0):
+        return int(last_info['sample_counter'])+nb_samples==int(first_info['sample_counter'])
+    if 'event_num' in last_info and 'event_num' in first_info:
+        return int(last_info['event_num'])+1==int(first_info['event_num'])
+    if 'event_time' in last_info and 'event_time' in first_info:
+        duration = nb_samples/sample_rate
+        return abs(float(first_info['event_time'])-float(last_info['event_time'])
+                   -duration)<=duration/2
+    return False
+
+
+
+def _get_series(file_name):
+    """
+    Get file series name and dump number from file name
+    ([prefix]_I[facility]_D[date]_T[time]_F[dump].hdf5)
+    """
+    match = re.search(r'_((?:I\d+_)?D\d+_T\d+)_F(\d+)\.hdf5$', os.path.basename(file_name))
+    if match is None:
+        return os.path.splitext(os.path.basename(file_name))[0], 1
+    return match.group(1), int(match.group(2))
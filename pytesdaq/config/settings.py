@@ -523,6 +523,35 @@ class Config:
 
 
 
+    def get_hdf5_compression(self):
+        """
+        Get HDF5 raw data compression settings ([hdf5] section of setup.ini), 
+        used by python HDF5 writers (see hdf5.get_compression_filter)
+        """
+        
+        info = dict()
+        info['compression'] = None
+        info['compression_level'] = None
+        info['shuffle'] = False
+        info['delta'] = False
+
+        if self._has_setting('hdf5','compression'):
+            compression = str(self._get_setting('hdf5','compression')).strip()
+            if compression and compression.lower()!='none':
+                info['compression'] = compression.lower()
+        if self._has_setting('hdf5','compression_level'):
+            level = str(self._get_setting('hdf5','compression_level')).strip()
+            if level and level.lower()!='none':
+                info['compression_level'] = int(level)
+        if self._has_setting('hdf5','shuffle'):
+            info['shuffle'] = self._get_boolean_setting('hdf5','shuffle')
+        if self._has_setting('hdf5','delta'):
+            info['delta'] = self._get_boolean_setting('hdf5','delta')
+
+        return info
+    
+    
+
     def get_magnicon_connection_info(self):
         """
         Returns a dictionary with the magnicon SSH connection info
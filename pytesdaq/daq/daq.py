@@ -2,6 +2,7 @@ import numpy as np
 import time
 import struct
 import pytesdaq.config.settings as settings
+import pytesdaq.io.hdf5_writer as hdf5_writer
 from pytesdaq.daq import polaris
 from pytesdaq.daq import nidaqtask
 
@@ -109,6 +110,10 @@ class DAQ:
             for item in adc_setup:
                 if item in config_list:
                     adc_config_dict[item] = adc_setup[item]
+                elif (self._driver_name=='pydaqmx' and item.startswith('connection')
+                      and item!='connection_table'):
+                    # stored in files by pydaqmx run
+                    adc_config_dict[item] = adc_setup[item]
             if adc_config_dict:
                 config_dict[adc_name] = adc_config_dict
 
@@ -154,8 +159,20 @@ class DAQ:
             return
 
        
-        if self._driver_name=='polaris':
+        if self._driver_name=='polaris' or self._driver_name=='pydaqmx':
             self._driver.set_detector_config(config_dict)
+
+
+
+    def set_trigger(self, trigger):
+        """
+        Set software trigger (trigger type 3=randoms, 4=threshold), 
+        "pydaqmx" driver only (see trigger.SoftwareTrigger)
+        """
+        if not self._driver_name=='pydaqmx':
+            print('ERROR: Software trigger only available with "pydaqmx" driver')
+            return
+        self._driver.set_trigger(trigger)
         
 
 
@@ -205,8 +222,16 @@ class DAQ:
 
         elif self._driver_name=='pydaqmx':
             
+            # HDF5 writer (continuous stream written from consumer thread)
+            writer = hdf5_writer.H5Writer(verbose=self._verbose)
+            compression = self._config.get_hdf5_compression()
+            writer.set_compression(packed=compression['delta'], **compression)
+
             # run 
-            success = self._driver.run(run_time=run_time, run_comment=run_comment)
+            success = self._driver.run(run_time=run_time, run_comment=run_comment,
+                                       run_type=run_type, run_purpose=run_purpose,
+                                       data_path=data_path, data_prefix=data_prefix,
+                                       writer=writer, facility=facility_num)
 
         return success
 
@@ -9,8 +9,10 @@ from nidaqmx.task import Task
 from nidaqmx.stream_readers import (
     AnalogUnscaledReader, AnalogSingleChannelReader, AnalogMultiChannelReader)
 import time
+import threading
 import pytesdaq.instruments.niadc as niadc
 from pytesdaq.utils import arg_utils
+from pytesdaq.daq.ring_buffer import RingBuffer
 
 
 class NITask(Task):
@@ -53,8 +55,26 @@ class NITask(Task):
         self._event_counter = 0
         self._is_continuous =False
         
-        # output array
+        # output array (single event read / scratch array)
         self._data_array = []
+
+        # ring buffer (run): callback reads directly into slots
+        self._ring_buffer = None
+        self._nb_ring_slots = 64
+        self._read_into_ring = False
+
+        # run: consumers, limits, block accounting
+        self._consumers = list()
+        self._trigger = None
+        self._max_nb_events = 0
+        self._max_nb_triggers = 0
+        self._nb_triggered_events = 0
+        self._nb_writer_dropped = 0
+        self._sample_rate = 0
+        self._run_start_time = 0
+        self._buffer_overflow = False
+        self._callback_error = None
+        self._consumer_error = None
      
     @property
     def lock_daq(self):
@@ -102,6 +122,49 @@ class NITask(Task):
     def is_run_configured(self):
         return self._is_run_configured
 
+    @property
+    def ring_buffer(self):
+        return self._ring_buffer
+
+    @property
+    def nb_ring_slots(self):
+        return self._nb_ring_slots
+
+    @nb_ring_slots.setter
+    def nb_ring_slots(self,value):
+        self._nb_ring_slots = int(value)
+        self._ring_buffer = None
+
+    @property
+    def trigger(self):
+        return self._trigger
+
+    @property
+    def event_counter(self):
+        return self._event_counter
+
+    @property
+    def nb_dropped_blocks(self):
+        # blocks acquired but not stored (ring buffer full)
+        if self._ring_buffer is None:
+            return 0
+        return self._ring_buffer.nb_dropped
+
+    @property
+    def buffer_overflow(self):
+        # NI input buffer overflow during last run (samples lost)
+        return self._buffer_overflow
+
+    @property
+    def nb_triggered_events(self):
+        # software triggered events during last run
+        return self._nb_triggered_events
+
+    @property
+    def nb_writer_dropped(self):
+        # events (blocks or triggered events) not stored by writer
+        return self._nb_writer_dropped
+
 
 
     def set_adc_config_from_dict(self, config_dict):
@@ -112,6 +175,47 @@ class NITask(Task):
         self._is_run_configured = False
 
 
+    def set_detector_config(self, config_dict):
+        """
+        Set detector config dictionary (stored in files, see run)
+        """
+        self._det_config = config_dict
+
+
+
+    def add_consumer(self, function, lossless=False):
+        """
+        Add run consumer: function(data_array, info) called from a 
+        dedicated thread for each block/event read during "run". 
+        "data_array" [chan, sample] is a ring buffer slot (copy needed
+        to keep it), "info" a dict with 'sequence', 'event_time' and
+        'sample_counter'.
+        
+        Args:
+          function: callable
+          lossless: bool
+             if True, consumer receives all events (acquisition drops 
+             events if consumer too slow), otherwise events not consumed
+             in time are skipped (e.g. display)
+        """
+        self._consumers.append((function, lossless))
+
+
+
+    def clear_consumers(self):
+        self._consumers = list()
+
+
+
+    def set_trigger(self, trigger):
+        """
+        Set software trigger (trigger_type 3=randoms, 4=threshold), 
+        see pytesdaq.daq.trigger.SoftwareTrigger. Data acquired 
+        continuously, triggered events written during "run"
+        """
+        self._trigger = trigger
+
+
     def set_adc_config(self,adc_name, device_name = str(), sample_rate=[],nb_samples=[],
                        voltage_min = [],voltage_max = [], channel_list=list(), 
                        trigger_type = [], buffer_length = [],filter_enable=[]):
@@ -218,6 +322,12 @@ class NITask(Task):
         self._nb_samples = int(config_dict['nb_samples'])
         self._nb_channels = len(channel_list)
 
+        # ring buffer (readers added by consumers, see ring_buffer property)
+        if (self._ring_buffer is None 
+            or self._ring_buffer.shape!=(self._nb_channels, self._nb_samples)):
+            self._ring_buffer = RingBuffer(self._nb_ring_slots, self._nb_channels,
+                                           self._nb_samples, dtype=np.int16)
+
 
         # transfer mode (not sure it is doing anything...)
         #ai_voltage_channels.ai_data_xfer_mech = nidaqmx.constants.DataTransferActiveTransferMode.INTERRUP
@@ -225,15 +335,24 @@ class NITask(Task):
         
 
         # sampling rate / trigger mode (continuous vs finite)
+        # software triggers (randoms, threshold): continuous
+        self._sample_rate = int(config_dict['sample_rate'])
+        is_continuous = config_dict['trigger_type'] in [1,3,4]
         buffer_length = self._nb_samples
-        if config_dict['trigger_type']==1:
+        if is_continuous:
             buffer_length = int(config_dict['sample_rate'])
 
         if 'buffer_length' in config_dict:
             buffer_length =config_dict['buffer_length']
+
+        # continuous: buffer = integer number of blocks (every N samples
+        # event), at least ~1 second and 8 blocks 
+        if is_continuous:
+            nb_blocks = max(8, -(-int(buffer_length)//self._nb_samples))
+            buffer_length = nb_blocks*self._nb_samples
                
         mode = int()
-        if config_dict['trigger_type']==1:
+        if is_continuous:
             mode = nidaqmx.constants.AcquisitionType.CONTINUOUS
         else:
             mode = nidaqmx.constants.AcquisitionType.FINITE
@@ -259,10 +378,12 @@ class NITask(Task):
             
 
         # data mode
-        if config_dict['trigger_type']==1:
-            self._is_continuous =True
-        else:
-            self._is_continuous =False
+        self._is_continuous = is_continuous
+
+        # continuous: unread samples never overwritten, NI buffer 
+        # overflow reported as error (see _read_callback)
+        if is_continuous:
+            self.in_stream.over_write = nidaqmx.constants.OverwriteMode.DO_NOT_OVERWRITE_UNREAD_SAMPLES
             
         # register callback function
         self.register_every_n_samples_acquired_into_buffer_event(self._nb_samples,
@@ -298,37 +419,253 @@ class NITask(Task):
 
 
 
-    def run(self,run_time=60, max_nb_events=[], run_comment=str(),):
+    def run(self,run_time=60, max_nb_events=[], run_comment=str(), 
+            run_type=1, run_purpose=None, data_path=None, data_prefix='raw',
+            writer=None, facility=1):
+        """
+        Take data until "run_time" (seconds) elapsed or "max_nb_events" 
+        events acquired (blocks, or triggered events if software
+        trigger, trigger_type 3/4).
+
+        Continuous mode (trigger_type=1): task stays armed, fixed size 
+        blocks (nb_samples) are read by the every N samples callback.
+        Other modes: task re-armed after each event.
+        
+        Events are read directly into the ring buffer and delivered to 
+        consumers (see add_consumer), including H5Writer if provided.
+        Blocks not stored (ring buffer full) and events not stored by
+        writer are reported. An NI input buffer overflow (unread 
+        samples lost) stops the run with an error.
+
+        Args:
+          run_time: float
+             run duration in seconds
+
+          max_nb_events: integer (optional)
+             maximum number of events: blocks, or triggered events 
+             if software trigger (default: no limit)
+
+          run_comment: string
+          run_type: integer
+          run_purpose: string (optional)
+
+          data_path: string (optional)
+             output directory (data written only if writer provided)
+
+          data_prefix: string
+             file prefix (default: 'raw')
+
+          writer: H5Writer (optional)
+             HDF5 writer (not opened), see pytesdaq.io.hdf5
+
+          facility: integer
+
+        Return:
+          bool (False if error)
+        """
         
         # configure:
         self._configure_run()
+        if not self._is_run_configured:
+            return False
 
-        # initialize data
+        # software trigger
+        adc_name = list(self._adc_config.keys())[0]
+        trigger = None
+        if self._adc_config[adc_name]['trigger_type'] in [3,4]:
+            trigger = self._trigger
+            if trigger is None:
+                print('ERROR: Software trigger required for trigger type '
+                      + str(self._adc_config[adc_name]['trigger_type']) + ' (see set_trigger)!')
+                self.clear_task()
+                return False
+            trigger.reset()
+
+        # initialize data: events read into ring buffer
+        # (scratch array used if no slot available)
         self._data_array = np.zeros((self._nb_channels,self._nb_samples), dtype=np.int16)
-         
-        # loop max events and/or runtime
+        self._ring_buffer.reset()
+        # max number of events: blocks (read callback) or
+        # triggered events (consumer)
+        self._max_nb_events = 0
+        self._max_nb_triggers = 0
+        if max_nb_events and trigger is None:
+            self._max_nb_events = int(max_nb_events)
+        elif max_nb_events:
+            self._max_nb_triggers = int(max_nb_events)
+        self._nb_triggered_events = 0
+        self._nb_writer_dropped = 0
+        self._buffer_overflow = False
+        self._callback_error = None
+        self._consumer_error = None
         self._event_counter = 0
-        while (self._event_counter < 3):
-            # start task
-            self.start()
+        
+        # consumers (software trigger: triggered events written)
+        consumers = list(self._consumers)
+        if writer is not None and data_path is not None:
+            adc_config = dict(self._adc_config[adc_name])
+            if trigger is not None:
+                adc_config['nb_samples'] = trigger.trace_length
+                adc_config['trigger_index'] = trigger.pretrigger_length
+            if not writer.open(data_path, {adc_name: adc_config},
+                               detector_config=self._det_config, data_prefix=data_prefix,
+                               run_type=run_type, run_comment=run_comment,
+                               run_purpose=run_purpose, facility=facility):
+                self.clear_task()
+                return False
+            consumers.append((self._get_writer_consumer(writer, trigger), True))
+        elif trigger is not None:
+            consumers.append((self._get_writer_consumer(None, trigger), True))
             
-            # wait until task is done -> then exit
-            run_continue = True
-            while(run_continue):
-                run_continue = not self.is_task_done()
-                time.sleep(0.1)
-                
-            # stop task
-            self.stop()
+        threads = list()
+        for function, lossless in consumers:
+            reader = self._ring_buffer.add_reader(lossless=lossless)
+            thread = threading.Thread(target=self._consumer_loop, args=(function, reader),
+                                      daemon=True)
+            thread.start()
+            threads.append((thread, reader))
+
+        # start
+        self._read_into_ring = True
+        self._run_start_time = time.time()
+        if self._verbose:
+            print('INFO: Starting run (run time = ' + str(run_time) + ' seconds'
+                  + ', max nb events = ' + str(max(self._max_nb_events,
+                                                   self._max_nb_triggers)) + ')')
+        
+        # loop max events and/or runtime
+        self.start()
+        while True:
             
-            # task done if continuous
-            if self._is_continuous:
+            time.sleep(0.01)
+
+            if self._callback_error is not None or self._consumer_error is not None:
                 break
-    
+            if self._max_nb_events>0 and self._event_counter>=self._max_nb_events:
+                break
+            if (self._max_nb_triggers>0
+                and self._nb_triggered_events>=self._max_nb_triggers):
+                break
+            if time.time()-self._run_start_time>=run_time:
+                break
+
+            # re-arm task if not continuous
+            if not self._is_continuous and self.is_task_done():
+                self.stop()
+                self.start()
+                
+        # stop task
+        self.stop()
+        self._read_into_ring = False
+        
+        # end consumers
+        self._ring_buffer.close()
+        for thread, reader in threads:
+            thread.join()
+            reader.close()
+            if reader.nb_overruns>0 and self._verbose:
+                print('INFO: ' + str(reader.nb_overruns) + ' event(s) skipped by consumer')
+        if writer is not None and data_path is not None:
+            writer.close()
+
         self.clear_task()
+
+        # report
+        duration = time.time()-self._run_start_time
+        nb_dropped = self._ring_buffer.nb_dropped
+        if self._verbose:
+            print('INFO: Run done: ' + str(self._event_counter) + ' event(s) in '
+                  + str(round(duration, 1)) + ' seconds')
+        if trigger is not None and self._verbose:
+            print('INFO: Software trigger: ' + str(self._nb_triggered_events)
+                  + ' triggered event(s) (' + str(trigger.nb_threshold_triggers)
+                  + ' threshold trigger(s), ' + str(trigger.nb_random_triggers)
+                  + ' random trigger(s)), ' + str(trigger.nb_incomplete)
+                  + ' incomplete event(s)')
+        if nb_dropped>0:
+            print('WARNING: ' + str(nb_dropped) + ' block(s) dropped (ring buffer full, '
+                  + 'consumer too slow)!')
+        if self._nb_writer_dropped>0:
+            print('WARNING: ' + str(self._nb_writer_dropped) + ' event(s) not stored '
+                  + 'by writer!')
+        if self._buffer_overflow:
+            print('ERROR: NI input buffer overflow after ' + str(self._event_counter)
+                  + ' block(s): unread samples lost, run stopped (read callback too slow)!')
+            return False
+        if self._callback_error is not None:
+            print('ERROR: ' + str(self._callback_error))
+            return False
+        if self._consumer_error is not None:
+            print('ERROR: Run stopped, consumer error: ' + str(self._consumer_error))
+            return False
+        
+        return True
       
 
 
+    def _get_writer_consumer(self, writer, trigger=None):
+        """
+        Consumer function writing events with H5Writer (blocks or
+        software triggered events, up to max number of triggered
+        events). Events not stored by writer are counted.
+        """
+        adc_name = list(self._adc_config.keys())[0]
+        def write(data_array, info):
+            if trigger is None:
+                if not writer.write_event(data_array, adc_name=adc_name, timeout=None,
+                                          event_time=info['event_time'],
+                                          sample_counter=info['sample_counter']):
+                    self._nb_writer_dropped += 1
+                return
+            
+            # software trigger
+            event_dict = trigger.process(data_array, sample_counter=info['sample_counter'])
+            for ievent in range(len(event_dict['trigger_index'])):
+                if (self._max_nb_triggers>0
+                    and self._nb_triggered_events>=self._max_nb_triggers):
+                    break
+                self._nb_triggered_events += 1
+                if writer is None:
+                    continue
+                trigger_index = int(event_dict['trigger_index'][ievent])
+                if not writer.write_event(
+                        event_dict['traces'][ievent], adc_name=adc_name, timeout=None,
+                        event_time=self._run_start_time + event_dict['trigger_time'][ievent],
+                        trigger_type=int(event_dict['trigger_type'][ievent]),
+                        trigger_channel=int(event_dict['trigger_channel'][ievent]),
+                        trigger_amplitude=float(event_dict['trigger_amplitude'][ievent]),
+                        sample_counter=trigger_index-trigger.pretrigger_length):
+                    self._nb_writer_dropped += 1
+        return write
+
+
+    
+    def _consumer_loop(self, function, reader):
+        """
+        Consumer thread: read ring buffer until closed. If consumer
+        fails, reader is removed (slots not held anymore) and run
+        is stopped (see run)
+        """
+        try:
+            while True:
+                event = reader.read(timeout=None)
+                if event is None:
+                    break
+                sequence, data_array, event_time, sample_counter = event
+                info = {'sequence': sequence, 'event_time': event_time,
+                        'sample_counter': sample_counter}
+                function(data_array, info)
+                reader.release()
+                
+        except Exception as e:
+            print('ERROR: Consumer error: ' + str(e))
+            self._consumer_error = e
+
+        finally:
+            reader.close()
+
+
+
     def read_single_event(self,data_array, do_clear_task=False):
 
         
@@ -338,6 +675,7 @@ class NITask(Task):
 
         # data array
         self._data_array = data_array
+        self._read_into_ring = False
 
         # check if continuous
         if self._is_continuous:
@@ -379,21 +717,55 @@ class NITask(Task):
         try:
             # available samples, postion in buffer
             #num_samples_available = int(self.in_stream.avail_samp_per_chan
-            #curr_read_pos = self.in_stream.curr_read_pos
+            
+            # publish events until max number of events reached 
+            # (remaining blocks of continuous run read but not published)
+            publish = self._read_into_ring
+            if self._max_nb_events>0 and self._event_counter>=self._max_nb_events:
+                publish = False
+
+            # sample counter (continuous): each callback reads the next
+            # nb_samples (unread samples never overwritten, overflow = error)
+            sample_counter = -1
+            if publish and self._is_continuous:
+                sample_counter = self._event_counter*self._nb_samples
+
+            # destination: next ring buffer slot (no copy) 
+            data_array = self._data_array
+            slot = None
+            if publish:
+                slot = self._ring_buffer.get_write_slot()
+                if slot is not None:
+                    data_array = slot
+                else:
+                    # slot still used by lossless reader -> event dropped
+                    # (NI buffer still needs to be read)
+                    self._ring_buffer.drop()
 
             if data_type=='int16':
-                self._ni_reader.read_int16(self._data_array,number_of_samples_per_channel=self._nb_samples,
+                self._ni_reader.read_int16(data_array,number_of_samples_per_channel=self._nb_samples,
                                            timeout=nidaqmx.constants.WAIT_INFINITELY)
+
+            # publish event (continuous: time from sample counter)
+            if slot is not None:
+                event_time = None
+                if sample_counter>=0:
+                    event_time = self._run_start_time + sample_counter/self._sample_rate
+                self._ring_buffer.commit(timestamp=event_time, sample_counter=sample_counter)
                 
 
             self._event_counter+=1
 
         except nidaqmx.errors.DaqWarning as warn:
             print('WARNING: ' + str(warn))
-            self.stop()
             
         except nidaqmx.errors.DaqError as err:
+            # run: task stopped by main loop (see run)
+            if err.error_code==nidaqmx.error_codes.DAQmxErrors.SAMPLES_NO_LONGER_AVAILABLE.value:
+                self._buffer_overflow = True
             print('ERROR: ' + str(err))
-            self.stop()
+            self._callback_error = err
+            if not self._read_into_ring:
+                self.stop()
 
         return 0
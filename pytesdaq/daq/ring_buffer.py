@@ -0,0 +1,373 @@
+"""
+Preallocated ring buffer shared between NI acquisition callback
+(single writer) and consumers (scope, writer, analyzer...)
+"""
+
+import time
+import threading
+import numpy as np
+
+
+
+class RingBuffer:
+    """
+    Ring buffer of N preallocated [chan, sample] slots (single
+    contiguous array, no allocation during acquisition). The writer
+    fills the next slot in place (e.g. NI "read_int16" directly into
+    slot) then commits it with a sequence number (0,1,2,...).
+
+    Readers (see add_reader) follow the sequence independently:
+      - lossy readers (default, e.g. scope): never slow down the
+        writer, events overwritten before being read are counted
+        as overruns and skipped
+      - lossless readers (e.g. file writer): the slot held by the
+        reader is never overwritten, the writer drops new events
+        instead (see nb_dropped) if the reader falls behind by
+        more than N events
+    """
+
+    def __init__(self, nb_slots, nb_channels, nb_samples, dtype=np.int16):
+        """
+        Args:
+          nb_slots: integer
+             number of slots (events)
+
+          nb_channels: integer
+
+          nb_samples: integer
+
+          dtype: numpy dtype (default: int16)
+        """
+
+        self._nb_slots = max(1, int(nb_slots))
+        self._data = np.zeros((self._nb_slots, int(nb_channels), int(nb_samples)),
+                              dtype=dtype)
+
+        # slot info
+        self._sequence = np.full(self._nb_slots, -1, dtype=np.int64)
+        self._timestamp = np.zeros(self._nb_slots, dtype=np.float64)
+        self._sample_counter = np.zeros(self._nb_slots, dtype=np.int64)
+
+        # write position (next sequence number)
+        self._write_sequence = 0
+        self._nb_dropped = 0
+
+        # readers
+        self._readers = list()
+        self._lock = threading.Lock()
+        self._condition = threading.Condition(self._lock)
+        self._is_closed = False
+
+
+
+    @property
+    def nb_slots(self):
+        return self._nb_slots
+
+    @property
+    def shape(self):
+        return self._data.shape[1:]
+
+    @property
+    def dtype(self):
+        return self._data.dtype
+
+    @property
+    def write_sequence(self):
+        return self._write_sequence
+
+    @property
+    def nb_dropped(self):
+        return self._nb_dropped
+
+    @property
+    def is_closed(self):
+        return self._is_closed
+
+
+
+    def add_reader(self, lossless=False, from_start=False):
+        """
+        Add independent reader
+
+        Args:
+          lossless: bool
+             if True, slots are not overwritten until read/released
+             by this reader (writer drops events instead)
+
+          from_start: bool
+             start from oldest available event instead of next
+             event (default: False)
+
+        Return:
+          RingBufferReader
+        """
+        with self._lock:
+            start_sequence = self._write_sequence
+            if from_start:
+                start_sequence = max(0, self._write_sequence-self._nb_slots+1)
+            reader = RingBufferReader(self, start_sequence, lossless=lossless)
+            self._readers.append(reader)
+        return reader
+
+
+
+    def remove_reader(self, reader):
+        """
+        Remove reader (lossless reader stops holding slots)
+        """
+        with self._lock:
+            if reader in self._readers:
+                self._readers.remove(reader)
+
+
+
+    def get_write_slot(self):
+        """
+        Get next slot to be filled by writer (view, no copy)
+
+        Return:
+          slot: 2D ndarray [chan, sample]
+                None if slot still held by lossless reader
+                (event should be dropped, see drop)
+        """
+
+        # check lossless readers (oldest held sequence), readers
+        # list copied (readers added/removed by consumer threads)
+        with self._lock:
+            readers = list(self._readers)
+        for reader in readers:
+            if (reader._lossless
+                and self._write_sequence-self._nb_slots>=reader._hold_sequence):
+                return None
+
+        return self._data[self._write_sequence % self._nb_slots]
+
+
+
+    def commit(self, timestamp=None, sample_counter=-1):
+        """
+        Publish slot filled by writer (see get_write_slot)
+
+        Args:
+          timestamp: float (default: current time)
+
+          sample_counter: integer
+             acquisition sample counter of first sample
+             (continuous acquisition), -1 if not available
+
+        Return:
+          sequence: integer
+        """
+
+        if timestamp is None:
+            timestamp = time.time()
+
+        with self._condition:
+            sequence = self._write_sequence
+            slot_index = sequence % self._nb_slots
+            self._sequence[slot_index] = sequence
+            self._timestamp[slot_index] = timestamp
+            self._sample_counter[slot_index] = sample_counter
+            self._write_sequence += 1
+            self._condition.notify_all()
+
+        return sequence
+
+
+
+    def drop(self, nb_events=1):
+        """
+        Account for events not stored (no slot available)
+        """
+        self._nb_dropped += int(nb_events)
+
+
+
+    def write(self, data_array, timestamp=None, sample_counter=-1):
+        """
+        Copy event into next slot and commit (convenience
+        function, acquisition should use get_write_slot/commit)
+
+        Return:
+          sequence: integer (None if event dropped)
+        """
+        slot = self.get_write_slot()
+        if slot is None:
+            self.drop()
+            return None
+        slot[...] = data_array
+        return self.commit(timestamp=timestamp, sample_counter=sample_counter)
+
+
+
+    def close(self):
+        """
+        End of acquisition: wake up waiting readers
+        """
+        with self._condition:
+            self._is_closed = True
+            self._condition.notify_all()
+
+
+
+    def reset(self):
+        """
+        Reset sequence and counters (new run). Readers
+        restart at first event.
+        """
+        with self._condition:
+            self._sequence[:] = -1
+            self._write_sequence = 0
+            self._nb_dropped = 0
+            self._is_closed = False
+            for reader in self._readers:
+                reader._reset(0)
+
+
+
+
+class RingBufferReader:
+    """
+    Independent ring buffer reader (see RingBuffer.add_reader)
+    """
+
+    def __init__(self, ring_buffer, start_sequence=0, lossless=False):
+
+        self._ring = ring_buffer
+        self._lossless = lossless
+        self._reset(start_sequence)
+
+
+
+    @property
+    def next_sequence(self):
+        return self._next_sequence
+
+    @property
+    def nb_read(self):
+        return self._nb_read
+
+    @property
+    def nb_overruns(self):
+        return self._nb_overruns
+
+    @property
+    def nb_available(self):
+        return max(0, self._ring._write_sequence-self._next_sequence)
+
+
+
+    def read(self, timeout=0, out=None):
+        """
+        Read next event
+
+        Args:
+          timeout: float
+             maximum waiting time in seconds if no new event
+             (default: 0, no wait). None: wait until new event
+             or ring buffer closed
+
+          out: ndarray [chan, sample] (optional)
+             copy event into "out" (copy consistency checked) instead
+             of returning slot view
+
+        Return:
+          (sequence, data, timestamp, sample_counter), None if
+          no event available. data is a slot view (no copy) if
+          "out" not provided: valid until next read/release for
+          lossless readers, see "is_valid" otherwise
+        """
+
+        ring = self._ring
+
+        with ring._condition:
+
+            # release previous slot
+            self._hold_sequence = self._next_sequence
+
+            # wait for new event
+            if self._next_sequence>=ring._write_sequence:
+                if timeout is not None and timeout<=0:
+                    return None
+                ring._condition.wait_for(
+                    lambda: self._next_sequence<ring._write_sequence or ring._is_closed,
+                    timeout=timeout)
+                if self._next_sequence>=ring._write_sequence:
+                    return None
+
+            # overrun (lossy reader): oldest available event (oldest
+            # slot excluded, next to be filled by writer)
+            oldest_sequence = ring._write_sequence-ring._nb_slots+1
+            if not self._lossless and self._next_sequence<oldest_sequence:
+                self._nb_overruns += oldest_sequence-self._next_sequence
+                self._next_sequence = oldest_sequence
+
+            sequence = self._next_sequence
+            slot_index = sequence % ring._nb_slots
+            timestamp = ring._timestamp[slot_index]
+            sample_counter = ring._sample_counter[slot_index]
+            self._hold_sequence = sequence
+            self._next_sequence += 1
+            self._nb_read += 1
+
+        data = ring._data[slot_index]
+        if out is not None:
+            out[...] = data
+            if not self.is_valid(sequence):
+                # overwritten during copy
+                self._nb_overruns += 1
+                return self.read(timeout=timeout, out=out)
+            data = out
+
+        return sequence, data, timestamp, sample_counter
+
+
+
+    def release(self):
+        """
+        Release slot of last read event (lossless reader)
+        """
+        self._hold_sequence = self._next_sequence
+
+
+
+    def is_valid(self, sequence):
+        """
+        Check if slot of event "sequence" has not been overwritten
+        (lossy reader using slot view)
+        """
+        ring = self._ring
+        return (ring._sequence[sequence % ring._nb_slots]==sequence
+                and ring._write_sequence-ring._nb_slots<sequence)
+
+
+
+    def skip_to_latest(self):
+        """
+        Skip unread events (e.g. display only most recent event)
+
+        Return:
+          number of events skipped
+        """
+        with self._ring._lock:
+            nb_skipped = max(0, self._ring._write_sequence-1-self._next_sequence)
+            self._next_sequence += nb_skipped
+            self._hold_sequence = self._next_sequence
+        return nb_skipped
+
+
+
+    def close(self):
+        """
+        Remove reader from ring buffer
+        """
+        self._ring.remove_reader(self)
+
+
+
+    def _reset(self, start_sequence):
+        self._next_sequence = start_sequence
+        self._hold_sequence = start_sequence
+        self._nb_read = 0
+        self._nb_overruns = 0
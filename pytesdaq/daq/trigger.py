@@ -0,0 +1,581 @@
+"""
+Software trigger for continuous streams: threshold (on filtered
+traces) and random triggers applied to consecutive acquisition
+blocks (e.g. ring buffer blocks, see NITask.run)
+"""
+
+import numpy as np
+from scipy import signal
+
+
+
+class SoftwareTrigger:
+    """
+    Scan consecutive [chan, sample] blocks of a continuous stream and
+    extract triggered events [chan, trace_length]:
+
+      - threshold trigger (trigger_type=4): per channel threshold on
+        traces, optionally Butterworth filtered (see set_filter) or
+        matched/optimal filtered (see set_template), sign = polarity.
+        Trigger at filtered trace maximum above threshold, followed
+        by holdoff period without new threshold trigger
+      - random trigger (trigger_type=3): Poisson distributed triggers
+        at configured rate
+
+    Filter state, threshold state, holdoff, random trigger time and the
+    samples needed by events overlapping block boundaries are kept
+    between blocks: events are identical whatever the block size.
+    Events are returned when their post-trigger window is complete.
+    """
+
+    def __init__(self, nb_channels, sample_rate, trace_length,
+                 pretrigger_length=None):
+        """
+        Args:
+          nb_channels: integer
+
+          sample_rate: float
+             sample rate [Hz]
+
+          trace_length: integer
+             event length [samples]
+
+          pretrigger_length: integer (optional)
+             samples before trigger (default: trace_length/2)
+        """
+
+        self._nb_channels = int(nb_channels)
+        self._sample_rate = float(sample_rate)
+        self._trace_length = int(trace_length)
+        self._pretrigger_length = self._trace_length//2
+        if pretrigger_length is not None:
+            self._pretrigger_length = int(pretrigger_length)
+        if (self._trace_length<=0 or self._pretrigger_length<0
+            or self._pretrigger_length>=self._trace_length):
+            raise ValueError('Trace length should be > pretrigger length >= 0!')
+
+        # threshold (None = disabled), holdoff
+        self._threshold = None
+        self._polarity = None
+        self._threshold_chans = np.zeros(0, dtype=np.int64)
+        self._holdoff = self._trace_length-self._pretrigger_length
+
+        # filter: Butterworth (second order sections) or matched
+        # filter kernel (None = no filter)
+        self._sos = None
+        self._kernel = None
+        self._kernel_delay = 0
+
+        # randoms (rate [Hz], 0 = disabled)
+        self._random_rate = 0
+        self._rng = np.random.default_rng()
+
+        # block buffer (previous samples + current block)
+        self._work = None
+        self._work_history = 0
+
+        self.reset()
+
+
+
+    @property
+    def nb_channels(self):
+        return self._nb_channels
+
+    @property
+    def sample_rate(self):
+        return self._sample_rate
+
+    @property
+    def trace_length(self):
+        return self._trace_length
+
+    @property
+    def pretrigger_length(self):
+        return self._pretrigger_length
+
+    @property
+    def history_length(self):
+        """
+        number of samples kept from previous blocks
+        """
+        if self._kernel is not None:
+            return self._trace_length + len(self._kernel) - 1
+        return self._trace_length
+
+    @property
+    def holdoff(self):
+        return self._holdoff
+
+    @property
+    def sample_counter(self):
+        return self._sample_counter
+
+    @property
+    def nb_threshold_triggers(self):
+        return self._nb_threshold_triggers
+
+    @property
+    def nb_random_triggers(self):
+        return self._nb_random_triggers
+
+    @property
+    def nb_incomplete(self):
+        return self._nb_incomplete
+
+    @property
+    def nb_pending(self):
+        """
+        Events waiting for next block: post-trigger window not
+        complete or threshold region not ended
+        """
+        nb_pending = len(self._pending_index)
+        if self._above is not None:
+            nb_pending += int(np.count_nonzero(self._peak_index>=0))
+        return nb_pending
+
+
+
+    def set_threshold(self, threshold, holdoff=None):
+        """
+        Set threshold trigger
+
+        Args:
+          threshold: float or list of float/None (one per channel)
+             threshold in ADC units (filtered trace), negative value
+             = falling edge. None: channel (or threshold trigger)
+             disabled
+
+          holdoff: integer (optional)
+             number of samples after trigger without new threshold
+             trigger (default: post-trigger length)
+        """
+
+        if threshold is None:
+            self._threshold = None
+            self._threshold_chans = np.zeros(0, dtype=np.int64)
+        else:
+            if not isinstance(threshold, (list, tuple, np.ndarray)):
+                threshold = [threshold]*self._nb_channels
+            if len(threshold)!=self._nb_channels:
+                raise ValueError('Expecting one threshold per channel ('
+                                 + str(self._nb_channels) + ')!')
+            chans = [ichan for ichan, val in enumerate(threshold) if val is not None]
+            values = np.array([threshold[ichan] for ichan in chans], dtype=np.float64)
+            if np.any(values==0):
+                raise ValueError('Threshold should be non zero!')
+            self._threshold_chans = np.array(chans, dtype=np.int64)
+            self._threshold = np.abs(values)
+            self._polarity = np.sign(values)
+
+        if holdoff is not None:
+            self._holdoff = int(holdoff)
+
+        self._above = None
+
+
+
+    def set_filter(self, lowpass_freq=None, highpass_freq=None, order=2):
+        """
+        Set Butterworth filter applied to traces before threshold
+        (threshold trigger only, extracted events not filtered)
+
+        Args:
+          lowpass_freq: float (optional)
+             low pass cutoff frequency [Hz]
+
+          highpass_freq: float (optional)
+             high pass cutoff frequency [Hz] (baseline removal)
+
+          order: integer (default: 2)
+        """
+
+        if lowpass_freq is not None and highpass_freq is not None:
+            self._sos = signal.butter(order, [highpass_freq, lowpass_freq], btype='bandpass',
+                                      fs=self._sample_rate, output='sos')
+        elif lowpass_freq is not None:
+            self._sos = signal.butter(order, lowpass_freq, btype='lowpass',
+                                      fs=self._sample_rate, output='sos')
+        elif highpass_freq is not None:
+            self._sos = signal.butter(order, highpass_freq, btype='highpass',
+                                      fs=self._sample_rate, output='sos')
+        else:
+            self._sos = None
+
+        self._kernel = None
+        self._filter_state = None
+
+
+
+    def set_template(self, template, psd=None, trigger_offset=None):
+        """
+        Set matched filter (optimal filter if noise PSD provided)
+        applied to traces before threshold. Filtered trace = pulse
+        amplitude in template units (baseline removed), threshold
+        is then an amplitude threshold. 
+
+        Args:
+          template: 1D array
+             pulse template
+
+          psd: 1D array (optional)
+             noise PSD at template length rfft frequencies
+             (len(template)//2+1 values, or two-sided PSD with
+             len(template) values). Default: white noise
+
+          trigger_offset: integer (optional)
+             template sample corresponding to trigger time
+             (default: template maximum)
+        """
+
+        template = np.asarray(template, dtype=np.float64)
+        nb_bins = len(template)//2+1
+
+        # frequency domain filter: template/PSD, DC removed
+        filter_fft = np.fft.rfft(template)
+        if psd is not None:
+            psd = np.asarray(psd, dtype=np.float64)
+            if len(psd)!=nb_bins and len(psd)!=len(template):
+                raise ValueError('Expecting PSD with ' + str(nb_bins) + ' or '
+                                 + str(len(template)) + ' frequencies!')
+            psd = psd[:nb_bins]
+            if np.any(psd[1:]<=0):
+                raise ValueError('PSD should be positive!')
+            filter_fft[1:] /= psd[1:]
+        filter_fft[0] = 0
+        filter_trace = np.fft.irfft(filter_fft, n=len(template))
+
+        # normalization: filtered template = 1
+        norm = np.dot(filter_trace, template)
+        if norm==0:
+            raise ValueError('Unable to normalize template!')
+
+        # convolution kernel (correlation with filter trace)
+        self._kernel = filter_trace[::-1]/norm
+        if trigger_offset is None:
+            trigger_offset = int(np.argmax(np.abs(template)))
+        self._kernel_delay = len(template)-1-int(trigger_offset)
+
+        self._sos = None
+        self._filter_state = None
+
+
+
+    def set_random_rate(self, rate, seed=None):
+        """
+        Set random trigger rate
+
+        Args:
+          rate: float
+             average rate [Hz] (0 = disabled)
+
+          seed: integer (optional)
+             random generator seed
+        """
+        self._random_rate = float(rate)
+        if seed is not None:
+            self._rng = np.random.default_rng(seed)
+        self._next_random = None
+
+
+
+    def reset(self, sample_counter=0):
+        """
+        Reset stream (new run or discontinuity): filter and trigger
+        state, pending events
+
+        Args:
+          sample_counter: integer
+             sample index of next block
+        """
+        self._reset_stream(sample_counter)
+        self._nb_threshold_triggers = 0
+        self._nb_random_triggers = 0
+        self._nb_incomplete = 0
+
+
+
+    def _reset_stream(self, sample_counter):
+        """
+        Reset stream state (counters kept)
+        """
+        self._sample_counter = int(sample_counter)
+        self._nb_previous = 0
+        self._filter_state = None
+        self._above = None
+        self._holdoff_end = -1
+        self._next_random = None
+        self._pending_index = np.zeros(0, dtype=np.int64)
+        self._pending_type = np.zeros(0, dtype=np.int16)
+        self._pending_chan = np.zeros(0, dtype=np.int16)
+        self._pending_amplitude = np.zeros(0, dtype=np.float64)
+
+
+
+    def process(self, data_array, sample_counter=None):
+        """
+        Process next block
+
+        Args:
+          data_array: 2D ndarray [chan, sample]
+             continuous block (any size)
+
+          sample_counter: integer (optional)
+             sample index of first sample (see NITask.run). If not
+             consecutive with previous block, stream is reset
+             (pending events lost)
+
+        Return:
+          event_dict: dict with events completed in this block
+             (sorted by trigger index)
+             'traces': 3D ndarray [event, chan, sample]
+             'trigger_index': sample index of trigger (stream)
+             'trigger_time': trigger time since stream start [s]
+             'trigger_type': 3=random, 4=threshold
+             'trigger_channel': channel index (-1 for randoms)
+             'trigger_amplitude': filtered trace at trigger (0 for randoms),
+                 pulse amplitude in template units for matched filter
+        """
+
+        data_array = np.asarray(data_array)
+        if data_array.ndim!=2 or data_array.shape[0]!=self._nb_channels:
+            raise ValueError('Expecting [chan, sample] array with '
+                             + str(self._nb_channels) + ' channels!')
+        nb_samples = data_array.shape[1]
+
+        # discontinuity (dropped blocks)
+        if sample_counter is not None and int(sample_counter)!=self._sample_counter:
+            self._nb_incomplete += self.nb_pending
+            self._reset_stream(sample_counter)
+
+        block_start = self._sample_counter
+        block_end = block_start + nb_samples
+
+        # ---------------------
+        # buffer: previous samples
+        # (<history length) + block
+        # ---------------------
+        length = self._trace_length
+        history = self.history_length
+        if (self._work is None or self._work.shape[1]<history+nb_samples
+            or self._work_history!=history or self._work.dtype!=data_array.dtype):
+            work = np.zeros((self._nb_channels, history+nb_samples), dtype=data_array.dtype)
+            nb_previous = 0
+            if self._work is not None and self._work.dtype==data_array.dtype:
+                nb_previous = min(self._nb_previous, history)
+                work[:, history-nb_previous:history] = (
+                    self._work[:, self._work_history-nb_previous:self._work_history])
+            self._nb_previous = nb_previous
+            self._work = work
+            self._work_history = history
+        self._work[:, history:history+nb_samples] = data_array
+        buffer_start = block_start - self._nb_previous
+        buffer = self._work[:, history-self._nb_previous:history+nb_samples]
+
+        # ---------------------
+        # threshold triggers
+        # ---------------------
+        trigger_index = list()
+        trigger_type = list()
+        trigger_chan = list()
+        trigger_amplitude = list()
+
+        if self._threshold is not None and len(self._threshold_chans)>0 and nb_samples>0:
+            index, chans, amplitude = self._find_threshold_triggers(buffer, nb_samples,
+                                                                    block_start)
+            if len(index)>0:
+                # holdoff (sequential)
+                accepted = np.zeros(len(index), dtype=bool)
+                holdoff_end = self._holdoff_end
+                for ievent, sample_index in enumerate(index):
+                    if sample_index>holdoff_end:
+                        accepted[ievent] = True
+                        holdoff_end = sample_index + self._holdoff
+                self._holdoff_end = holdoff_end
+                trigger_index.append(index[accepted])
+                trigger_type.append(np.full(np.count_nonzero(accepted), 4, dtype=np.int16))
+                trigger_chan.append(chans[accepted].astype(np.int16))
+                trigger_amplitude.append(amplitude[accepted])
+                self._nb_threshold_triggers += np.count_nonzero(accepted)
+
+        # ---------------------
+        # random triggers
+        # ---------------------
+        if self._random_rate>0:
+            index = self._get_random_triggers(block_start, block_end)
+            trigger_index.append(index)
+            trigger_type.append(np.full(len(index), 3, dtype=np.int16))
+            trigger_chan.append(np.full(len(index), -1, dtype=np.int16))
+            trigger_amplitude.append(np.zeros(len(index), dtype=np.float64))
+            self._nb_random_triggers += len(index)
+
+        # ---------------------
+        # events: pending + new,
+        # complete if post-trigger
+        # window available
+        # ---------------------
+        index = np.concatenate([self._pending_index] + trigger_index)
+        types = np.concatenate([self._pending_type] + trigger_type)
+        chans = np.concatenate([self._pending_chan] + trigger_chan)
+        amplitude = np.concatenate([self._pending_amplitude] + trigger_amplitude)
+        order = np.argsort(index, kind='stable')
+        index, types, chans, amplitude = index[order], types[order], chans[order], amplitude[order]
+
+        start = index - self._pretrigger_length
+        is_complete = start + length<=block_end
+        is_valid = is_complete & (start>=buffer_start)
+        self._nb_incomplete += np.count_nonzero(is_complete & ~is_valid)
+
+        self._pending_index = index[~is_complete]
+        self._pending_type = types[~is_complete]
+        self._pending_chan = chans[~is_complete]
+        self._pending_amplitude = amplitude[~is_complete]
+
+        # extract traces [event, chan, sample]
+        offsets = start[is_valid] - buffer_start
+        sample_index = offsets[:,np.newaxis] + np.arange(length)
+        traces = np.ascontiguousarray(buffer[:, sample_index].transpose(1,0,2))
+
+        event_dict = dict()
+        event_dict['traces'] = traces
+        event_dict['trigger_index'] = index[is_valid]
+        event_dict['trigger_time'] = index[is_valid]/self._sample_rate
+        event_dict['trigger_type'] = types[is_valid]
+        event_dict['trigger_channel'] = chans[is_valid]
+        event_dict['trigger_amplitude'] = amplitude[is_valid]
+
+        # ---------------------
+        # keep last samples
+        # for next block
+        # ---------------------
+        nb_previous = min(history, buffer.shape[1])
+        self._work[:, history-nb_previous:history] = buffer[:, buffer.shape[1]-nb_previous:]
+        self._nb_previous = nb_previous
+        self._sample_counter = block_end
+
+        return event_dict
+
+
+
+    def _find_threshold_triggers(self, buffer, nb_samples, block_start):
+        """
+        Threshold triggers in last "nb_samples" of [chan, sample] 
+        buffer (block), using filter/threshold state of previous 
+        block. Trigger = filtered trace maximum of each region 
+        above threshold, available once trace is back below 
+        threshold
+
+        Return:
+          index: trigger sample index (sorted)
+          chans: trigger channel
+          amplitude: filtered trace at trigger
+        """
+
+        # matched filter: previous samples from buffer (stream
+        # start padded with first sample)
+        if self._kernel is not None:
+            nb_input = nb_samples + len(self._kernel) - 1
+            traces = buffer[:, max(0, buffer.shape[1]-nb_input):][self._threshold_chans]
+            traces = traces.astype(np.float64)
+            if traces.shape[1]<nb_input:
+                traces = np.pad(traces, ((0,0), (nb_input-traces.shape[1],0)), mode='edge')
+            traces = signal.oaconvolve(traces, self._kernel[np.newaxis,:], mode='valid',
+                                       axes=-1)
+        else:
+            traces = buffer[:, buffer.shape[1]-nb_samples:][self._threshold_chans]
+            traces = traces.astype(np.float64)
+
+        # Butterworth filter (state kept between blocks)
+        if self._sos is not None:
+            if self._filter_state is None:
+                self._filter_state = (signal.sosfilt_zi(self._sos)[:,np.newaxis,:]
+                                      *traces[:,0][np.newaxis,:,np.newaxis])
+            traces, self._filter_state = signal.sosfilt(self._sos, traces, axis=-1,
+                                                        zi=self._filter_state)
+
+        # above threshold (polarity corrected)
+        values = traces*self._polarity[:,np.newaxis]
+        above = values>=self._threshold[:,np.newaxis]
+        if self._above is None:
+            # start of stream: no trigger if already above threshold
+            self._above = above[:,0].copy()
+            self._peak_index = np.full(len(self._threshold_chans), -1, dtype=np.int64)
+            self._peak_value = np.zeros(len(self._threshold_chans), dtype=np.float64)
+
+        # regions above threshold (may start in previous block or
+        # end in next block): trigger at filtered trace maximum
+        index_list = list()
+        chan_list = list()
+        amplitude_list = list()
+        for ichan in range(len(self._threshold_chans)):
+
+            edges = np.diff(above[ichan].astype(np.int8),
+                            prepend=np.int8(self._above[ichan]))
+            starts = np.flatnonzero(edges==1)
+            ends = np.flatnonzero(edges==-1)
+            is_continued = bool(self._above[ichan])
+            if is_continued:
+                starts = np.concatenate(([0], starts))
+            self._above[ichan] = above[ichan,-1]
+
+            for iregion, start in enumerate(starts):
+
+                end = nb_samples
+                if iregion<len(ends):
+                    end = ends[iregion]
+
+                # region at stream start ignored
+                if iregion==0 and is_continued and self._peak_index[ichan]<0:
+                    continue
+
+                # maximum
+                if end>start:
+                    peak = start + np.argmax(values[ichan, start:end])
+                    if ((iregion>0 or not is_continued)
+                        or values[ichan, peak]>self._peak_value[ichan]):
+                        self._peak_index[ichan] = block_start + peak
+                        self._peak_value[ichan] = values[ichan, peak]
+
+                # region done
+                if end<nb_samples:
+                    index_list.append(self._peak_index[ichan])
+                    chan_list.append(self._threshold_chans[ichan])
+                    amplitude_list.append(self._peak_value[ichan]*self._polarity[ichan])
+                    self._peak_index[ichan] = -1
+
+        index = np.array(index_list, dtype=np.int64)
+        chans = np.array(chan_list, dtype=np.int64)
+        amplitude = np.array(amplitude_list, dtype=np.float64)
+        order = np.argsort(index, kind='stable')
+        index, chans, amplitude = index[order], chans[order], amplitude[order]
+
+        # matched filter: trigger time = template start + offset
+        if self._kernel is not None:
+            index -= self._kernel_delay
+
+        return index, chans, amplitude
+
+
+
+    def _get_random_triggers(self, block_start, block_end):
+        """
+        Random trigger indices in [block_start, block_end[
+        (Poisson process, exponential intervals)
+        """
+
+        mean_interval = self._sample_rate/self._random_rate
+
+        # future trigger times drawn in batches (sequence independent
+        # of block size)
+        if self._next_random is None:
+            self._next_random = block_start + np.cumsum(
+                self._rng.exponential(mean_interval, 64))
+        while self._next_random[-1]<block_end:
+            self._next_random = np.concatenate((self._next_random, self._next_random[-1]
+                                                + np.cumsum(self._rng.exponential(mean_interval, 64))))
+
+        nb_in_block = np.count_nonzero(self._next_random<block_end)
+        index = np.floor(self._next_random[:nb_in_block]).astype(np.int64)
+        self._next_random = self._next_random[nb_in_block:]
+
+        return index
@@ -0,0 +1,410 @@
+"""
+Run catalog: persistent (SQLite) sidecar index of HDF5
+files metadata in a data directory
+"""
+
+import os
+import io
+import re
+import json
+import sqlite3
+import numpy as np
+import pandas as pd
+from glob import glob
+import pytesdaq.io.hdf5 as hdf5
+
+
+
+class RunCatalog:
+    """
+    Scan HDF5 data directory once and store file/ADC/detector config
+    metadata in a local SQLite file. Catalog is refreshed incrementally
+    based on file modification time and size.
+    """
+
+    def __init__(self, data_path, catalog_file=None, recursive=False,
+                 verbose=True):
+        """
+        Args:
+          data_path: string
+             data directory
+
+          catalog_file: string (optional)
+             SQLite catalog file name
+             (default: [data_path]/pytesdaq_catalog.db)
+
+          recursive: bool
+             include sub-directories (default: False)
+        """
+
+        self._data_path = os.path.abspath(data_path)
+        self._recursive = recursive
+        self._verbose = verbose
+
+        if not os.path.isdir(self._data_path):
+            raise ValueError('Data directory "' + data_path + '" not found!')
+
+        # catalog file
+        self._catalog_file = catalog_file
+        if self._catalog_file is None:
+            self._catalog_file = os.path.join(self._data_path, 'pytesdaq_catalog.db')
+
+        # connect and create table if needed
+        self._cnx = sqlite3.connect(self._catalog_file, check_same_thread=False)
+        self._create_table()
+
+        # reader (used to scan files)
+        self._reader = hdf5.H5Reader(raise_errors=False, verbose=False)
+
+
+
+    @property
+    def data_path(self):
+        return self._data_path
+
+    @property
+    def catalog_file(self):
+        return self._catalog_file
+
+
+
+    def update(self, force=False):
+        """
+        Update catalog: add new files, rescan modified files
+        and remove deleted files
+
+        Args:
+          force: bool
+             rescan all files (default: False)
+
+        Return:
+          nb_scanned: integer
+             number of (re)scanned files
+        """
+
+        # files on disk
+        file_list = self._find_files()
+
+        # files in catalog
+        catalog_dict = dict()
+        cursor = self._cnx.execute('SELECT file_name, mtime, size FROM files')
+        for file_name, mtime, size in cursor.fetchall():
+            catalog_dict[file_name] = (mtime, size)
+
+        # remove deleted files
+        deleted_list = [(file_name,) for file_name in catalog_dict
+                        if file_name not in file_list]
+        if deleted_list:
+            self._cnx.executemany('DELETE FROM files WHERE file_name=?', deleted_list)
+            self._cnx.executemany('DELETE FROM event_attrs WHERE file_name=?', deleted_list)
+
+        # scan new/modified files
+        nb_scanned = 0
+        for file_name in file_list:
+            stat = os.stat(file_name)
+            if (not force and file_name in catalog_dict
+                and catalog_dict[file_name]==(stat.st_mtime, stat.st_size)):
+                continue
+            if self._scan_file(file_name, stat=stat, commit=False):
+                nb_scanned += 1
+
+        self._cnx.commit()
+
+        if self._verbose:
+            print('INFO: Catalog updated: ' + str(nb_scanned) + ' file(s) scanned, '
+                  + str(len(deleted_list)) + ' file(s) removed, '
+                  + str(len(file_list)) + ' file(s) total')
+
+        return nb_scanned
+
+
+
+    def get_file_list(self, run_type=None, series=None, comment=None):
+        """
+        Get sorted list of files, with optional selection
+
+        Args:
+          run_type: integer (optional)
+             run type
+
+          series: string (optional)
+             series name/number
+
+          comment: string (optional)
+             regular expression searched in run comment
+
+        Return:
+          list of string
+        """
+
+        query = 'SELECT file_name, comment FROM files'
+        conditions = list()
+        values = list()
+        if run_type is not None:
+            conditions.append('run_type=?')
+            values.append(int(run_type))
+        if series is not None:
+            conditions.append('series=?')
+            values.append(str(series))
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        query += ' ORDER BY file_name'
+
+        file_list = list()
+        for file_name, file_comment in self._cnx.execute(query, values).fetchall():
+            if (comment is not None
+                and (file_comment is None or re.search(comment, file_comment) is None)):
+                continue
+            file_list.append(file_name)
+
+        return file_list
+
+
+
+    def get_metadata(self, file_name):
+        """
+        Get file metadata (same format as H5Reader.get_metadata
+        except ADC groups "dataset_list"). File is rescanned if
+        modified since last update.
+
+        Args:
+          file_name: string
+
+        Return:
+          metadata: dict (empty if file not available)
+        """
+
+        file_name = os.path.abspath(file_name)
+        if not os.path.isfile(file_name):
+            return dict()
+
+        stat = os.stat(file_name)
+        row = self._cnx.execute('SELECT mtime, size, metadata FROM files WHERE file_name=?',
+                                (file_name,)).fetchone()
+
+        if row is None or (row[0], row[1])!=(stat.st_mtime, stat.st_size):
+            if not self._scan_file(file_name, stat=stat):
+                return dict()
+            row = self._cnx.execute('SELECT mtime, size, metadata FROM files WHERE file_name=?',
+                                    (file_name,)).fetchone()
+
+        return _json_to_metadata(row[2])
+
+
+
+    def get_connection_dict(self, file_name, adc_name='adc1'):
+        """
+        Get connection dictionary for specifid adc name
+        """
+        metadata = self.get_metadata(file_name)
+        return self._reader.get_connection_dict(adc_name=adc_name, metadata=metadata)
+
+
+
+    def get_detector_config(self, file_name, adc_name='adc1', use_chan_dict=True):
+        """
+        Get detector configuration
+        """
+        metadata = self.get_metadata(file_name)
+        return self._reader.get_detector_config(adc_name=adc_name,
+                                                use_chan_dict=use_chan_dict,
+                                                metadata=metadata)
+
+
+
+    def get_event_attrs(self, file_name, adc_name='adc1'):
+        """
+        Get per-event attributes columns stored in catalog
+        (see H5Reader.get_event_index)
+
+        Return:
+          dict: attribute name -> 1D ndarray 
+          (None if not available or file modified)
+        """
+
+        file_name = os.path.abspath(file_name)
+        if not os.path.isfile(file_name):
+            return None
+        stat = os.stat(file_name)
+        row = self._cnx.execute('SELECT mtime, size, data FROM event_attrs '
+                                'WHERE file_name=? AND adc_name=?',
+                                (file_name, adc_name)).fetchone()
+        if row is None or (row[0], row[1])!=(stat.st_mtime, stat.st_size):
+            return None
+
+        with np.load(io.BytesIO(row[2]), allow_pickle=False) as data:
+            return {key: data[key] for key in data.files}
+
+
+
+    def set_event_attrs(self, file_name, adc_name, columns):
+        """
+        Store per-event attributes columns in catalog
+        
+        Args:
+          file_name: string
+          adc_name: string
+          columns: dict (attribute name -> 1D ndarray)
+        """
+
+        file_name = os.path.abspath(file_name)
+        stat = os.stat(file_name)
+        buffer = io.BytesIO()
+        np.savez(buffer, **columns)
+        self._cnx.execute('INSERT OR REPLACE INTO event_attrs VALUES (?,?,?,?,?)',
+                          (file_name, adc_name, stat.st_mtime, stat.st_size,
+                           buffer.getvalue()))
+        self._cnx.commit()
+
+
+        
+    def get_table(self):
+        """
+        Get catalog summary table
+
+        Return:
+          pandas DataFrame
+        """
+        query = ('SELECT file_name, series, run_type, comment, adc_list, nb_events,'
+                 ' mtime, size FROM files ORDER BY file_name')
+        return pd.read_sql_query(query, self._cnx)
+
+
+
+    def close(self):
+        if self._cnx is not None:
+            self._cnx.close()
+            self._cnx = None
+
+
+
+    def _create_table(self):
+        """
+        Create catalog table
+        """
+        self._cnx.execute('CREATE TABLE IF NOT EXISTS files ('
+                          'file_name TEXT PRIMARY KEY, '
+                          'mtime REAL, '
+                          'size INTEGER, '
+                          'series TEXT, '
+                          'run_type INTEGER, '
+                          'comment TEXT, '
+                          'adc_list TEXT, '
+                          'nb_events INTEGER, '
+                          'metadata TEXT)')
+        self._cnx.execute('CREATE TABLE IF NOT EXISTS event_attrs ('
+                          'file_name TEXT, '
+                          'adc_name TEXT, '
+                          'mtime REAL, '
+                          'size INTEGER, '
+                          'data BLOB, '
+                          'PRIMARY KEY (file_name, adc_name))')
+        self._cnx.commit()
+
+
+    def _find_files(self):
+        """
+        Find HDF5 files in data directory
+        """
+        if self._recursive:
+            file_list = glob(os.path.join(self._data_path, '**', '*.hdf5'),
+                             recursive=True)
+        else:
+            file_list = glob(os.path.join(self._data_path, '*.hdf5'))
+        return sorted([os.path.abspath(file_name) for file_name in file_list])
+
+
+
+    def _scan_file(self, file_name, stat=None, commit=True):
+        """
+        Read file metadata and store in catalog
+        """
+
+        if stat is None:
+            stat = os.stat(file_name)
+
+        try:
+            metadata = self._reader.get_metadata(file_name)
+        except Exception as e:
+            print('WARNING: Unable to read metadata from file ' + file_name
+                  + ': ' + str(e))
+            return False
+
+        if not metadata:
+            return False
+
+        # ADC groups: remove (potentially long) dataset list
+        # (copy, reader metadata may be cached)
+        metadata = dict(metadata)
+        metadata['groups'] = dict(metadata.get('groups', dict()))
+        for adc_name in metadata.get('adc_list', list()):
+            metadata['groups'][adc_name] = dict(metadata['groups'][adc_name])
+            metadata['groups'][adc_name].pop('dataset_list', None)
+
+        # series
+        series = None
+        if 'series_num' in metadata:
+            series = str(metadata['series_num'])
+        else:
+            match = re.search(r'_(I\d+_D\d+_T\d+)_F\d+', os.path.basename(file_name))
+            if match is not None:
+                series = match.group(1)
+
+        # run type / comment
+        run_type = None
+        if 'run_type' in metadata:
+            run_type = int(metadata['run_type'])
+        comment = None
+        if 'comment' in metadata:
+            comment = str(metadata['comment'])
+
+        # number of events
+        nb_events = 0
+        for adc_name in metadata.get('adc_list', list()):
+            nb_events = max(nb_events, int(metadata['groups'][adc_name]['nb_datasets']))
+
+        self._cnx.execute('INSERT OR REPLACE INTO files VALUES (?,?,?,?,?,?,?,?,?)',
+                          (file_name, stat.st_mtime, stat.st_size, series, run_type,
+                           comment, ','.join(metadata.get('adc_list', list())),
+                           nb_events, _metadata_to_json(metadata)))
+        if commit:
+            self._cnx.commit()
+
+        return True
+
+
+
+
+
+def _metadata_to_json(metadata):
+    """
+    Convert metadata dictionary to JSON string. Numpy
+    arrays/scalars are stored with their dtype
+    """
+
+    def encode(value):
+        if isinstance(value, np.ndarray):
+            return {'__ndarray__': value.tolist(), 'dtype': value.dtype.str}
+        if isinstance(value, np.generic):
+            return {'__npscalar__': value.item(), 'dtype': value.dtype.str}
+        if isinstance(value, bytes):
+            return value.decode()
+        raise TypeError('Unable to convert ' + str(type(value)) + ' to JSON')
+
+    return json.dumps(metadata, default=encode)
+
+
+
+def _json_to_metadata(json_str):
+    """
+    Convert JSON string back to metadata dictionary
+    """
+
+    def decode(value):
+        if '__ndarray__' in value:
+            return np.array(value['__ndarray__'], dtype=np.dtype(value['dtype']))
+        if '__npscalar__' in value:
+            return np.dtype(value['dtype']).type(value['__npscalar__'])
+        return value
+
+    return json.loads(json_str, object_hook=decode)
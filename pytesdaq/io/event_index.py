@@ -0,0 +1,153 @@
+"""
+Index of per-event attributes across a list of HDF5 files
+(see H5Reader.get_event_index)
+"""
+
+import numpy as np
+import pandas as pd
+
+
+
+class EventIndex:
+    """
+    Index of per-event attributes across a list of files. Global event 
+    index (first event of first file = 0) is compatible with H5Reader
+    read_event(global_index=...) / read_events
+    """
+
+    def __init__(self, file_list, columns_list):
+        """
+        Args:
+          file_list: list of string
+             file names
+
+          columns_list: list of dict
+             per-event attributes columns of each file 
+             (see H5Reader._read_event_attrs)
+        """
+
+        self._file_list = list(file_list)
+        nb_events_list = [int(columns['nb_events']) for columns in columns_list]
+        self._nb_events = sum(nb_events_list)
+
+        # location of events
+        self._columns = dict()
+        self._columns['file_index'] = np.repeat(np.arange(len(nb_events_list)),
+                                                nb_events_list)
+        self._columns['event_index'] = np.concatenate(
+            [np.arange(nb, dtype=np.int64) for nb in nb_events_list]
+            + [np.zeros(0, dtype=np.int64)])
+
+        # attributes available in all files
+        keys = None
+        for columns in columns_list:
+            file_keys = [key for key in columns if key!='nb_events']
+            if keys is None:
+                keys = file_keys
+            else:
+                keys = [key for key in keys if key in file_keys]
+        for key in keys or list():
+            self._columns[key] = np.concatenate([columns[key] for columns in columns_list])
+
+        # sort order (unsorted columns)
+        self._sort_indices = dict()
+
+        
+
+    @property
+    def file_list(self):
+        return self._file_list
+
+    @property
+    def columns(self):
+        return list(self._columns.keys())
+        
+    def __len__(self):
+        return self._nb_events
+
+    def __getitem__(self, column):
+        return self._columns[column]
+
+    def __repr__(self):
+        return ('EventIndex(nb_events=' + str(self._nb_events) + ', nb_files='
+                + str(len(self._file_list)) + ', columns=' + str(self.columns) + ')')
+
+
+    
+    def select(self, column=None, start=None, stop=None, step=1):
+        """
+        Select events with attribute in [start, stop[ (binary search)
+
+        Args:
+          column: string (optional)
+              attribute name, None = global event index
+          
+          start, stop: (optional)
+              range [start, stop[ (None = no limit)
+
+          step: integer
+              keep every "step" selected events (default: 1)
+
+        Return:
+          1D ndarray of global event indices (increasing order)
+        """
+
+        if step<1:
+            raise ValueError('Step should be at least 1!')
+        
+        # global index
+        if column is None:
+            start, stop, _ = slice(start, stop).indices(self._nb_events)
+            return np.arange(start, max(start, stop), step, dtype=np.int64)
+
+        if column not in self._columns:
+            raise ValueError('Attribute "' + str(column) + '" not available! '
+                             'Available: ' + str(self.columns))
+        values = self._columns[column]
+
+        # sort order (if needed)
+        sort_indices = None
+        if column not in self._sort_indices:
+            if len(values)>1 and np.any(values[1:]<values[:-1]):
+                self._sort_indices[column] = np.argsort(values, kind='stable')
+            else:
+                self._sort_indices[column] = None
+        sort_indices = self._sort_indices[column]
+        if sort_indices is not None:
+            values = values[sort_indices]
+
+        # binary search
+        index_start = 0
+        index_stop = len(values)
+        if start is not None:
+            index_start = int(np.searchsorted(values, start, side='left'))
+        if stop is not None:
+            index_stop = int(np.searchsorted(values, stop, side='left'))
+
+        if sort_indices is None:
+            indices = np.arange(index_start, max(index_start, index_stop), dtype=np.int64)
+        else:
+            indices = np.sort(sort_indices[index_start:index_stop]).astype(np.int64)
+        return indices[::step]
+
+
+    
+    def locate(self, global_indices):
+        """
+        Get file name and event index in file of global indices
+
+        Return:
+          list of (file name, event index) 
+        """
+        global_indices = np.asarray(global_indices, dtype=np.int64).ravel()
+        return [(self._file_list[self._columns['file_index'][index]],
+                 int(self._columns['event_index'][index]))
+                for index in global_indices]
+
+
+    
+    def to_dataframe(self):
+        """
+        Convert index to pandas DataFrame (one row per event)
+        """
+        return pd.DataFrame(self._columns)
@@ -1,20 +1,71 @@
 import h5py
 import re
 import os
+import bisect
 import numpy as np
 import pandas as pd
 from glob import glob
+import time
+import copy
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
 from pytesdaq.utils import connection_utils
+from pytesdaq.utils import calibration_utils
+from pytesdaq.io.event_index import EventIndex
+
+# optional: additional compression filters (LZ4, Zstd, Blosc)
+try:
+    import hdf5plugin
+except ImportError:
+    hdf5plugin = None
+
+# optional: arrow table output / parquet
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
 
 
 
 class H5Reader:
     
-    def __init__(self, raise_errors=True, verbose=True):
+    def __init__(self, raise_errors=True, verbose=True, max_open_files=0,
+                 rdcc_nbytes=None, rdcc_nslots=None, rdcc_w0=None):
+        """
+        Args:
+          raise_errors: bool
+             raise ValueError (True) or print error (False)
 
+          verbose: bool
+
+          max_open_files: integer
+             size of pool of open (read only) files, reused when 
+             switching files (default: 0 = no pool, file closed
+             when done)
+
+          rdcc_nbytes, rdcc_nslots, rdcc_w0: (optional)
+             h5py raw data chunk cache options (chunk cache
+             size in bytes, number of hash slots, eviction
+             policy), see h5py.File
+        """
 
         self._raise_errors = raise_errors
         self._verbose = verbose
+
+        # open files pool: path -> (h5py.File, (mtime, size))
+        self._file_pool = OrderedDict()
+        self._max_open_files = max(0, int(max_open_files))
+
+        # h5py file options (chunk cache)
+        self._file_options = dict()
+        if rdcc_nbytes is not None:
+            self._file_options['rdcc_nbytes'] = int(rdcc_nbytes)
+        if rdcc_nslots is not None:
+            self._file_options['rdcc_nslots'] = int(rdcc_nslots)
+        if rdcc_w0 is not None:
+            self._file_options['rdcc_w0'] = float(rdcc_w0)
         
         # list of files
         self._file_list = list()
@@ -26,14 +77,43 @@ class H5Reader:
         self._current_file_metadata = dict()
         self._current_file_nb_events = 0
         self._current_file_event_counter = 0
+
+        # per-event attributes columns (packed layout)
+        self._current_file_event_attrs = dict()
        
         # event counter
         self._global_event_counter = 0
+
+        # cumulative number of events (random access index)
+        self._event_offsets = None
+
+        # max memory (bytes) of block of events read
+        # before channel selection / ADC conversion
+        self._read_block_memory = 64e6
          
         # file counter
         self._file_counter = 0
+
+        # run catalog (optional)
+        self._catalog = None
+
+        # decoded metadata LRU cache, key = (file path, mtime, size)
+        self._metadata_cache = OrderedDict()
+        self._metadata_cache_size = 64
+
+        # current file decoded ADC group attributes
+        self._current_file_group_attrs = dict()
         
     
+    def set_catalog(self, catalog):
+        """
+        Set run catalog (pytesdaq.io.catalog.RunCatalog) used to get
+        file metadata without reading files (None = disable)
+        """
+        self._catalog = catalog
+        
+
+
     def set_files(self, filepaths):
         """
         Set file namelist
@@ -45,6 +125,7 @@ class H5Reader:
         
         self.clear()
         self._file_list = list()
+        self._event_offsets = None
         
         if isinstance(filepaths, str):
             if filepaths.find('.hdf5')==-1:
@@ -72,6 +153,7 @@ class H5Reader:
   
     def close(self):
         self._close_file()
+        self._close_file_pool()
 
         
     def clear(self):
@@ -104,15 +186,37 @@ class H5Reader:
 
 
 
-    def read_event(self, include_metadata=False, adc_name='adc1'):
+    def read_event(self, include_metadata=False, adc_name='adc1',
+                   global_index=None, sample_range=None):
         """
-        Function to read next event
+        Function to read next event or, if "global_index" 
+        provided, a specific event (random access)
+
+        Args:
+          include_metadata: bool 
+               include group/dataset metadata (default = False)
+
+          adc_name: string
+              ADC id (default: 'adc1')
+
+          global_index: integer (optional)
+              event index across all files (first event = 0). 
+              Sequential reading then continues from this event.
+
+          sample_range: tuple (optional)
+              (start, stop) samples window (default: all samples)
         """
         
         # check if files available
         if not self._file_list or len(self._file_list)==0:
             error_msg = 'No file available!'
             return error_msg, error_msg
+
+        # random access: move to requested event
+        if global_index is not None:
+            if not self._seek_event(global_index):
+                error_msg = 'Event index ' + str(global_index) + ' out of range!'
+                return error_msg, error_msg
           
         # open file if needed
         if self._current_file is None:
@@ -141,34 +245,542 @@ class H5Reader:
             return error_msg, error_msg
 
 
-        # get dataset
+        # read event
         self._current_file_event_counter+=1
-        dataset_name = 'event_' + str(self._current_file_event_counter)
-        dataset = self._current_file[adc_name][dataset_name]
+        self._global_event_counter+=1
+        return self._read_current_file_event(adc_name, self._current_file_event_counter-1,
+                                             include_metadata=include_metadata,
+                                             sample_range=sample_range)
+
+
+    
+    def _read_current_file_event(self, adc_name, event_index, include_metadata=False,
+                                 sample_range=None):
+        """
+        Read single event from current file 
+
+        Args:
+          adc_name: string
+             ADC id
+
+          event_index: integer
+             event index in file (first event = 0)
+
+          include_metadata: bool 
+             include group/dataset metadata
 
+          sample_range: tuple (optional)
+             (start, stop) samples window (default: all samples)
+
+        Return:
+          2D ndarray [chan, sample]  (+ info dict if include_metadata)
+        """
+        
+        # get dataset
+        group = self._current_file[adc_name]
+        sample_sel = _get_sample_selection(sample_range)
+        if _is_packed(group):
+            dataset = group[PACKED_DATASET_NAME]
+            dims = dataset.shape[1:]
+        else:
+            dataset_name = 'event_' + str(event_index+1)
+            dataset = group[dataset_name]
+            dims = dataset.shape
+            
         # array
-        dims = dataset.shape
-        array = np.zeros((dims[0],dims[1]), dtype=np.int16)
-        dataset.read_direct(array)
+        nb_samples = len(range(*sample_sel.indices(dims[1])))
+        array = np.zeros((dims[0],nb_samples), dtype=np.int16)
+        if _is_packed(group):
+            _read_packed_data(dataset, event_index, slice(None), sample_sel, array)
+        else:
+            dataset.read_direct(array, source_sel=np.s_[:, sample_sel])
       
 
         # include info
         if include_metadata:
-            info = self._extract_metadata(dataset.attrs)
-            info.update(self._extract_metadata(self._current_file[adc_name].attrs))
+            if _is_packed(group):
+                info = self._get_packed_event_attrs(adc_name, event_index)
+            else:
+                info = self._extract_metadata(dataset.attrs)
+            info.update(self._get_group_attrs(adc_name))
             return array, info
               
         return array
 
 
     
+    def read_events(self, indices, include_metadata=False, adc_name='adc1',
+                    sample_range=None):
+        """
+        Read events using their global index across all files
+        (first event = 0). Events are read in file order, each 
+        file being opened only once.
+
+        Args:
+          indices: list/array of integer
+              global event indices
+
+          include_metadata: bool 
+               include group/dataset metadata (default = False)
+
+          adc_name: string
+              ADC id (default: 'adc1')
+
+          sample_range: tuple (optional)
+              (start, stop) samples window (default: all samples)
+
+        Return:
+          3D ndarray[event, chan, samples] (same order as indices)
+          + list of metadata dict if include_metadata=True
+        """
+
+        indices = np.asarray(indices, dtype=np.int64).ravel()
+        nb_events = len(indices)
+
+        output_data = None
+        info_list = [None]*nb_events
+        
+        # read in increasing index order
+        for output_index in np.argsort(indices, kind='stable'):
+            
+            array, info = self.read_event(include_metadata=True,
+                                          adc_name=adc_name,
+                                          global_index=int(indices[output_index]),
+                                          sample_range=sample_range)
+            
+            # check if reading error
+            if isinstance(array, str):
+                if self._raise_errors:
+                    raise ValueError(array)
+                else:
+                    print('ERROR: ' + array)
+                    if include_metadata:
+                        return [],[]
+                    else:
+                        return []
+
+            if output_data is None:
+                output_data = np.zeros((nb_events,) + array.shape, dtype=array.dtype)
+            output_data[output_index] = array
+            info_list[output_index] = info
+
+        if output_data is None:
+            output_data = np.zeros((0,0,0), dtype=np.int16)
+            
+        if include_metadata:
+            return output_data, info_list
+
+        return output_data
+            
+
+    
+    def get_event_index(self, adc_name='adc1', rebuild=False, sidecar=True):
+        """
+        Get index of per-event attributes (event number, time,...) 
+        across all files. Attributes of each file are read once, then
+        cached in memory and in run catalog if available (see set_catalog),
+        otherwise in sidecar file next to data files
+        ([data dir]/.pytesdaq_index/[file name].[adc name].npz).
+        Stored attributes are ignored if file modified.
+
+        Args:
+          adc_name: string
+              ADC id (default: 'adc1')
+
+          rebuild: bool
+              read attributes again from files (default: False)
+
+          sidecar: bool
+              use sidecar files if no run catalog (default: True)
+
+        Return:
+          EventIndex
+        """
+
+        if not self._file_list:
+            error_msg = 'No file available!'
+            if self._raise_errors:
+                raise ValueError(error_msg)
+            print('ERROR: ' + error_msg)
+            return None
+
+        columns_list = list()
+        for file_name in self._file_list:
+
+            columns = None
+            use_sidecar = sidecar and self._catalog is None
+            if not rebuild:
+                columns = self._get_cached(file_name, ('event_attrs', adc_name))
+                if columns is None and self._catalog is not None:
+                    columns = self._catalog.get_event_attrs(file_name, adc_name)
+                if columns is None and use_sidecar:
+                    columns = _read_sidecar_event_attrs(file_name, adc_name)
+                    
+            if columns is None:
+                columns = self._read_event_attrs(file_name, adc_name)
+                if self._catalog is not None:
+                    self._catalog.set_event_attrs(file_name, adc_name, columns)
+                elif use_sidecar:
+                    try:
+                        _write_sidecar_event_attrs(file_name, adc_name, columns)
+                    except OSError as e:
+                        if self._verbose:
+                            print('WARNING: Unable to write event index sidecar file for '
+                                  + file_name + ': ' + str(e))
+                    
+            self._set_cached(file_name, ('event_attrs', adc_name), columns)
+            columns_list.append(columns)
+
+        return EventIndex(self._file_list, columns_list)
+
+
+    
+    def select_events(self, column=None, start=None, stop=None, step=1,
+                      adc_name='adc1'):
+        """
+        Select events using per-event attributes index (see 
+        get_event_index), binary search if attribute sorted
+
+        Args:
+          column: string (optional)
+              attribute name (e.g. 'event_num', 'event_time'). If None:
+              global event index 
+          
+          start, stop: (optional)
+              attribute range [start, stop[ 
+
+          step: integer
+              keep every "step" selected events (default: 1) 
+
+          adc_name: string
+              ADC id (default: 'adc1')
+
+        Return:
+          1D ndarray of global event indices (see read_events)
+        """
+        event_index = self.get_event_index(adc_name=adc_name)
+        if event_index is None:
+            return np.zeros(0, dtype=np.int64)
+        return event_index.select(column=column, start=start, stop=stop, step=step)
+
+
+    
+    def _read_event_attrs(self, file_name, adc_name='adc1'):
+        """
+        Read per-event attributes of a file (scalar attributes 
+        available for all events)
+
+        Return:
+          dict: attribute name -> 1D ndarray
+        """
+
+        columns = dict()
+        with h5py.File(file_name, 'r', **self._file_options) as file:
+            
+            if adc_name not in file:
+                return _column_arrays(columns, 0)
+            group = file[adc_name]
+
+            # packed layout: already columns
+            if _is_packed(group):
+                nb_events = group[PACKED_DATASET_NAME].shape[0]
+                for key, column in _read_packed_attrs(group).items():
+                    if np.ndim(column)==1:
+                        columns[key] = np.asarray(column)
+                columns['nb_events'] = nb_events
+                return _column_arrays(columns, nb_events)
+
+            # loop event datasets
+            info_list = list()
+            while 'event_' + str(len(info_list)+1) in group:
+                dataset = group['event_' + str(len(info_list)+1)]
+                info_list.append(self._extract_metadata(dataset.attrs))
+            columns = _get_scalar_metadata(info_list)
+            columns['nb_events'] = len(info_list)
+                
+        return _column_arrays(columns, len(info_list))
+
+
+
+    def read_merged_event(self, include_metadata=False, adc_list=None,
+                          global_index=None, sample_range=None):
+        """
+        Event builder: read next event (or event "global_index") of
+        all ADCs and merge channels [adc1 channels, adc2 channels, ...]
+        
+        Args:
+          include_metadata: bool 
+              include group/dataset metadata (default = False)
+
+          adc_list: list of string (optional)
+              ADC ids (default: all ADCs in file)
+
+          global_index: integer (optional)
+              event index across all files (first event = 0)
+
+          sample_range: tuple (optional)
+              (start, stop) samples window (default: all samples)
+
+        Return:
+          2D ndarray [chan, sample]
+          + merged info dict if include_metadata=True (see
+          _merge_event_info), error message string if no event
+        """
+
+        # first ADC: sequential reading (file switching, counters)
+        first_adc_name = 'adc1'
+        if adc_list:
+            first_adc_name = adc_list[0]
+        elif self._current_file is not None and self._current_file_metadata:
+            first_adc_name = self._current_file_metadata['adc_list'][0]
+        elif self._file_list and self._file_counter<len(self._file_list):
+            metadata = self._get_metadata(self._file_list[self._file_counter])
+            if metadata.get('adc_list'):
+                first_adc_name = metadata['adc_list'][0]
+                
+        output = self.read_event(include_metadata=include_metadata,
+                                 adc_name=first_adc_name,
+                                 global_index=global_index,
+                                 sample_range=sample_range)
+        if isinstance(output, tuple) and isinstance(output[0], str):
+            return output
+
+        if adc_list is None:
+            adc_list = self._current_file_metadata['adc_list']
+
+        # other ADCs (same file, same event)
+        event_index = self._current_file_event_counter-1
+        array_list = list()
+        info_dict = dict()
+        for adc_name in adc_list:
+            if adc_name==first_adc_name:
+                adc_output = output
+            else:
+                adc_output = self._read_current_file_event(adc_name, event_index,
+                                                           include_metadata=include_metadata,
+                                                           sample_range=sample_range)
+            if include_metadata:
+                array_list.append(adc_output[0])
+                info_dict[adc_name] = adc_output[1]
+            else:
+                array_list.append(adc_output)
+
+        # check number of samples
+        if len(set([array.shape[-1] for array in array_list]))>1:
+            error_msg = 'ADC devices with different number of samples, unable to merge!'
+            if self._raise_errors:
+                raise ValueError(error_msg)
+            print('ERROR: ' + error_msg)
+            return error_msg, error_msg
+            
+        array = np.concatenate(array_list, axis=0)
+        if include_metadata:
+            connection_dicts = dict()
+            for adc_name in adc_list:
+                connection_dicts[adc_name] = self.get_connection_dict(adc_name=adc_name)
+            return array, self._merge_event_info(adc_list, info_dict, connection_dicts)
+        return array
+
+    
+
+    def read_many_merged_events(self, filepath=None, nevents=0, adc_list=None,
+                                include_metadata=False,
+                                adctovolt=False,
+                                volt_dtype=np.float64,
+                                sample_range=None,
+                                memory_limit=2):
+        """
+        Event builder: read events of all ADCs and merge channels
+        [event, adc1 channels + adc2 channels +..., samples]. Each file
+        is opened once, events read by blocks for each ADC.
+
+        Args:
+          filepath: string or list  
+               file/path or list of files/paths (default: use current file list)
+          
+          nevents: integer
+               number of events to read  (default nb_events=0 -> all events)
+
+          adc_list: list of string (optional)
+              ADC ids (default: all ADCs in first file)
+
+          include_metadata: bool 
+               include merged metadata (default = False)
+
+          other arguments: see read_many_events
+      
+        Return:
+          3D ndarray[event, chan, samples]
+          + list of merged info dict if include_metadata=True
+        """
+
+        #  set file list
+        if filepath is not None:
+            self.set_files(filepath)
+
+        empty_output = []
+        if include_metadata:
+            empty_output = [],[]
+            
+        if not self._file_list:
+            error_msg = 'No file available!'
+            if self._raise_errors:
+                raise ValueError(error_msg)
+            print('ERROR: ' + error_msg)
+            return empty_output
+            
+        # ADC list
+        if adc_list is None:
+            adc_list = self._get_metadata(self._file_list[0]).get('adc_list', list())
+        if not adc_list:
+            error_msg = 'No ADC found!'
+            if self._raise_errors:
+                raise ValueError(error_msg)
+            print('ERROR: ' + error_msg)
+            return empty_output
+            
+        # files info for each ADC
+        read_info_dict = dict()
+        for adc_name in adc_list:
+            read_info = self._get_read_info(adc_name=adc_name, nevents=nevents,
+                                            check_nb_samples=True,
+                                            sample_range=sample_range)
+            if read_info is None:
+                return empty_output
+            read_info_dict[adc_name] = read_info
+
+        nb_events_list = [read_info_dict[adc]['nb_events'] for adc in adc_list]
+        nb_samples_list = [read_info_dict[adc]['nb_samples'] for adc in adc_list]
+        error_msg = None
+        if len(set(nb_samples_list))>1:
+            error_msg = 'ADC devices with different number of samples, unable to merge!'
+        elif len(set(nb_events_list))>1:
+            error_msg = 'Inconsistent number of events between ADC devices!'
+        if error_msg is not None:
+            if self._raise_errors:
+                raise ValueError(error_msg)
+            print('ERROR: ' + error_msg)
+            return empty_output
+        
+        nb_events_tot = nb_events_list[0]
+        nb_samples = nb_samples_list[0]
+        chan_offsets = [0]
+        for adc_name in adc_list:
+            chan_offsets.append(chan_offsets[-1] + read_info_dict[adc_name]['nb_channels'])
+        nb_channels = chan_offsets[-1]
+            
+        # memory check
+        sample_bytes = 2
+        if adctovolt:
+            sample_bytes = np.dtype(volt_dtype).itemsize
+        output_memory_per_event = sample_bytes*nb_samples*nb_channels/1e9
+        if nb_events_tot*output_memory_per_event>memory_limit:
+            nb_events_tot_temp = int(round(memory_limit/output_memory_per_event))
+            print('WARNING: Max number events based on memory limit of ' + str(memory_limit) + 'GB is ' +
+                  str(nb_events_tot_temp) + ' out of ' + str(nb_events_tot) +'!')
+            nb_events_tot = nb_events_tot_temp
+
+        # output
+        output_dtype = np.int16
+        if adctovolt:
+            output_dtype = volt_dtype
+        output_data = np.zeros((nb_events_tot, nb_channels, nb_samples), dtype=output_dtype)
+        info_list = list()
+        
+        # loop files, then ADCs (file opened once)
+        event_counter = 0
+        file_info_lists = [read_info_dict[adc]['file_info_list'] for adc in adc_list]
+        for file_infos in zip(*file_info_lists):
+
+            if event_counter>=nb_events_tot:
+                break
+            nb_events_file = min(file_infos[0]['nb_events'], nb_events_tot-event_counter)
+
+            adc_info_lists = dict()
+            nb_events_read_list = list()
+            for iadc, adc_name in enumerate(adc_list):
+                adc_info_lists[adc_name] = list()
+                output_view = output_data[:, chan_offsets[iadc]:chan_offsets[iadc+1], :]
+                nb_events_read = self._read_file_events(file_infos[iadc], nb_events_file,
+                                                        output_view, event_counter,
+                                                        adc_name=adc_name,
+                                                        adctovolt=adctovolt,
+                                                        info_list=adc_info_lists[adc_name],
+                                                        include_metadata=include_metadata,
+                                                        close_file=(iadc==len(adc_list)-1),
+                                                        volt_dtype=volt_dtype,
+                                                        sample_range=sample_range)
+                nb_events_read_list.append(nb_events_read)
+            nb_events_read = min(nb_events_read_list)
+            
+            # metadata
+            if include_metadata:
+                connection_dicts = dict()
+                for iadc, adc_name in enumerate(adc_list):
+                    connection_dicts[adc_name] = file_infos[iadc]['connections']
+                for ievent in range(nb_events_read):
+                    info_dict = {adc_name: adc_info_lists[adc_name][ievent] for adc_name in adc_list}
+                    info_list.append(self._merge_event_info(adc_list, info_dict, connection_dicts))
+                    
+            event_counter += nb_events_read
+            if nb_events_read<nb_events_file:
+                break
+
+        # remove unfilled events (reading error)
+        if event_counter<nb_events_tot:
+            output_data = output_data[:event_counter]
+
+        if include_metadata:
+            return output_data, info_list
+        return output_data
+
+
+        
+    def get_merged_connection_dict(self, file_name=None, adc_list=None):
+        """
+        Get connection dictionary of merged ADC channels 
+        (see read_merged_event), "adc_names" = ADC id of each channel
+        """
+        if adc_list is None:
+            adc_list = self._get_metadata(file_name=file_name).get('adc_list', list())
+
+        connection_dicts = dict()
+        for adc_name in adc_list:
+            connection_dicts[adc_name] = self.get_connection_dict(file_name=file_name,
+                                                                  adc_name=adc_name)
+        return _merge_connection_dicts(adc_list, connection_dicts)
+
+    
+
+    def _merge_event_info(self, adc_list, info_dict, connection_dicts):
+        """
+        Merge event info of multiple ADCs: first ADC info with 
+        channel lists merged, "adc_names" (ADC id of each channel),
+        "connection_map" (merged connections) and "adc_info" 
+        (info dict of each ADC)
+        """
+
+        info = dict(info_dict[adc_list[0]])
+        connection_map = _merge_connection_dicts(adc_list, connection_dicts)
+        for key in ['detector_chans', 'tes_chans', 'controller_chans', 'adc_chans']:
+            info[key] = connection_map[key]
+        info['adc_names'] = connection_map['adc_names']
+        info['connection_map'] = connection_map
+        info['adc_info'] = info_dict
+        return info
+        
+    
+
     def read_many_events(self, filepath=None, nevents=0,
                          output_format=1,
                          include_metadata=False,
                          adc_name='adc1',
                          detector_chans=None,
                          adctovolt=False,
-                         memory_limit=2):
+                         volt_dtype=np.float64,
+                         sample_range=None,
+                         memory_limit=2,
+                         n_workers=1):
         """
         Read multiple events (default read all events in dump)
         
@@ -182,7 +794,13 @@ class H5Reader:
           output_format: integer
                1: list of 2D ndarray[chan, samples]
                2: 3D ndarray[event, chan, samples]
-               3: data frame 
+               3: pandas DataFrame, one row per event: scalar metadata 
+                  columns + "traces" column (2D ndarray[chan, samples] views 
+                  of a single contiguous 3D array), channel names in 
+                  df.attrs['detector_chans']
+               4: pyarrow Table (pyarrow required), scalar metadata columns
+                  + "traces" column (fixed size list [chan][samples])
+                  See write_parquet to save 3 and 4.
 
           include_metadata: bool 
                include file/group/dataset metadata (default = False)
@@ -198,15 +816,28 @@ class H5Reader:
 
           adctovolt: Bool
                Convert  from ADC to volt (Default=False) 
+
+          volt_dtype: numpy dtype
+               Output type if adctovolt=True (Default=np.float64,
+               np.float32 to reduce memory)
+
+          sample_range: tuple (optional)
+               (start, stop) samples window, only these
+               samples are read (default: all samples)
           
           memory_limit: Float
                Pulse data memory limit in GB
 
+          n_workers: integer
+               number of worker processes (default=1: no multiprocessing)
+               If >1, files are split across a process pool and
+               traces decoded directly in a shared memory block
  
 
 
         Return:
-         
+          events (see output_format) 
+          + list of metadata dict if include_metadata=True
         """
         
         # ---------------------
@@ -214,6 +845,11 @@ class H5Reader:
         # Set file lists
         # --------------------
 
+        # table output: metadata needed
+        read_metadata = include_metadata or output_format>2
+        if output_format==4 and pyarrow is None:
+            raise ValueError('Output format 4 requires "pyarrow" package!')
+
         #  set file list
         if filepath is not None:
             self.set_files(filepath)
@@ -229,45 +865,182 @@ class H5Reader:
         # Check data, output
         # dimension
         # --------------------
-        nb_events_tot = 0
-        nb_channels = 0
-        nb_samples = 0
-        array_indices = list()
+        read_info = self._get_read_info(adc_name=adc_name,
+                                        detector_chans=detector_chans,
+                                        nevents=nevents,
+                                        check_nb_samples=(output_format!=1),
+                                        sample_range=sample_range)
+        if read_info is None:
+            if include_metadata:
+                return [],[]
+            else:
+                return []
 
-        # loop files
-        for file in self._file_list:
+        file_info_list = read_info['file_info_list']
+        array_indices = read_info['array_indices']
+        nb_events_tot = read_info['nb_events']
+        nb_channels = read_info['nb_channels']
+        nb_samples = read_info['nb_samples']
+        
 
-            
-            metadata = self.get_metadata(file)
-            adc_metadata = metadata['groups'][adc_name]
-            
-            # channels
-            array_indices_file = list()
-            nb_channels_file = adc_metadata['nb_channels']
-            
-            if detector_chans is not None:
-                              
-                # available adc channels  
-                adc_chan_list = adc_metadata['adc_channel_indices']
-                if not isinstance(adc_chan_list, list) and not isinstance(adc_chan_list, np.ndarray):
-                    adc_chan_list = np.array([adc_chan_list])
-                    
 
-                # connections
-                connections = self.get_connection_dict(adc_name=adc_name, metadata=metadata)
-                                
-                # loop channels
-                chan_counter = 0
-                for chan_name in connections['detector_chans']:
-                    if chan_name in detector_chans:
-                        chan_adc = int(connections['adc_chans'][chan_counter])
-                        if chan_adc in adc_chan_list:
-                            ind = np.where(adc_chan_list==chan_adc)[0]
-                            if len(ind)==1:
-                                array_indices_file.append(int(ind))
-                            else:
-                                raise ValueError('Problem with raw data..')
-                    chan_counter+=1
+        
+        # ---------------------
+        # Memory check
+        # --------------------
+
+        
+        sample_bytes = 2
+        if adctovolt:
+            sample_bytes = np.dtype(volt_dtype).itemsize
+            
+        output_memory_per_event = sample_bytes*nb_samples*nb_channels/1e9
+        output_memory = nb_events_tot*output_memory_per_event
+        if output_memory>memory_limit:
+            nb_events_tot_temp = int(round(memory_limit/output_memory_per_event))
+            print('WARNING: Max number events based on memory limit of ' + str(memory_limit) + 'GB is ' +
+                  str(nb_events_tot_temp) + ' out of ' + str(nb_events_tot) +'!')
+            print('Use "iter_batches" to read all events in batches')
+            nb_events_tot = nb_events_tot_temp
+
+    
+        # ---------------------
+        # Initialize output
+        # --------------------
+              
+        output_data = list()
+        info_list = list()
+        output_dtype = np.int16
+        if adctovolt:
+            output_dtype = volt_dtype
+
+        # parallel read only if multiple files
+        do_parallel = (n_workers>1 and len(file_info_list)>1)
+        
+        if output_format!=1 and not do_parallel:
+            output_data = np.zeros((nb_events_tot,nb_channels,nb_samples),dtype=output_dtype)
+            
+        
+
+        # ---------------------
+        # Loop files and read
+        # events
+        # --------------------
+        event_counter = 0
+        if do_parallel:
+            output_data, info_list = self._read_files_parallel(
+                file_info_list, nb_events_tot,
+                (nb_events_tot,nb_channels,nb_samples),
+                output_dtype, n_workers,
+                adc_name=adc_name,
+                array_indices=array_indices,
+                adctovolt=adctovolt,
+                include_metadata=read_metadata,
+                volt_dtype=volt_dtype,
+                sample_range=sample_range)
+            event_counter = output_data.shape[0]
+            if output_format==1:
+                output_data = [output_data[ievent] for ievent in range(event_counter)]
+
+        else:
+            for file_info in file_info_list:
+
+                # check if done
+                if event_counter>=nb_events_tot:
+                    break
+
+                # read events
+                nb_events_file = min(file_info['nb_events'], nb_events_tot-event_counter)
+                nb_events_read = self._read_file_events(file_info, nb_events_file,
+                                                        output_data, event_counter,
+                                                        adc_name=adc_name,
+                                                        array_indices=array_indices,
+                                                        adctovolt=adctovolt,
+                                                        info_list=info_list,
+                                                        include_metadata=read_metadata,
+                                                        volt_dtype=volt_dtype,
+                                                        sample_range=sample_range)
+                event_counter += nb_events_read
+
+                # check if reading error
+                if nb_events_read<nb_events_file:
+                    break
+
+        # remove unfilled events (reading error)
+        if output_format!=1 and event_counter<nb_events_tot:
+            output_data = output_data[:event_counter,:,:]
+
+        # table output
+        if output_format==3:
+            output_data = events_to_dataframe(output_data, info_list)
+        elif output_format==4:
+            output_data = events_to_arrow_table(output_data, info_list)
+            
+          
+        if include_metadata:
+            return output_data, info_list
+
+        return output_data
+        
+        
+        
+
+    def _get_read_info(self, adc_name='adc1', detector_chans=None, nevents=0,
+                       check_nb_samples=True, sample_range=None):
+        """
+        Get metadata, connections, selected channels indices
+        and number of events of each file in file list (metadata 
+        decoded once per file). Check consistency between files.
+
+        Return:
+          read_info: dict (None if error)
+        """
+
+        # ---------------------
+        # Check data, output
+        # dimension
+        # --------------------
+        nb_events_tot = 0
+        nb_channels = 0
+        nb_samples = 0
+        array_indices = list()
+
+        # file info (metadata decoded once per file)
+        file_info_list = list()
+        
+        # loop files
+        for file in self._file_list:
+
+            
+            metadata = self._get_metadata(file)
+            adc_metadata = metadata['groups'][adc_name]
+
+            # connections
+            connections = self.get_connection_dict(adc_name=adc_name, metadata=metadata)
+            
+            # channels
+            array_indices_file = list()
+            nb_channels_file = adc_metadata['nb_channels']
+            
+            if detector_chans is not None:
+                              
+                # available adc channels  
+                adc_chan_list = adc_metadata['adc_channel_indices']
+                if not isinstance(adc_chan_list, list) and not isinstance(adc_chan_list, np.ndarray):
+                    adc_chan_list = np.array([adc_chan_list])
+                    
+                # loop channels
+                chan_counter = 0
+                for chan_name in connections['detector_chans']:
+                    if chan_name in detector_chans:
+                        chan_adc = int(connections['adc_chans'][chan_counter])
+                        if chan_adc in adc_chan_list:
+                            ind = np.where(adc_chan_list==chan_adc)[0]
+                            if len(ind)==1:
+                                array_indices_file.append(int(ind[0]))
+                            else:
+                                raise ValueError('Problem with raw data..')
+                    chan_counter+=1
                             
                 nb_channels_file = len(array_indices_file)
                 if (nb_channels_file==0):
@@ -276,10 +1049,7 @@ class H5Reader:
                         raise ValueError(error_msg)
                     else:
                         print('ERROR: ' + error_msg)
-                        if include_metadata:
-                            return [],[]
-                        else:
-                            return []
+                        return None
                 else:
                     array_indices_file.sort()
 
@@ -300,30 +1070,45 @@ class H5Reader:
                     raise ValueError(error_msg)
                 else:
                     print('ERROR: ' + error_msg)
-                    if include_metadata:
-                        return [],[]
-                    else:
-                        return []
+                    return None
 
             
             # nb events
             nb_events_tot += adc_metadata['nb_events']
 
+            # store file info
+            file_info = dict()
+            file_info['file_name'] = file
+            file_info['nb_events'] = adc_metadata['nb_events']
+            file_info['adc_metadata'] = adc_metadata
+            file_info['connections'] = connections
+            file_info['series_num'] = metadata.get('series_num', None)
+            file_info_list.append(file_info)
+
             # number of samples
             nb_samples_file = adc_metadata['nb_samples']   
+            if sample_range is not None:
+                if (sample_range[0]<0 or sample_range[1]>nb_samples_file
+                    or sample_range[0]>=sample_range[1]):
+                    error_msg = ('Sample range ' + str(sample_range) 
+                                 + ' not compatible with number of samples ('
+                                 + str(nb_samples_file) + ')!')
+                    if self._raise_errors:
+                        raise ValueError(error_msg)
+                    else:
+                        print('ERROR: ' + error_msg)
+                        return None
+                nb_samples_file = int(sample_range[1]-sample_range[0])
             if nb_samples==0:
                 nb_samples =  nb_samples_file
-            elif  output_format!=1 and nb_samples_file!=nb_samples:
+            elif check_nb_samples and nb_samples_file!=nb_samples:
                 error_msg = 'Unable to return 3D arrray due to inconsistent nb of samples!'
                 if self._raise_errors:
                     raise ValueError(error_msg)
                 else:
                     print('ERROR: ' + error_msg)
                     print('Use output=1 (event list) instead or check files')
-                    if include_metadata:
-                        return [],[]
-                    else:
-                        return []
+                    return None
 
             # check max events
             if nevents>0  and nb_events_tot>=nevents:
@@ -334,108 +1119,933 @@ class H5Reader:
         # clear
         self.clear()
 
+        read_info = dict()
+        read_info['file_info_list'] = file_info_list
+        read_info['array_indices'] = array_indices
+        read_info['nb_events'] = nb_events_tot
+        read_info['nb_channels'] = nb_channels
+        read_info['nb_samples'] = nb_samples
         
-        # ---------------------
-        # Memory check
-        # --------------------
+        return read_info
+
+    
+
+    def _read_files_parallel(self, file_info_list, nb_events_tot, shape, dtype,
+                             n_workers, adc_name='adc1', array_indices=None,
+                             adctovolt=False, include_metadata=False,
+                             volt_dtype=np.float64, sample_range=None):
+        """
+        Read events from multiple files using a process pool. Each
+        worker decodes its files directly into a shared memory block.
+
+        Return:
+          output_data: 3D ndarray
+          info_list: list of dict
+        """
+
+        # tasks (one per file)
+        read_args = {'adc_name': adc_name,
+                     'array_indices': array_indices,
+                     'adctovolt': adctovolt,
+                     'include_metadata': include_metadata,
+                     'volt_dtype': volt_dtype,
+                     'sample_range': sample_range}
+        task_list = list()
+        event_offset = 0
+        for file_info in file_info_list:
+            if event_offset>=nb_events_tot:
+                break
+            nb_events_file = min(file_info['nb_events'], nb_events_tot-event_offset)
+            task_list.append((file_info, nb_events_file, event_offset, read_args))
+            event_offset += nb_events_file
 
+            
+        # shared memory output
+        nb_bytes = max(1, int(np.prod(shape))*np.dtype(dtype).itemsize)
+        shm = shared_memory.SharedMemory(create=True, size=nb_bytes)
         
-        sample_bytes = 2
-        if adctovolt:
-            sample_bytes = 8
+        info_list = list()
+        event_counter = 0
+        try:
+            output_shared = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+            # read
+            task_args = [task + (shm.name, shape, dtype, self._file_options)
+                         for task in task_list]
+            with ProcessPoolExecutor(max_workers=n_workers) as executor:
+                results = list(executor.map(_read_file_events_worker, task_args))
+
+            # stop at first incomplete file (same as serial read)
+            for task, result in zip(task_list, results):
+                nb_events_read, info_list_file = result
+                event_counter += nb_events_read
+                info_list.extend(info_list_file)
+                if nb_events_read<task[1]:
+                    print('ERROR: Unable to read all events from file '
+                          + task[0]['file_name'])
+                    break
+
+            output_data = output_shared[:event_counter].copy()
+            del output_shared
             
-        output_memory_per_event = sample_bytes*nb_samples*nb_channels/1e9
-        output_memory = nb_events_tot*output_memory_per_event
-        if output_memory>memory_limit:
-            nb_events_tot_temp = int(round(memory_limit/output_memory_per_event))
-            print('WARNING: Max number events based on memory limit of ' + str(memory_limit) + 'GB is ' +
-                  str(nb_events_tot_temp) + ' out of ' + str(nb_events_tot) +'!')
-            nb_events_tot = nb_events_tot_temp
+        finally:
+            shm.close()
+            shm.unlink()
 
+        return output_data, info_list
     
-        # ---------------------
-        # Initialize output
-        # --------------------
-              
-        output_data = list()
-        info_list = list()
-     
-        if output_format==2:
-            if adctovolt:
-                output_data = np.zeros((nb_events_tot,nb_channels,nb_samples),dtype=np.float64)
-            else:
-                output_data = np.zeros((nb_events_tot,nb_channels,nb_samples),dtype=np.int16)
+        
+
+    def _read_file_events(self, file_info, nb_events, output_data, event_offset,
+                          adc_name='adc1', array_indices=None, adctovolt=False,
+                          info_list=None, include_metadata=False,
+                          event_start=0, close_file=True,
+                          volt_dtype=np.float64, sample_range=None):
+        """
+        Read consecutive events from a single file. File and
+        ADC group metadata are decoded once for the whole file,
+        dataset metadata only if requested.
+
+        Args:
+          file_info: dict
+               file name, ADC metadata and connections (from read_many_events)
+
+          nb_events: integer
+               number of events to read
+
+          output_data: list or 3D ndarray
+               output container. If ndarray, events are stored
+               starting at index "event_offset"
+
+          event_offset: integer
+               output array index of first event 
+
+          event_start: integer
+               index of first event to read in file (default=0)
+
+          close_file: bool
+               close file when done (default=True)
+
+          volt_dtype: numpy dtype
+               output type if list output and adctovolt=True
+
+          sample_range: tuple (optional)
+               (start, stop) samples window (default: all samples)
+        
+        Return:
+          nb_events_read: integer
+        """
+
+        nb_events_read = 0
+        
+        # open file if needed (metadata already available)
+        if (self._current_file is None
+            or self._current_file_name!=file_info['file_name']):
+            self._open_file(file_info['file_name'], load_metadata=False)
+        if self._current_file is None:
+            return nb_events_read
+
+        group = self._current_file[adc_name]
+        adc_metadata = file_info['adc_metadata']
+        is_array = isinstance(output_data, np.ndarray)
+        is_packed = _is_packed(group)
+        
+        # channel selection
+        nb_channels_file = adc_metadata['nb_channels']
+        do_select_chans = (array_indices is not None
+                           and len(array_indices)>0
+                           and len(array_indices)!=nb_channels_file)
+
+        # calibration coefficients (per file)
+        coeffs = None
+        if adctovolt:
+            chan_indices = array_indices
+            if not chan_indices:
+                chan_indices = list(range(nb_channels_file))
+            coeffs = calibration_utils.get_calibration_coeffs(
+                adc_metadata['adc_conversion_factor'], chan_indices)
+
+        # group info (same for all events of the file)
+        group_info = dict()
+        if include_metadata:
+            group_info = dict(self._get_group_attrs(adc_name))
+            connections = file_info['connections']
+            for key in ['detector_chans','tes_chans','controller_chans']:
+                if array_indices:
+                    group_info[key] = [connections[key][i] for i in array_indices]
+                else:
+                    group_info[key] = list(connections[key])
+            group_info['file_name'] = file_info['file_name']
+            if file_info.get('series_num') is not None:
+                group_info['series_num'] = file_info['series_num']
             
+
+        # hyperslab selection (only selected channels/samples read from disk)
+        chan_sel = slice(None)
+        nb_channels_read = nb_channels_file
+        if do_select_chans:
+            chan_sel = _get_index_selection(array_indices)
+            nb_channels_read = len(array_indices)
+        
+        sample_sel = _get_sample_selection(sample_range)
+        nb_samples_read = len(range(*sample_sel.indices(adc_metadata['nb_samples'])))
+        source_sel = np.s_[chan_sel, sample_sel]
         
 
-        # ---------------------
-        # Loop and read events
-        # --------------------
-        for ievent in range(nb_events_tot):
+        # read buffer (block of events)
+        array_int = None
+        block_size = max(1, nb_events)
+        if adctovolt or not is_array or not output_data.flags['C_CONTIGUOUS']:
+            event_bytes = 2*nb_channels_read*nb_samples_read
+            block_size = max(1, min(nb_events, int(self._read_block_memory//max(1,event_bytes))))
+            array_int = np.zeros((block_size, nb_channels_read, nb_samples_read), dtype=np.int16)
             
-            # read event
-            array_int, info = self.read_event(include_metadata=True)
 
-            # add connections to metadata
-            connections = self.get_connection_dict(adc_name=adc_name, metadata=info)
-            info['detector_chans'] = [connections['detector_chans'][i] for i in array_indices]
-            info['tes_chans'] = [connections['tes_chans'][i] for i in array_indices]
-            info['controller_chans'] = [connections['controller_chans'][i] for i in array_indices]
+        # loop blocks of events
+        for block_start in range(0, nb_events, block_size):
+
+            block_end = min(block_start+block_size, nb_events)
+            
+            # packed layout: single hyperslab read for whole block
+            if is_packed:
+                nb_events_block = self._read_packed_block(
+                    group, event_start+block_start, event_start+block_end,
+                    source_sel, array_int, output_data, event_offset+block_start,
+                    adc_name, group_info, info_list, include_metadata)
+                
+            # read events (directly in output array if possible)
+            else:
+                nb_events_block = self._read_event_datasets(
+                    group, event_start+block_start, event_start+block_end,
+                    source_sel, array_int, output_data, event_offset+block_start,
+                    group_info, info_list, include_metadata)
+
+                
+            # conversion (whole block)
+            if array_int is not None and nb_events_block>0:
+                
+                block = array_int[:nb_events_block]
+                if is_array:
+                    output_index = event_offset + block_start
+                    output_block = output_data[output_index:output_index+nb_events_block]
+                    if adctovolt:
+                        calibration_utils.adc_to_volt(block, coeffs, out=output_block)
+                    else:
+                        output_block[...] = block
+                else:
+                    if adctovolt:
+                        block = calibration_utils.adc_to_volt(block, coeffs, dtype=volt_dtype)
+                    else:
+                        block = block.copy()
+                    output_data.extend(list(block))
+                    
+            nb_events_read += nb_events_block
+            if nb_events_block<block_end-block_start:
+                break
+            
+
+        # close file
+        if close_file:
+            self._close_file()
+        
+        return nb_events_read
+        
+        
+        
             
             
+        
+
+    def _read_event_datasets(self, group, event_start, event_stop, source_sel,
+                             array_int, output_data, output_index, group_info,
+                             info_list, include_metadata):
+        """
+        Read events [event_start, event_stop[ stored as one dataset
+        per event ("event_N") into staging array if provided, 
+        otherwise directly into output array
+
+        Return:
+          nb_events_read: integer
+        """
+
+        nb_events_read = 0
+        for event_index in range(event_start, event_stop):
+            
+            dataset_name = 'event_' + str(event_index+1)
+            if dataset_name not in group:
+                break
+            dataset = group[dataset_name]
+
+            if array_int is None:
+                dataset.read_direct(output_data[output_index+nb_events_read],
+                                    source_sel=source_sel)
+            else:
+                dataset.read_direct(array_int[nb_events_read],
+                                    source_sel=source_sel)
+
+            # metadata
             if include_metadata:
+                info = self._extract_metadata(dataset.attrs)
+                info.update(group_info)
                 info_list.append(info)
+                
+            nb_events_read += 1
+
+        return nb_events_read
+
+
+    
+    def _read_packed_block(self, group, event_start, event_stop, source_sel,
+                           array_int, output_data, output_index, adc_name,
+                           group_info, info_list, include_metadata):
+        """
+        Read events [event_start, event_stop[ from packed layout
+        [event, chan, sample] dataset with a single hyperslab read
+
+        Return:
+          nb_events_read: integer
+        """
+
+        dataset = group[PACKED_DATASET_NAME]
+        event_stop = min(event_stop, dataset.shape[0])
+        nb_events_read = max(0, event_stop-event_start)
+        if nb_events_read==0:
+            return nb_events_read
+
+        if array_int is None:
+            target = output_data[output_index:output_index+nb_events_read]
+        else:
+            target = array_int[:nb_events_read]
+        _read_packed_data(dataset, slice(event_start, event_stop),
+                          source_sel[0], source_sel[1], target)
+
+        # metadata
+        if include_metadata:
+            for event_index in range(event_start, event_stop):
+                info = self._get_packed_event_attrs(adc_name, event_index)
+                info.update(group_info)
+                info_list.append(info)
+
+        return nb_events_read
+    
+
+
+    def _get_packed_event_attrs(self, adc_name, event_index):
+        """
+        Get event metadata from columnar per-event attributes
+        of packed layout (columns loaded once per file)
+        """
+        
+        if adc_name not in self._current_file_event_attrs:
+            self._current_file_event_attrs[adc_name] = _read_packed_attrs(
+                self._current_file[adc_name])
+
+        info = dict()
+        for key, column in self._current_file_event_attrs[adc_name].items():
+            info[key] = column[event_index]
+        return info
+
+
+    
+    def as_array(self, filepath=None, adc_name='adc1', adctovolt=False,
+                 volt_dtype=np.float64, cache_size=256):
+        """
+        Get lazy [event, channel, sample] array view of all events
+        in file list. Only sliced events/channels/samples are read 
+        from disk.
+
+        Args:
+          filepath: string or list  
+               file/path or list of files/paths (default: use current file list)
+
+          adc_name: string
+              ADC id (default: 'adc1')
+
+          adctovolt: Bool
+               Convert  from ADC to volt (Default=False) 
+
+          volt_dtype: numpy dtype
+               Output type if adctovolt=True (Default=np.float64)
+
+          cache_size: Float
+               chunk cache size in MB (default: 256MB)
+
+        Return:
+          EventArray object
+        """
+
+        #  set file list
+        if filepath is not None:
+            self.set_files(filepath)
+
+        if not self._file_list:
+            error_msg = 'No file available!'
+            if self._raise_errors:
+                raise ValueError(error_msg)
+            else:
+                print('ERROR: ' + error_msg)
+                return None
             
+        return EventArray(self._file_list, adc_name=adc_name,
+                          adctovolt=adctovolt, volt_dtype=volt_dtype,
+                          cache_size=cache_size,
+                          raise_errors=self._raise_errors)
+        
+        
+        
+
+    def iter_batches(self, batch_size, filepath=None, nevents=0,
+                     include_metadata=False,
+                     adc_name='adc1',
+                     detector_chans=None,
+                     adctovolt=False,
+                     volt_dtype=np.float64,
+                     sample_range=None,
+                     reuse_buffer=False):
+        """
+        Generator reading all events in batches of fixed size
+        (bounded memory, no "memory_limit" truncation). 
+        
+        Args:
+          batch_size: integer
+               number of events per batch (last batch may be smaller)
+
+          filepath: string or list  
+               file/path or list of files/paths (default: use current file list)
+          
+          nevents: integer
+               number of events to read  (default nb_events=0 -> all events)
+
+          include_metadata: bool 
+               include file/group/dataset metadata (default = False)
+
+          adc_name: string
+              ADC id (default: 'adc1')
+
+          detector_chans: string/int or list of string/int
+               detector channel name (example 'Z1PAS1', 'PD2', or 1) following format in setup.ini file
+               If none, all channels available 
+
+          adctovolt: Bool
+               Convert  from ADC to volt (Default=False) 
+
+          volt_dtype: numpy dtype
+               Output type if adctovolt=True (Default=np.float64)
+
+          sample_range: tuple (optional)
+               (start, stop) samples window (default: all samples)
+
+          reuse_buffer: Bool
+               If True, the same output array is filled for all batches 
+               (caller needs to copy data to keep it after next iteration).
+               Default=False: new array for each batch 
+      
+        Yield:
+          3D ndarray[event, chan, samples]
+          + list of metadata dict if include_metadata=True
+        """
+
+        #  set file list
+        if filepath is not None:
+            self.set_files(filepath)
+
+        # detector/channel
+        if detector_chans is not None and not isinstance(detector_chans, list):
+            detector_chans = [detector_chans]
+
+        if batch_size<1:
+            raise ValueError('Batch size should be at least 1!')
+
+        # files info
+        read_info = self._get_read_info(adc_name=adc_name,
+                                        detector_chans=detector_chans,
+                                        nevents=nevents,
+                                        check_nb_samples=True,
+                                        sample_range=sample_range)
+        if read_info is None:
+            return
+
+        nb_events_tot = read_info['nb_events']
+        array_indices = read_info['array_indices']
+        output_shape = (batch_size, read_info['nb_channels'], read_info['nb_samples'])
+        output_dtype = np.int16
+        if adctovolt:
+            output_dtype = volt_dtype
+
+        # loop files and fill batches
+        output_data = None
+        info_list = list()
+        nb_events_batch = 0
+        event_counter = 0
+        read_error = False
+        for file_info in read_info['file_info_list']:
+
+            nb_events_file = min(file_info['nb_events'], nb_events_tot-event_counter)
+            event_start = 0
+            while event_start<nb_events_file:
+
+                # new batch
+                if output_data is None or (nb_events_batch==0 and not reuse_buffer):
+                    output_data = np.zeros(output_shape, dtype=output_dtype)
+
+                nb_events_read = min(batch_size-nb_events_batch, nb_events_file-event_start)
+                nb_events_done = self._read_file_events(file_info, nb_events_read,
+                                                        output_data, nb_events_batch,
+                                                        adc_name=adc_name,
+                                                        array_indices=array_indices,
+                                                        adctovolt=adctovolt,
+                                                        info_list=info_list,
+                                                        include_metadata=include_metadata,
+                                                        event_start=event_start,
+                                                        close_file=False,
+                                                        volt_dtype=volt_dtype,
+                                                        sample_range=sample_range)
+                event_start += nb_events_done
+                event_counter += nb_events_done
+                nb_events_batch += nb_events_done
                 
-            # check if reading error
-            if isinstance(array_int, str):
+                if nb_events_done<nb_events_read:
+                    print('ERROR: Unable to read all events from file '
+                          + file_info['file_name'])
+                    read_error = True
+                    break
+                
+                # yield full batch
+                if nb_events_batch==batch_size:
+                    self._close_file()
+                    if include_metadata:
+                        yield output_data, info_list
+                    else:
+                        yield output_data
+                    nb_events_batch = 0
+                    info_list = list()
+
+            self._close_file()
+            if read_error or event_counter>=nb_events_tot:
                 break
 
+        # last (partial) batch
+        if nb_events_batch>0:
+            if include_metadata:
+                yield output_data[:nb_events_batch], info_list
+            else:
+                yield output_data[:nb_events_batch]
+            
+
+
+    def read_pulse_windows(self, pre_trigger, post_trigger, trigger_index=None,
+                           filepath=None, nevents=0, output_format=2,
+                           include_metadata=False,
+                           adc_name='adc1',
+                           detector_chans=None,
+                           adctovolt=False,
+                           volt_dtype=np.float64,
+                           memory_limit=2,
+                           n_workers=1):
+        """
+        Read sample window around trigger: [trigger_index-pre_trigger, 
+        trigger_index+post_trigger[. Only window samples are read 
+        from disk (see read_many_events "sample_range").
+
+        Args:
+          pre_trigger: integer
+               number of samples before trigger
+
+          post_trigger: integer
+               number of samples after trigger (including trigger sample)
+
+          trigger_index: integer (optional)
+               trigger sample index. Default: ADC group "trigger_index" 
+               attribute if available, otherwise middle of trace
+
+          other arguments: see read_many_events
+      
+        Return:
+          same as read_many_events
+        """
 
-            # reshape with only selected events
-            if len(array_indices)!=array_int.shape[0] and array_indices:
-                array_int = array_int[array_indices,:]
+        #  set file list
+        if filepath is not None:
+            self.set_files(filepath)
 
+        if not self._file_list:
+            error_msg = 'No file available!'
+            if self._raise_errors:
+                raise ValueError(error_msg)
+            print('ERROR: ' + error_msg)
+            if include_metadata:
+                return [],[]
+            return []
             
-            # convert to volt
-            array = []
-            if adctovolt:
-                array = np.zeros_like(array_int, dtype=np.float64)
-                for ichan in range(array_int.shape[0]):
-                    icoeff = ichan
-                    if array_indices:
-                        icoeff = array_indices[ichan]
-                    cal_coeff = info['adc_conversion_factor'][icoeff][::-1]
-                    poly = np.poly1d(cal_coeff)
-                    array[ichan,:] = poly(array_int[ichan,:])
+        # trigger index
+        if trigger_index is None:
+            adc_metadata = self._get_metadata(self._file_list[0], group_name=adc_name)
+            if 'trigger_index' in adc_metadata:
+                trigger_index = int(adc_metadata['trigger_index'])
+            elif 'nb_samples' in adc_metadata:
+                trigger_index = int(adc_metadata['nb_samples'])//2
             else:
-                array = array_int 
-                    
+                error_msg = 'Unable to find trigger index. Please provide "trigger_index"!'
+                if self._raise_errors:
+                    raise ValueError(error_msg)
+                print('ERROR: ' + error_msg)
+                if include_metadata:
+                    return [],[]
+                return []
+
+        sample_range = (int(trigger_index)-int(pre_trigger),
+                        int(trigger_index)+int(post_trigger))
+
+        return self.read_many_events(nevents=nevents, output_format=output_format,
+                                     include_metadata=include_metadata,
+                                     adc_name=adc_name,
+                                     detector_chans=detector_chans,
+                                     adctovolt=adctovolt,
+                                     volt_dtype=volt_dtype,
+                                     sample_range=sample_range,
+                                     memory_limit=memory_limit,
+                                     n_workers=n_workers)
+        
+    
+
+    def read_envelope(self, nb_points, filepath=None, nevents=0,
+                      include_metadata=False,
+                      adc_name='adc1',
+                      detector_chans=None,
+                      adctovolt=False,
+                      volt_dtype=np.float64,
+                      sample_range=None):
+        """
+        Read min/max envelope of traces decimated to "nb_points"
+        (quick-look plots). Events are read and decimated by blocks
+        (bounded memory), only envelopes are stored.
+
+        Args:
+          nb_points: integer
+               number of points of decimated traces (min/max of 
+               nb_samples/nb_points consecutive samples), no 
+               decimation if nb_points>=nb_samples
+
+          other arguments: see read_many_events
+      
+        Return:
+          envelope_min: 3D ndarray [event, chan, nb_points]
+          envelope_max: 3D ndarray [event, chan, nb_points]
+          + list of metadata dict if include_metadata=True
+        """
+
+        if nb_points<1:
+            raise ValueError('Number of points should be at least 1!')
+
+        #  set file list
+        if filepath is not None:
+            self.set_files(filepath)
+
+        # batch size (block memory)
+        batch_size = 1
+        if self._file_list:
+            adc_metadata = self._get_metadata(self._file_list[0], group_name=adc_name)
+            if 'nb_samples' in adc_metadata and 'nb_channels' in adc_metadata:
+                event_bytes = 8*int(adc_metadata['nb_samples'])*int(adc_metadata['nb_channels'])
+                batch_size = max(1, int(self._read_block_memory//event_bytes))
+
+        # loop batches
+        min_list = list()
+        max_list = list()
+        info_list = list()
+        for batch in self.iter_batches(batch_size, nevents=nevents,
+                                       include_metadata=include_metadata,
+                                       adc_name=adc_name,
+                                       detector_chans=detector_chans,
+                                       adctovolt=adctovolt,
+                                       volt_dtype=volt_dtype,
+                                       sample_range=sample_range,
+                                       reuse_buffer=True):
+            if include_metadata:
+                batch, batch_info = batch
+                info_list.extend(batch_info)
+            envelope_min, envelope_max = get_envelope(batch, nb_points)
+            min_list.append(envelope_min)
+            max_list.append(envelope_max)
+
+        if not min_list:
+            envelope_min = np.zeros((0,0,0))
+            envelope_max = np.zeros((0,0,0))
+        else:
+            envelope_min = np.concatenate(min_list)
+            envelope_max = np.concatenate(max_list)
             
+        if include_metadata:
+            return envelope_min, envelope_max, info_list
+        return envelope_min, envelope_max
+
+
+    
+    def follow(self, filepath, include_metadata=False, adc_name='adc1',
+               poll_interval=0.5, timeout=None, from_start=True,
+               settle_time=2, swmr=False, stop_event=None):
+        """
+        Live "follow" mode: generator yielding events from files 
+        still being written (e.g. by polaris). Data directory (or 
+        single file) is polled for new files and new events 
+        (growth of number of datasets).
+
+        Args:
+          filepath: string
+             data directory or file name
+
+          include_metadata: bool 
+             yield (array, info) instead of array (default = False)
+
+          adc_name: string
+             ADC id (default: 'adc1')
+
+          poll_interval: float
+             time (sec) between polls if no new events (default: 0.5)
+
+          timeout: float (optional)
+             stop if no new events for "timeout" seconds 
+             (default: None = never stop)
+
+          from_start: bool
+             True: read existing events, False: only events written
+             after call (default: True)
+
+          settle_time: float
+             last event of file being written is read only if file 
+             not modified for "settle_time" seconds or a next event/file 
+             exists (partially written event). Not used if swmr=True.
+
+          swmr: bool
+             open files in SWMR read mode (file written with SWMR)
+
+          stop_event: threading.Event (optional)
+             stop following when set
+
+        Note: 
+          Without SWMR (polaris does not write in SWMR mode), polling
+          is best-effort: HDF5 metadata may be read while being updated
+          by the writer. A failed read is retried at the next poll
+          and following files are not read until all events of the
+          file have been read (events yielded in order). A file is 
+          done only when all its events have been read and a newer 
+          file exists (writer closed it).
+
+        Yield:
+          2D ndarray [chan, sample] or (2D ndarray, info dict)
+          (file name of last event: get_current_file_name())
+        """
+
+        # close current file (sequential reading)
+        self._close_file()
+        
+        nb_events_read = dict()
+        complete_file_list = list()
+        last_event_time = time.time()
+
+        # skip existing events
+        if not from_start:
+            for file_name in self._get_follow_file_list(filepath):
+                nb_events_read[file_name] = self._get_follow_nb_events(
+                    file_name, adc_name, swmr)
+
+        # loop polls
+        while stop_event is None or not stop_event.is_set():
+
+            file_list = self._get_follow_file_list(filepath)
+            nb_new_events = 0
             
-            # store
-            if (output_format==1 or output_format==3):
-                output_data.append(array)
+            for ifile, file_name in enumerate(file_list):
+
+                if file_name in complete_file_list:
+                    continue
+
+                # newer file exists -> writer done with this file
+                is_complete = ifile<len(file_list)-1
+                
+                # read new events
+                status = dict()
+                for output in self._read_follow_events(
+                        file_name, adc_name, nb_events_read.get(file_name, 0),
+                        include_metadata, is_complete or swmr, settle_time, swmr,
+                        status=status):
+                    nb_events_read[file_name] = nb_events_read.get(file_name, 0) + 1
+                    nb_new_events += 1
+                    self._current_file_name = file_name
+                    yield output
+                    if stop_event is not None and stop_event.is_set():
+                        return
+
+                # read failed (file being updated) -> retry next poll,
+                # newer files not read before this one is done
+                if not status.get('done', False):
+                    break
+                    
+                if is_complete:
+                    complete_file_list.append(file_name)
+                    
+            # wait
+            if nb_new_events>0:
+                last_event_time = time.time()
             else:
-                output_data[ievent,:,:] = array
+                if timeout is not None and time.time()-last_event_time>timeout:
+                    return
+                time.sleep(poll_interval)
                 
-          
-        if include_metadata:
-            return output_data, info_list
 
-        return output_data
+
+    def _get_follow_file_list(self, filepath):
+        """
+        Sorted list of files in directory (or single file) 
+        """
+        if os.path.isdir(filepath):
+            return sorted(glob(os.path.join(filepath, '*.hdf5')))
+        elif os.path.isfile(filepath):
+            return [filepath]
+        return list()
+
+
+    
+    def _open_follow_file(self, file_name, swmr=False):
+        """
+        Open file being written: no file locking (writer holds
+        lock), fresh view of file at each open
+        """
+        try:
+            return h5py.File(file_name, 'r', swmr=swmr, locking=False,
+                             **self._file_options)
+        except TypeError:
+            # h5py<3.5: no locking argument
+            return h5py.File(file_name, 'r', swmr=swmr, **self._file_options)
+
         
+
+    def _get_follow_nb_events(self, file_name, adc_name, swmr=False):
+        """
+        Number of events currently available in a file
+        """
+        try:
+            with self._open_follow_file(file_name, swmr) as file:
+                if adc_name not in file:
+                    return 0
+                group = file[adc_name]
+                if _is_packed(group):
+                    return group[PACKED_DATASET_NAME].shape[0]
+                nb_events = 0
+                while 'event_' + str(nb_events+1) in group:
+                    nb_events += 1
+                return nb_events
+        except Exception:
+            return 0
+
         
+
+    def _read_follow_events(self, file_name, adc_name, event_start,
+                            include_metadata, read_last_event,
+                            settle_time, swmr=False, status=None):
+        """
+        Generator: read events available in file being written,
+        starting at index event_start. File is closed between polls.
+        status['done'] set to True if all available events have 
+        been read (False if file could not be read)
+        """
+
+        if status is None:
+            status = dict()
+        status['done'] = False
         
+        try:
+            file = self._open_follow_file(file_name, swmr)
+        except Exception as e:
+            # file being created/flushed -> next poll
+            if self._verbose:
+                print('WARNING: Unable to open ' + file_name + ' (' + str(e)
+                      + '), retrying...')
+            return
+
+        try:
+            if adc_name not in file:
+                status['done'] = True
+                return
+            group = file[adc_name]
+            group_attrs = None
+            packed_attrs = None
+            is_packed = _is_packed(group)
+
+            # number of events available
+            if is_packed:
+                nb_events = group[PACKED_DATASET_NAME].shape[0]
+            else:
+                nb_events = event_start
+                while 'event_' + str(nb_events+1) in group:
+                    nb_events += 1
+
+            # last event possibly partially written
+            if (not read_last_event and nb_events>event_start
+                and time.time()-os.path.getmtime(file_name)<settle_time):
+                nb_events -= 1
             
+            for event_index in range(event_start, nb_events):
+
+                if is_packed:
+                    dataset = group[PACKED_DATASET_NAME]
+                    array = np.zeros(dataset.shape[1:], dtype=np.int16)
+                    _read_packed_data(dataset, event_index, slice(None),
+                                      slice(None), array)
+                else:
+                    dataset = group['event_' + str(event_index+1)]
+                    array = np.zeros(dataset.shape, dtype=np.int16)
+                    dataset.read_direct(array)
+
+                if not include_metadata:
+                    yield array
+                    continue
+
+                if is_packed:
+                    if packed_attrs is None:
+                        packed_attrs = _read_packed_attrs(group)
+                    info = dict()
+                    for key, column in packed_attrs.items():
+                        info[key] = column[event_index]
+                else:
+                    info = self._extract_metadata(dataset.attrs)
+                if group_attrs is None:
+                    group_attrs = self._extract_metadata(group.attrs)
+                info.update(group_attrs)
+                yield array, info
+
+            status['done'] = True
             
-        
+        except (OSError, KeyError, RuntimeError) as e:
+            # partially written file -> next poll
+            if self._verbose:
+                print('WARNING: Unable to read ' + file_name + ' (' + str(e)
+                      + '), retrying...')
+        finally:
+            file.close()
 
+        
+    
     def get_current_file_name(self):
         return self._current_file_name
         
 
 
+    def get_follow_metadata(self, file_name, swmr=False):
+        """
+        Metadata (file/groups, no dataset metadata) of a file 
+        being written (follow mode): opened without file locking,
+        not cached. Best-effort without SWMR: may raise if
+        file metadata being updated (retry later)
+
+        Return:
+          metadata_dict: dict
+        """
+        with self._open_follow_file(file_name, swmr) as file:
+            return self._read_file_metadata(file, False)
+
+
+
     
     def get_metadata(self, file_name=None, group_name=None, dataset_name=None, 
                      include_dataset_metadata=False):
@@ -455,11 +2065,49 @@ class H5Reader:
              H5 "Dataset" name
          
         Returns:
-          metadata: dict
+          metadata: dict (copy, decoded metadata cache
+                    not modified by caller)
+        """
+
+        return copy.deepcopy(self._get_metadata(
+            file_name=file_name, group_name=group_name, dataset_name=dataset_name,
+            include_dataset_metadata=include_dataset_metadata))
+
+
+
+    def _get_metadata(self, file_name=None, group_name=None, dataset_name=None, 
+                      include_dataset_metadata=False):
+        """
+        Get metadata (see get_metadata), internal use: cached
+        metadata returned by reference (not to be modified)
         """
 
         metadata = dict()
 
+        # decoded metadata cache
+        if dataset_name is None and not include_dataset_metadata:
+            cache_file_name = file_name
+            if cache_file_name is None:
+                cache_file_name = self._current_file_name
+            metadata = self._get_cached(cache_file_name, 'metadata')
+            if metadata is not None:
+                if group_name is None:
+                    return metadata
+                elif group_name in metadata['group_list']:
+                    return metadata['groups'][group_name]
+                return dict()
+            metadata = dict()
+            
+        # use run catalog if available
+        if (file_name is not None and self._catalog is not None
+            and dataset_name is None and not include_dataset_metadata):
+            metadata = self._catalog.get_metadata(file_name)
+            if metadata:
+                if group_name is None:
+                    return metadata
+                elif group_name in metadata['group_list']:
+                    return metadata['groups'][group_name]
+                return dict()
         
         # check input 
         if file_name is None and self._current_file is None:
@@ -471,6 +2119,26 @@ class H5Reader:
                 print('Please open a file or provide a file name!')
                 return metadata
 
+        # load metadata (if "dataset" metadata requested -> reload)
+        if dataset_name is not None:
+            include_dataset_metadata = True
+
+            
+        # file other than current file and open files pool enabled:
+        # read metadata without changing current file
+        if (file_name is not None and self._max_open_files>0
+            and self._current_file_name != file_name):
+            try:
+                file = self._get_file_handle(file_name)
+            except:
+                print('ERROR: unable to open file ' + file_name)
+                return metadata
+            metadata_dict = self._read_file_metadata(file, include_dataset_metadata)
+            if not include_dataset_metadata:
+                self._set_cached(file_name, 'metadata', metadata_dict)
+            return self._select_metadata(metadata_dict, group_name, dataset_name)
+            
+            
         # open file if needed
         if file_name is not None and self._current_file_name != file_name:
             
@@ -481,30 +2149,16 @@ class H5Reader:
             self._open_file(file_name, load_metadata=False)
             
 
-        # load metadata (if "dataset" metadata requested -> reload)
-        if dataset_name is not None:
-            include_dataset_metadata = True
-
         if not self._current_file_metadata or include_dataset_metadata:
             self._load_metadata(include_dataset_metadata)
                 
             
         # find specific metadata
-        metadata = dict()
-        if group_name is not None:
-            if group_name in self._current_file_metadata['group_list']:
-                group_metadata = self._current_file_metadata['groups'][group_name]
-                if dataset_name is not None:
-                    if dataset_name in group_metadata['dataset_list']:
-                        metadata = group_metadata['datasets'][dataset_name]
-                else:
-                    metadata = group_metadata
-        else:
-            metadata = self._current_file_metadata
+        metadata = self._select_metadata(self._current_file_metadata,
+                                         group_name, dataset_name)
 
-
-        # close file
-        if file_name is not None:
+        # close file (kept open if open files pool enabled)
+        if file_name is not None and self._max_open_files==0:
             self._close_file()
         
 
@@ -514,7 +2168,7 @@ class H5Reader:
 
 
     def get_detector_config(self, file_name=None, adc_name='adc1',
-                            use_chan_dict=True):   
+                            use_chan_dict=True, metadata=None):   
         """
         Get detector configuration
         """
@@ -522,7 +2176,8 @@ class H5Reader:
         detector_config = dict()
         
         # get metadata
-        metadata = self.get_metadata(file_name=file_name)
+        if metadata is None or 'group_list' not in metadata:
+            metadata = self.get_metadata(file_name=file_name)
     
 
         # config name
@@ -535,8 +2190,8 @@ class H5Reader:
             print('ERROR: unable to find detector config!')
             return []
 
-        # group metadata
-        detector_config_dict = metadata['groups'][config_name]
+        # group metadata (copy, metadata may be cached)
+        detector_config_dict = dict(metadata['groups'][config_name])
         #if 'adc_name' in detector_config_dict and adc_name!=detector_config_dict['adc_name']:
         #    print('ERROR: Unexpected detector configuration format!')
         #    return []
@@ -604,6 +2259,17 @@ class H5Reader:
         # initialize
         connection_dict=dict()
 
+        # cached
+        cache_file_name = None
+        if metadata is None:
+            cache_file_name = file_name
+            if cache_file_name is None:
+                cache_file_name = self._current_file_name
+            connection_dict = self._get_cached(cache_file_name, ('connections', adc_name))
+            if connection_dict is not None:
+                return {key: list(value) for key, value in connection_dict.items()}
+            connection_dict = dict()
+            
         # metadata
         adc_metadata = None
         if metadata is None or 'group_list' not in metadata:
@@ -618,7 +2284,7 @@ class H5Reader:
                     raise ValueError(error_msg)
             else:
                 print('WARNING: ' + error_msg)
-                return conection_dict
+                return connection_dict
 
 
         connection_dict['adc_chans'] = list()
@@ -639,47 +2305,190 @@ class H5Reader:
                     if connection_type.find('controller:')!=-1:
                         connection_dict['controller_chans'].append(channel_name)
 
-        return connection_dict                              
+        # cache
+        if cache_file_name is not None:
+            self._set_cached(cache_file_name, ('connections', adc_name),
+                             {key: list(value) for key, value in connection_dict.items()})
+            
+        return connection_dict                              
+
+
+    
+
+    def get_connection_table(self, file_name=None):
+        """
+        Get connection table
+        """
+        metadata = self.get_metadata(file_name=file_name)
+        
+        # check adc list exist 
+        if 'adc_list' not in metadata:
+            print('ERROR: No ADC metadata found in the file!')
+            return
+
+        
+        # loop adc and find connection
+        connection_list = list()
+        connection_name_list = list()
+        for adc_id in metadata['adc_list']:
+            adc_metadata = metadata['groups'][adc_id]
+            for key,val in adc_metadata.items():
+                if key[0:10]=='connection':
+                    adc_chan = re.sub(r'\s+','', str(key))[10:]
+                    name_val_list, name_list, val_list  = connection_utils.extract_adc_connection(list(val))
+                    val_list  = [adc_id,adc_chan] + val_list
+                    name_list = ['adc_id','adc_channel'] + name_list
+                    connection_list.append(val_list)
+                    if not connection_name_list:
+                        connection_name_list = name_list
+                    elif connection_name_list!=name_list:
+                        print('ERROR: missing adc connection values!')
+                        
+                    
+        connection_table = pd.DataFrame(connection_list, columns = connection_name_list )
+        return connection_table
+
+
+    
+  
+
+    def _build_event_index(self):
+        """
+        Build cumulative number of events index over file list
+        (used for random access)
+        """
+
+        # close file (get_metadata reopens files)
+        self._close_file()
+
+        nb_events_list = list()
+        for file_name in self._file_list:
+            metadata = self._get_metadata(file_name)
+            nb_events_file = 0
+            for adc_name in metadata.get('adc_list', list()):
+                nb_events_file = metadata['groups'][adc_name]['nb_datasets']
+                break
+            nb_events_list.append(nb_events_file)
+
+        self._event_offsets = [0]
+        for nb_events_file in nb_events_list:
+            self._event_offsets.append(self._event_offsets[-1] + nb_events_file)
+
+        # reset sequential reading
+        self._file_counter = 0
+        self._current_file_event_counter = 0
+        self._global_event_counter = 0
+
+            
+
+    def _seek_event(self, global_index):
+        """
+        Open file containing event with global index and move
+        event counters so that the next event read is this event
+
+        Return:
+          bool (False if index out of range)
+        """
+        
+        # build index if needed
+        if self._event_offsets is None:
+            self._build_event_index()
+
+        # check index
+        nb_events_tot = self._event_offsets[-1]
+        if global_index<0:
+            global_index += nb_events_tot
+        if global_index<0 or global_index>=nb_events_tot:
+            return False
+
+        # find file
+        file_index = bisect.bisect_right(self._event_offsets, global_index) - 1
+        file_name = self._file_list[file_index]
+
+        # open file (if not already open)
+        if (self._current_file is None
+            or self._current_file_name!=file_name
+            or self._current_file_nb_events==0):
+            self._open_file(file_name)
+            if self._current_file is None:
+                return False
+
+        # move counters
+        self._file_counter = file_index + 1
+        self._current_file_event_counter = global_index - self._event_offsets[file_index]
+        self._global_event_counter = global_index
+        return True
+
+
+            
+    def _read_events_slab(self, file_name, adc_name, event_indices,
+                          chan_sel=slice(None), sample_sel=slice(None),
+                          output=None):
+        """
+        Read hyperslab (channel/sample selection) of multiple events 
+        from a single file
+
+        Args:
+          file_name: string
+             file name
+
+          adc_name: string
+             ADC id
+
+          event_indices: list of integer
+             event indices in file (first event = 0)
+          
+          chan_sel: slice or increasing list of integer
+             channel selection
 
+          sample_sel: slice
+             sample selection
 
-    
+          output: 3D ndarray (optional)
+             output array [event, chan, sample]
 
-    def get_connection_table(self, file_name=None):
-        """
-        Get connection table
+        Return:
+          output: 3D ndarray
         """
-        metadata = self.get_metadata(file_name=file_name)
-        
-        # check adc list exist 
-        if 'adc_list' not in metadata:
-            print('ERROR: No ADC metadata found in the file!')
-            return
 
-        
-        # loop adc and find connection
-        connection_list = list()
-        connection_name_list = list()
-        for adc_id in metadata['adc_list']:
-            adc_metadata = metadata['groups'][adc_id]
-            for key,val in adc_metadata.items():
-                if key[0:10]=='connection':
-                    adc_chan = re.sub(r'\s+','', str(key))[10:]
-                    name_val_list, name_list, val_list  = connection_utils.extract_adc_connection(list(val))
-                    val_list  = [adc_id,adc_chan] + val_list
-                    name_list = ['adc_id','adc_channel'] + name_list
-                    connection_list.append(val_list)
-                    if not connection_name_list:
-                        connection_name_list = name_list
-                    elif connection_name_list!=name_list:
-                        print('ERROR: missing adc connection values!')
-                        
-                    
-        connection_table = pd.DataFrame(connection_list, columns = connection_name_list )
-        return connection_table
+        # open file if needed
+        if self._current_file_name != file_name:
+            self._open_file(file_name, load_metadata=False)
+        if self._current_file is None:
+            raise ValueError('Unable to open file ' + file_name)
+            
+        group = self._current_file[adc_name]
+
+        # packed layout: single read if contiguous events
+        if _is_packed(group):
+            dataset = group[PACKED_DATASET_NAME]
+            event_sel = _get_index_selection(event_indices)
+            if isinstance(event_sel, slice):
+                event_sels = [event_sel]
+            else:
+                event_sels = [slice(index, index+1) for index in event_sel]
+            for ievent, event_sel in enumerate(event_sels):
+                if output is None:
+                    dims = dataset[0, chan_sel, sample_sel].shape
+                    output = np.zeros((len(event_indices),) + dims, dtype=np.int16)
+                if len(event_sels)==1:
+                    target = output
+                else:
+                    target = output[ievent:ievent+1]
+                _read_packed_data(dataset, event_sel, chan_sel, sample_sel, target)
+            return output
+            
+        # loop events
+        for ievent, event_index in enumerate(event_indices):
+            dataset = group['event_' + str(event_index+1)]
+            if output is None:
+                dims = dataset[chan_sel, sample_sel].shape
+                output = np.zeros((len(event_indices),) + dims, dtype=np.int16)
+            dataset.read_direct(output[ievent], source_sel=np.s_[chan_sel, sample_sel])
 
+        return output
 
     
-  
 
     def _open_file(self,file_name, rw_string='r', load_metadata=True):
         """
@@ -690,7 +2499,7 @@ class H5Reader:
             
         file = None
         try:
-            file = h5py.File(file_name,rw_string)
+            file = self._get_file_handle(file_name, rw_string)
         except:
             print('ERROR: unable to open file ' + file_name)
             return
@@ -700,10 +2509,14 @@ class H5Reader:
         self._current_file_nb_events = 0
         self._current_file_event_counter = 0
         
-        # load metadata
+        # load metadata (decoded metadata cache if available)
         if load_metadata:
 
-            self._load_metadata()
+            metadata = self._get_cached(file_name, 'metadata')
+            if metadata is not None:
+                self._current_file_metadata = metadata
+            else:
+                self._load_metadata()
             
             # check events
             if 'adc_list' not in self._current_file_metadata:
@@ -728,7 +2541,9 @@ class H5Reader:
 
     def _close_file(self):
 
-        if self._current_file is not None:
+        # (files in pool stay open)
+        if (self._current_file is not None
+            and not self._is_pooled(self._current_file)):
             self._current_file.close()
   
         # initialize
@@ -736,12 +2551,78 @@ class H5Reader:
         self._current_file_name = None
         self._current_file_metadata = dict()
         self._current_file_nb_events = 0
+        self._current_file_event_attrs = dict()
+        self._current_file_group_attrs = dict()
                             
         
         
 
 
 
+    def _get_file_handle(self, file_name, rw_string='r'):
+        """
+        Get h5py file from open files pool (read only) or open file. 
+        Files modified since opened are reopened.
+        """
+
+        if rw_string!='r' or self._max_open_files==0:
+            return h5py.File(file_name, rw_string, **self._file_options)
+
+        path = os.path.abspath(file_name)
+        stat = os.stat(path)
+        version = (stat.st_mtime, stat.st_size)
+
+        # file in pool
+        if path in self._file_pool:
+            file, file_version = self._file_pool[path]
+            if file_version==version and file.id.valid:
+                self._file_pool.move_to_end(path)
+                return file
+            del self._file_pool[path]
+            if file.id.valid and file is not self._current_file:
+                file.close()
+
+        # open and add to pool
+        file = h5py.File(path, 'r', **self._file_options)
+        self._file_pool[path] = (file, version)
+
+        # remove least recently used files (except current file)
+        for pool_path in list(self._file_pool.keys()):
+            if len(self._file_pool)<=self._max_open_files:
+                break
+            pool_file = self._file_pool[pool_path][0]
+            if pool_file is self._current_file or pool_file is file:
+                continue
+            del self._file_pool[pool_path]
+            if pool_file.id.valid:
+                pool_file.close()
+            
+        return file
+
+
+    
+    def _is_pooled(self, file):
+        """
+        Check if h5py file belongs to open files pool
+        """
+        for pool_file, file_version in self._file_pool.values():
+            if pool_file is file:
+                return True
+        return False
+
+
+    
+    def _close_file_pool(self):
+        """
+        Close all files in pool
+        """
+        for pool_file, file_version in self._file_pool.values():
+            if pool_file.id.valid and pool_file is not self._current_file:
+                pool_file.close()
+        self._file_pool = OrderedDict()
+
+
+    
     def _load_metadata(self, include_dataset_metadata=False):
 
         """
@@ -753,12 +2634,31 @@ class H5Reader:
         if self._current_file is None:
             return
                
+        # read
+        metadata_dict = self._read_file_metadata(self._current_file,
+                                                 include_dataset_metadata)
+
+        # save
+        self._current_file_metadata = metadata_dict
+        if not include_dataset_metadata:
+            self._set_cached(self._current_file_name, 'metadata', metadata_dict)
+     
+
+
+    def _read_file_metadata(self, file, include_dataset_metadata=False):
+        """
+        Read and decode all metadata from h5py file
+
+        Return:
+          metadata_dict: dict
+        """
+
         # initialize containner
         metadata_dict = dict()
       
 
         # file matadata
-        metadata_dict = self._extract_metadata(self._current_file.attrs)
+        metadata_dict = self._extract_metadata(file.attrs)
             
     
         # group/dataset metadata
@@ -767,7 +2667,7 @@ class H5Reader:
         metadata_dict['groups'] = dict()
            
         # Loop groups
-        for key_name in list(self._current_file.keys()):
+        for key_name in list(file.keys()):
             
             # update list
             metadata_dict['group_list'].append(key_name)
@@ -775,12 +2675,26 @@ class H5Reader:
                 metadata_dict['adc_list'].append(key_name)
                     
             # get group 
-            group = self._current_file[key_name]
+            group = file[key_name]
             
             # save metadata
             metadata_dict['groups'][key_name] = dict()
             metadata_dict['groups'][key_name] =  self._extract_metadata(group.attrs)
 
+            # packed layout: one dataset name per event
+            if _is_packed(group):
+                nb_events = group[PACKED_DATASET_NAME].shape[0]
+                dataset_list = ['event_' + str(ievent+1) for ievent in range(nb_events)]
+                metadata_dict['groups'][key_name]['dataset_list'] = dataset_list
+                metadata_dict['groups'][key_name]['nb_datasets'] = nb_events
+                if include_dataset_metadata and nb_events>0:
+                    event_attrs = _read_packed_attrs(group)
+                    metadata_dict['groups'][key_name]['datasets'] = dict()
+                    for ievent, dataset_name in enumerate(dataset_list):
+                        metadata_dict['groups'][key_name]['datasets'][dataset_name] = {
+                            key: column[ievent] for key, column in event_attrs.items()}
+                continue
+            
             # datasets
             dataset_list = list(group.keys())
             metadata_dict['groups'][key_name]['dataset_list'] = dataset_list
@@ -798,8 +2712,8 @@ class H5Reader:
 
                         
 
-        # save
-        self._current_file_metadata = metadata_dict
+        return metadata_dict
+
      
 
 
@@ -807,6 +2721,99 @@ class H5Reader:
 
 
 
+    def clear_metadata_cache(self):
+        """
+        Clear decoded metadata cache
+        """
+        self._metadata_cache = OrderedDict()
+        self._current_file_group_attrs = dict()
+
+
+        
+    def _get_cache_key(self, file_name):
+        """
+        Metadata cache key: (file path, modification time, size)
+        """
+        if file_name is None:
+            return None
+        try:
+            stat = os.stat(file_name)
+        except OSError:
+            return None
+        return (os.path.abspath(file_name), stat.st_mtime, stat.st_size)
+
+
+    
+    def _get_cached(self, file_name, item_name):
+        """
+        Get item from decoded metadata cache (None if not available)
+        """
+        key = self._get_cache_key(file_name)
+        if key is None or key not in self._metadata_cache:
+            return None
+        self._metadata_cache.move_to_end(key)
+        return self._metadata_cache[key].get(item_name)
+
+
+    
+    def _set_cached(self, file_name, item_name, value):
+        """
+        Store item in decoded metadata cache
+        """
+        key = self._get_cache_key(file_name)
+        if key is None or self._metadata_cache_size<=0:
+            return
+
+        if key not in self._metadata_cache:
+            # remove entries from previous versions of the file
+            for cache_key in list(self._metadata_cache.keys()):
+                if cache_key[0]==key[0]:
+                    del self._metadata_cache[cache_key]
+            self._metadata_cache[key] = dict()
+            while len(self._metadata_cache)>self._metadata_cache_size:
+                self._metadata_cache.popitem(last=False)
+                
+        self._metadata_cache.move_to_end(key)
+        self._metadata_cache[key][item_name] = value
+
+
+        
+    def _get_group_attrs(self, adc_name):
+        """
+        Get decoded ADC group attributes of current file
+        """
+        if adc_name in self._current_file_group_attrs:
+            return self._current_file_group_attrs[adc_name]
+
+        group_attrs = self._get_cached(self._current_file_name, ('group_attrs', adc_name))
+        if group_attrs is None:
+            group_attrs = self._extract_metadata(self._current_file[adc_name].attrs)
+            self._set_cached(self._current_file_name, ('group_attrs', adc_name), group_attrs)
+        self._current_file_group_attrs[adc_name] = group_attrs
+        return group_attrs
+
+
+    
+    def _select_metadata(self, metadata, group_name=None, dataset_name=None):
+        """
+        Select group or dataset metadata from file metadata
+        """
+        selected_metadata = dict()
+        if group_name is not None:
+            if group_name in metadata['group_list']:
+                group_metadata = metadata['groups'][group_name]
+                if dataset_name is not None:
+                    if ('datasets' in group_metadata
+                        and dataset_name in group_metadata['datasets']):
+                        selected_metadata = group_metadata['datasets'][dataset_name]
+                else:
+                    selected_metadata = group_metadata
+        else:
+            selected_metadata = metadata
+        return selected_metadata
+
+
+
     def _extract_metadata(self,attributes):   
         metadata_dict = dict()
         for key in attributes.keys():
@@ -820,3 +2827,877 @@ class H5Reader:
         return metadata_dict
         
 
+
+
+
+
+
+# packed layout names (ADC group)
+PACKED_DATASET_NAME = 'data'
+PACKED_ATTRS_GROUP_NAME = 'event_attrs'
+DELTA_ENCODING_ATTR_NAME = 'delta_encoding'
+
+# per-event attributes index sidecar directory (data directory)
+SIDECAR_DIR_NAME = '.pytesdaq_index'
+
+
+
+def _is_packed(group):
+    """
+    Check if ADC group uses packed layout (single 
+    [event, chan, sample] dataset)
+    """
+    return PACKED_DATASET_NAME in group and PACKED_ATTRS_GROUP_NAME in group
+
+
+
+def _read_packed_attrs(group):
+    """
+    Read per-event attributes columns of packed layout ADC group
+
+    Return:
+      dict: attribute name -> array [event,...]
+    """
+    event_attrs = dict()
+    if PACKED_ATTRS_GROUP_NAME not in group:
+        return event_attrs
+    
+    for key, dataset in group[PACKED_ATTRS_GROUP_NAME].items():
+        if h5py.check_string_dtype(dataset.dtype) is not None:
+            event_attrs[key] = dataset.asstr()[()]
+        else:
+            event_attrs[key] = dataset[()]
+    return event_attrs
+
+
+
+def _read_packed_data(dataset, event_sel, chan_sel, sample_sel, target):
+    """
+    Read packed layout [event, chan, sample] hyperslab into target 
+    array. Delta encoded data (see convert_to_packed) are decoded, 
+    which requires reading samples from the beginning of the trace.
+    """
+    
+    if not dataset.attrs.get(DELTA_ENCODING_ATTR_NAME, False):
+        dataset.read_direct(target, source_sel=np.s_[event_sel, chan_sel, sample_sel])
+        return target
+
+    # delta decoding (int16 modular cumulative sum)
+    start, stop, step = sample_sel.indices(dataset.shape[-1])
+    if stop<=start:
+        return target
+    array = dataset[event_sel, chan_sel, 0:stop]
+    np.cumsum(array, axis=-1, dtype=array.dtype, out=array)
+    target[...] = array[..., start:stop:step]
+    return target
+
+
+
+def delta_encode(data_array):
+    """
+    Lossless delta encoding (along last axis, in place) of integer traces:
+    first sample unchanged then sample differences (modular arithmetic, 
+    no overflow issue). Decoded with np.cumsum(..., dtype=data_array.dtype)
+    """
+    data_array[..., 1:] = np.diff(data_array, axis=-1)
+    return data_array
+
+
+
+def get_compression_filter(compression=None, compression_level=None, shuffle=False):
+    """
+    Get h5py "create_dataset" compression arguments
+
+    Args:
+      compression: string (optional)
+         None/'none', built-in 'gzip' or 'lzf', or (hdf5plugin
+         package required) 'lz4', 'zstd', 'blosc' (= 'blosc_lz4'), 
+         'blosc_lz4', 'blosc_zstd'
+   
+      compression_level: integer (optional)
+         compression level (gzip, zstd and blosc), not 
+         available for lzf and lz4 (ignored with a warning)
+
+      shuffle: bool
+         byte shuffle pre-filter (blosc: internal shuffle)
+
+    Return:
+      filter_dict: dict
+    """
+
+    filter_dict = dict()
+    if compression is None or compression.lower()=='none':
+        if shuffle:
+            filter_dict['shuffle'] = True
+        return filter_dict
+
+    compression = compression.lower()
+
+    # no compression level
+    if compression_level is not None and (compression=='lzf' or compression=='lz4'):
+        print('WARNING: Compression level not available for "' + compression
+              + '", level ' + str(compression_level) + ' ignored!')
+
+    # built-in filters
+    if compression=='gzip' or compression=='lzf':
+        filter_dict['compression'] = compression
+        if compression=='gzip' and compression_level is not None:
+            filter_dict['compression_opts'] = int(compression_level)
+        filter_dict['shuffle'] = shuffle
+        return filter_dict
+
+    # plugins
+    if hdf5plugin is None:
+        raise ValueError('Compression "' + compression + '" requires "hdf5plugin" '
+                         'package (pip install hdf5plugin)!')
+    
+    if compression=='lz4':
+        plugin_filter = hdf5plugin.LZ4()
+    elif compression=='zstd':
+        if compression_level is not None:
+            plugin_filter = hdf5plugin.Zstd(clevel=int(compression_level))
+        else:
+            plugin_filter = hdf5plugin.Zstd()
+    elif compression=='blosc' or compression.startswith('blosc_'):
+        cname = 'lz4'
+        if compression!='blosc':
+            cname = compression[6:]
+        clevel = 5
+        if compression_level is not None:
+            clevel = int(compression_level)
+        blosc_shuffle = hdf5plugin.Blosc.NOSHUFFLE
+        if shuffle:
+            blosc_shuffle = hdf5plugin.Blosc.SHUFFLE
+        plugin_filter = hdf5plugin.Blosc(cname=cname, clevel=clevel, shuffle=blosc_shuffle)
+        shuffle = False
+    else:
+        raise ValueError('Compression "' + compression + '" not recognized!')
+
+    filter_dict.update(plugin_filter)
+    filter_dict['shuffle'] = shuffle
+    return filter_dict
+
+
+
+def convert_to_packed(input_file, output_file, chunk_size=1e6,
+                      compression=None, compression_level=None,
+                      shuffle=False, delta=False):
+    """
+    Convert file with one dataset per event ("adcN/event_M")
+    into packed layout: one chunked [event, chan, sample] dataset 
+    per ADC ("adcN/data") and per-event attributes stored as 
+    columns ("adcN/event_attrs/[attribute]"). File and group 
+    attributes and other groups are copied unchanged.
+
+    Args:
+      input_file: string
+         input file name
+
+      output_file: string
+         output file name
+
+      chunk_size: float
+         approximate chunk size in bytes (default 1MB), 
+         chunks contain full events
+
+      compression: string (optional)
+         compression filter, see get_compression_filter
+         (e.g. 'gzip', 'lzf', 'lz4', 'zstd', 'blosc_zstd')
+
+      compression_level: integer (optional)
+         compression level
+
+      shuffle: bool
+         byte shuffle pre-filter (default: False)
+
+      delta: bool
+         delta encoding of traces (sample differences, 
+         decoded by H5Reader) (default: False)
+
+    Return:
+      nb_events: dict (number of events per ADC)
+    """
+
+    nb_events_dict = dict()
+    filter_dict = get_compression_filter(compression=compression,
+                                         compression_level=compression_level,
+                                         shuffle=shuffle)
+    
+    with h5py.File(input_file, 'r') as file_in, h5py.File(output_file, 'w') as file_out:
+
+        # file attributes
+        for key, value in file_in.attrs.items():
+            file_out.attrs[key] = value
+
+        # groups
+        for group_name, group_in in file_in.items():
+            
+            # non ADC group or already packed -> copy
+            if (group_name[0:3]!='adc' or not isinstance(group_in, h5py.Group)
+                or _is_packed(group_in)):
+                file_in.copy(group_in, file_out, name=group_name)
+                continue
+
+            group_out = file_out.create_group(group_name)
+            for key, value in group_in.attrs.items():
+                group_out.attrs[key] = value
+
+            # events (in order)
+            event_list = list()
+            for dataset_name in group_in.keys():
+                match = re.match(r'event_(\d+)$', dataset_name)
+                if match is not None:
+                    event_list.append(int(match.group(1)))
+            event_list = sorted(event_list)
+            nb_events = len(event_list)
+            nb_events_dict[group_name] = nb_events
+            if nb_events==0:
+                continue
+
+            first_dataset = group_in['event_' + str(event_list[0])]
+            nb_channels, nb_samples = first_dataset.shape
+            dtype = first_dataset.dtype
+            
+            # chunks (full events)
+            event_bytes = nb_channels*nb_samples*dtype.itemsize
+            chunk_events = int(max(1, min(nb_events, chunk_size//event_bytes)))
+            dataset_out = group_out.create_dataset(
+                PACKED_DATASET_NAME, shape=(nb_events, nb_channels, nb_samples),
+                dtype=dtype, chunks=(chunk_events, nb_channels, nb_samples),
+                **filter_dict)
+            if delta:
+                dataset_out.attrs[DELTA_ENCODING_ATTR_NAME] = True
+
+            # copy data one chunk at a time + collect attributes
+            attrs_list = list()
+            buffer = np.zeros((chunk_events, nb_channels, nb_samples), dtype=dtype)
+            for chunk_start in range(0, nb_events, chunk_events):
+                chunk_stop = min(chunk_start+chunk_events, nb_events)
+                for ievent in range(chunk_start, chunk_stop):
+                    dataset_in = group_in['event_' + str(event_list[ievent])]
+                    dataset_in.read_direct(buffer[ievent-chunk_start])
+                    attrs_list.append(dict(dataset_in.attrs))
+                if delta:
+                    delta_encode(buffer[0:chunk_stop-chunk_start])
+                dataset_out.write_direct(buffer, source_sel=np.s_[0:chunk_stop-chunk_start],
+                                         dest_sel=np.s_[chunk_start:chunk_stop])
+
+            # per-event attributes columns (attributes available for all events)
+            attrs_group = group_out.create_group(PACKED_ATTRS_GROUP_NAME)
+            for key in attrs_list[0]:
+                if not all(key in attrs for attrs in attrs_list):
+                    print('WARNING: Attribute "' + key + '" not available for all events. '
+                          'Not converted!')
+                    continue
+                values = [attrs[key] for attrs in attrs_list]
+                if isinstance(values[0], (str, bytes)):
+                    values = [value.decode() if isinstance(value, bytes) else value
+                              for value in values]
+                    attrs_group.create_dataset(key, data=np.array(values, dtype=object),
+                                               dtype=h5py.string_dtype())
+                else:
+                    attrs_group.create_dataset(key, data=np.asarray(values))
+
+    return nb_events_dict
+
+
+
+def _column_arrays(columns, nb_events):
+    """
+    Convert per-event attributes columns to arrays (columns with
+    missing values are dropped), "nb_events" key = number of events
+    """
+    column_arrays = {'nb_events': np.array(nb_events, dtype=np.int64)}
+    for key, values in columns.items():
+        if key=='nb_events' or values is None:
+            continue
+        if not isinstance(values, np.ndarray) and any(value is None for value in values):
+            continue
+        array = np.asarray(values)
+        if array.dtype==object:
+            array = array.astype(str)
+        if array.shape!=(nb_events,):
+            continue
+        column_arrays[key] = array
+    return column_arrays
+
+
+
+def _get_sidecar_file_name(file_name, adc_name):
+    """
+    Per-event attributes sidecar file name
+    ([data dir]/.pytesdaq_index/[file name].[adc name].npz)
+    """
+    file_name = os.path.abspath(file_name)
+    return os.path.join(os.path.dirname(file_name), SIDECAR_DIR_NAME,
+                        os.path.basename(file_name) + '.' + adc_name + '.npz')
+
+
+
+def _read_sidecar_event_attrs(file_name, adc_name):
+    """
+    Read per-event attributes columns from sidecar file
+    (None if not available or data file modified)
+    """
+    sidecar_file = _get_sidecar_file_name(file_name, adc_name)
+    try:
+        stat = os.stat(file_name)
+        with np.load(sidecar_file, allow_pickle=False) as data:
+            if (float(data['__mtime__'])!=stat.st_mtime
+                or int(data['__size__'])!=stat.st_size):
+                return None
+            return {key: data[key] for key in data.files
+                    if key not in ['__mtime__', '__size__']}
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+
+def _write_sidecar_event_attrs(file_name, adc_name, columns):
+    """
+    Write per-event attributes columns in sidecar file,
+    with data file modification time and size
+    """
+    sidecar_file = _get_sidecar_file_name(file_name, adc_name)
+    stat = os.stat(file_name)
+    os.makedirs(os.path.dirname(sidecar_file), exist_ok=True)
+    tmp_file = sidecar_file + '.tmp' + str(os.getpid())
+    with open(tmp_file, 'wb') as file:
+        np.savez(file, __mtime__=stat.st_mtime, __size__=stat.st_size, **columns)
+    os.replace(tmp_file, sidecar_file)
+
+
+
+def _get_scalar_metadata(info_list):
+    """
+    Scalar (number/string) metadata of each event, 
+    as dict of columns
+    """
+    columns = dict()
+    for ievent, info in enumerate(info_list):
+        for key, value in info.items():
+            if isinstance(value, np.ndarray):
+                if value.ndim!=0:
+                    continue
+                value = value.item()
+            elif isinstance(value, np.generic):
+                value = value.item()
+            elif not isinstance(value, (int, float, str, bool)):
+                continue
+            if key not in columns:
+                columns[key] = [None]*len(info_list)
+            columns[key][ievent] = value
+    return columns
+
+
+
+def events_to_dataframe(data_array, info_list):
+    """
+    Convert events to pandas DataFrame (one row per event):
+    scalar metadata columns + "traces" column containing
+    views of data_array (no copy)
+
+    Args:
+      data_array: 3D ndarray [event, chan, sample]
+      info_list: list of metadata dict (one per event)
+
+    Return:
+      pandas DataFrame, with attrs 'detector_chans', 'trace_shape'
+      and 'trace_dtype' (3D array of selected rows: 
+      np.stack(df['traces']))
+    """
+
+    columns = _get_scalar_metadata(info_list)
+    df = pd.DataFrame(columns, index=pd.RangeIndex(data_array.shape[0]))
+    
+    traces = np.empty(data_array.shape[0], dtype=object)
+    for ievent in range(data_array.shape[0]):
+        traces[ievent] = data_array[ievent]
+    df['traces'] = traces
+
+    df.attrs['detector_chans'] = list()
+    if info_list and 'detector_chans' in info_list[0]:
+        df.attrs['detector_chans'] = list(info_list[0]['detector_chans'])
+    df.attrs['trace_shape'] = tuple(data_array.shape[1:])
+    df.attrs['trace_dtype'] = str(data_array.dtype)
+    return df
+
+
+
+def events_to_arrow_table(data_array, info_list):
+    """
+    Convert events to pyarrow Table (one row per event):
+    scalar metadata columns + "traces" column, fixed size 
+    list [chan][sample] sharing data_array memory
+
+    Args:
+      data_array: 3D ndarray [event, chan, sample]
+      info_list: list of metadata dict (one per event)
+
+    Return:
+      pyarrow Table
+    """
+
+    if pyarrow is None:
+        raise ValueError('pyarrow package required!')
+
+    nb_events, nb_channels, nb_samples = data_array.shape
+    data_array = np.ascontiguousarray(data_array)
+
+    # traces (zero copy)
+    values = pyarrow.array(data_array.reshape(-1))
+    samples = pyarrow.FixedSizeListArray.from_arrays(values, nb_samples)
+    traces = pyarrow.FixedSizeListArray.from_arrays(samples, nb_channels)
+
+    # metadata
+    columns = _get_scalar_metadata(info_list)
+    arrays = [pyarrow.array(values_list) for values_list in columns.values()]
+    names = list(columns.keys())
+    
+    table = pyarrow.Table.from_arrays(arrays + [traces], names=names + ['traces'])
+
+    # channel names
+    schema_metadata = {'nb_channels': str(nb_channels), 'nb_samples': str(nb_samples)}
+    if info_list and 'detector_chans' in info_list[0]:
+        schema_metadata['detector_chans'] = ','.join([str(chan) for chan in
+                                                      info_list[0]['detector_chans']])
+    return table.replace_schema_metadata(schema_metadata)
+
+
+
+def write_parquet(events, file_name, compression='zstd'):
+    """
+    Write events table (read_many_events output_format=3 or 4) 
+    to Parquet file (pyarrow required)
+
+    Args:
+      events: pandas DataFrame (output_format=3) or pyarrow Table
+              (no rows, e.g. empty selection: empty table written)
+      file_name: string
+      compression: string (parquet compression, default: 'zstd')
+    """
+
+    if pyarrow is None:
+        raise ValueError('pyarrow package required!')
+
+    table = events
+    if isinstance(events, pd.DataFrame) and len(events)==0:
+        # no rows: schema from DataFrame columns and traces
+        # shape/type (attrs, variable size lists if unknown)
+        trace_dtype = events.attrs.get('trace_dtype', 'int16')
+        if 'trace_shape' in events.attrs:
+            traces_table = events_to_arrow_table(
+                np.zeros((0,) + tuple(events.attrs['trace_shape']), dtype=trace_dtype),
+                list())
+            traces = traces_table.column('traces')
+            schema_metadata = dict(traces_table.schema.metadata)
+        else:
+            value_type = pyarrow.from_numpy_dtype(np.dtype(trace_dtype))
+            traces = pyarrow.array(list(), type=pyarrow.list_(pyarrow.list_(value_type)))
+            schema_metadata = dict()
+        table = pyarrow.Table.from_pandas(events.drop(columns=['traces']),
+                                          preserve_index=False)
+        
+        # object columns (no values): string
+        for icol, field in enumerate(table.schema):
+            if pyarrow.types.is_null(field.type):
+                table = table.set_column(icol, field.name,
+                                         pyarrow.array(list(), type=pyarrow.string()))
+        table = table.append_column('traces', traces)
+        if events.attrs.get('detector_chans'):
+            schema_metadata[b'detector_chans'] = ','.join(
+                [str(chan) for chan in events.attrs['detector_chans']])
+        table = table.replace_schema_metadata(schema_metadata)
+        
+    elif isinstance(events, pd.DataFrame):
+        data_array = np.stack(events['traces'].to_numpy())
+        info_list = events.drop(columns=['traces']).to_dict(orient='records')
+        for info in info_list:
+            info['detector_chans'] = events.attrs.get('detector_chans', list())
+        table = events_to_arrow_table(data_array, info_list)
+
+    pyarrow.parquet.write_table(table, file_name, compression=compression)
+
+
+
+def _merge_connection_dicts(adc_list, connection_dicts):
+    """
+    Merge connection dictionaries of multiple ADCs (same channel 
+    order as merged arrays), "adc_names" = ADC id of each channel
+    """
+    connection_map = {'adc_names': list(), 'adc_chans': list(),
+                      'detector_chans': list(), 'tes_chans': list(),
+                      'controller_chans': list()}
+    for adc_name in adc_list:
+        connection_dict = connection_dicts[adc_name]
+        nb_channels = len(connection_dict.get('adc_chans', list()))
+        connection_map['adc_names'].extend([adc_name]*nb_channels)
+        for key in ['adc_chans', 'detector_chans', 'tes_chans', 'controller_chans']:
+            connection_map[key].extend(list(connection_dict.get(key, list())))
+    return connection_map
+
+
+
+def get_envelope(data_array, nb_points):
+    """
+    Min/max envelope of traces (last axis) decimated 
+    to nb_points (no decimation if nb_points>=nb_samples)
+
+    Return:
+      envelope_min, envelope_max: ndarray [..., nb_points]
+    """
+    nb_samples = data_array.shape[-1]
+    if nb_points>=nb_samples:
+        return data_array.copy(), data_array.copy()
+    
+    bin_start = np.linspace(0, nb_samples, nb_points+1).astype(np.int64)[:-1]
+    envelope_min = np.minimum.reduceat(data_array, bin_start, axis=-1)
+    envelope_max = np.maximum.reduceat(data_array, bin_start, axis=-1)
+    return envelope_min, envelope_max
+
+
+
+def _get_index_selection(indices):
+    """
+    Convert increasing list of indices into HDF5 selection
+    (slice if contiguous, list otherwise)
+    """
+    indices = [int(index) for index in indices]
+    if len(indices)>0 and indices[-1]-indices[0]+1==len(indices):
+        return slice(indices[0], indices[-1]+1)
+    return indices
+
+
+
+def _get_sample_selection(sample_range):
+    """
+    Convert (start, stop) sample range into slice
+    (None = all samples)
+    """
+    if sample_range is None:
+        return slice(None)
+    return slice(int(sample_range[0]), int(sample_range[1]))
+
+
+    
+def _read_file_events_worker(args):
+    """
+    Process pool worker: read events from a single file
+    into shared memory output block
+
+    Return:
+      nb_events_read: integer
+      info_list: list of dict
+    """
+
+    (file_info, nb_events, event_offset, read_args,
+     shm_name, shape, dtype, file_options) = args
+
+    info_list = list()
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        output_data = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        reader = H5Reader(verbose=False, max_open_files=0, **file_options)
+        nb_events_read = reader._read_file_events(file_info, nb_events,
+                                                  output_data, event_offset,
+                                                  info_list=info_list,
+                                                  **read_args)
+        del output_data
+    finally:
+        shm.close()
+
+    return nb_events_read, info_list
+
+
+    
+
+class EventArray:
+    """
+    Lazy [event, channel, sample] array view over a list of 
+    HDF5 files. Slicing only reads requested events, channels
+    and samples. Reads are cached in a bounded LRU cache.
+
+    Note: list indices are applied independently on each axis
+    (h5py-like "orthogonal" indexing), e.g. array[[1,2],[0,3]] 
+    returns shape (2, 2, nb_samples)
+    """
+    
+    def __init__(self, file_list, adc_name='adc1', adctovolt=False,
+                 volt_dtype=np.float64, cache_size=256, raise_errors=True):
+        """
+        Args:
+          file_list: list of string
+               list of files 
+
+          adc_name: string
+              ADC id (default: 'adc1')
+
+          adctovolt: Bool
+               Convert  from ADC to volt (Default=False) 
+
+          volt_dtype: numpy dtype
+               Output type if adctovolt=True (Default=np.float64)
+
+          cache_size: Float
+               chunk cache size in MB (default: 256MB)
+        """
+
+        self._file_list = list(file_list)
+        self._adc_name = adc_name
+        self._adctovolt = adctovolt
+        self._volt_dtype = np.dtype(volt_dtype)
+        self._cache_size = cache_size*1e6
+        
+        # reader (independent from user reader)
+        self._reader = H5Reader(raise_errors=raise_errors)
+        
+        # LRU cache
+        self._cache = OrderedDict()
+        self._cache_nbytes = 0
+
+
+        # file info
+        self._adc_metadata_list = list()
+        nb_events_list = list()
+        nb_channels = 0
+        nb_samples = 0
+        for file_name in self._file_list:
+            metadata = self._reader._get_metadata(file_name)
+            if adc_name not in metadata['groups']:
+                raise ValueError('ADC "' + adc_name + '" not found in file '
+                                 + file_name)
+            adc_metadata = metadata['groups'][adc_name]
+            if nb_channels==0:
+                nb_channels = adc_metadata['nb_channels']
+                nb_samples = adc_metadata['nb_samples']
+            elif (adc_metadata['nb_channels']!=nb_channels or
+                  adc_metadata['nb_samples']!=nb_samples):
+                raise ValueError('Inconsistent number of channels/samples '
+                                 'between files!')
+            nb_events_list.append(adc_metadata['nb_datasets'])
+            self._adc_metadata_list.append(adc_metadata)
+
+        # cumulative number of events
+        self._event_offsets = np.concatenate(([0], np.cumsum(nb_events_list))).astype(np.int64)
+        self._shape = (int(self._event_offsets[-1]), int(nb_channels), int(nb_samples))
+
+        # connections
+        self._connections = dict()
+        if self._file_list:
+            self._connections = self._reader.get_connection_dict(
+                adc_name=adc_name, metadata=metadata)
+       
+
+    @property
+    def shape(self):
+        return self._shape
+
+    @property
+    def ndim(self):
+        return 3
+
+    @property
+    def dtype(self):
+        if self._adctovolt:
+            return self._volt_dtype
+        return np.dtype(np.int16)
+
+    @property
+    def file_list(self):
+        return self._file_list
+    
+    @property
+    def detector_chans(self):
+        if 'detector_chans' in self._connections:
+            return self._connections['detector_chans']
+        return list()
+
+    
+    def __len__(self):
+        return self._shape[0]
+
+
+    def __array__(self, dtype=None):
+        array = self[:]
+        if dtype is not None:
+            array = array.astype(dtype)
+        return array
+
+
+    def __repr__(self):
+        return ('EventArray(shape=' + str(self._shape) + ', dtype='
+                + str(self.dtype) + ', nb_files=' + str(len(self._file_list)) + ')')
+
+    
+    def __getitem__(self, key):
+        """
+        Read events/channels/samples selection
+        """
+
+        if not isinstance(key, tuple):
+            key = (key,)
+        if len(key)>3:
+            raise IndexError('Too many indices for 3D event array')
+        key = key + (slice(None),)*(3-len(key))
+
+        # normalize indices
+        event_indices, drop_event = self._normalize_index(key[0], self._shape[0])
+        chan_indices, drop_chan = self._normalize_index(key[1], self._shape[1])
+        sample_sel, sample_take, drop_sample = self._normalize_sample_index(key[2], self._shape[2])
+
+        # channel hyperslab: increasing unique list (h5py fancy indexing)
+        chan_read, chan_take = np.unique(chan_indices, return_inverse=True)
+        chan_sel = _get_index_selection(chan_read)
+            
+        nb_samples_read = len(range(*sample_sel.indices(self._shape[2])))
+            
+        # initialize output
+        output = np.zeros((len(event_indices), len(chan_read), nb_samples_read),
+                          dtype=self.dtype)
+
+        # find files
+        file_indices = np.searchsorted(self._event_offsets, event_indices, side='right') - 1
+
+        # loop files and read missing events
+        cache_keys = [None]*len(event_indices)
+        for file_index in np.unique(file_indices):
+
+            output_indices = np.flatnonzero(file_indices==file_index)
+            local_indices = event_indices[output_indices] - self._event_offsets[file_index]
+
+            missing_output = list()
+            missing_local = list()
+            for output_index, local_index in zip(output_indices, local_indices):
+                cache_key = (int(file_index), int(local_index),
+                             tuple(chan_read), (sample_sel.start, sample_sel.stop, sample_sel.step))
+                cache_keys[output_index] = cache_key
+                if cache_key in self._cache:
+                    self._cache.move_to_end(cache_key)
+                    output[output_index] = self._cache[cache_key]
+                else:
+                    missing_output.append(output_index)
+                    missing_local.append(int(local_index))
+
+            if not missing_local:
+                continue
+            
+            # read
+            array = self._reader._read_events_slab(self._file_list[file_index],
+                                                   self._adc_name, missing_local,
+                                                   chan_sel=chan_sel, sample_sel=sample_sel)
+
+            # convert to volt
+            if self._adctovolt:
+                array = self._convert_to_volt(array, file_index, chan_read)
+
+            # store
+            for ievent, output_index in enumerate(missing_output):
+                output[output_index] = array[ievent]
+                self._add_to_cache(cache_keys[output_index], array[ievent])
+
+        self._reader.close()
+                
+        # channel order/duplicates and sample selection
+        if len(chan_read)!=len(chan_indices) or not np.array_equal(chan_read, chan_indices):
+            output = output[:,chan_take,:]
+        if sample_take is not None:
+            output = output[:,:,sample_take]
+        
+        # drop dimensions (integer indexing)
+        if drop_sample:
+            output = output[:,:,0]
+        if drop_chan:
+            output = output[:,0]
+        if drop_event:
+            output = output[0]
+            
+        return output
+        
+
+    def clear_cache(self):
+        """
+        Clear chunk cache
+        """
+        self._cache = OrderedDict()
+        self._cache_nbytes = 0
+
+
+        
+    def _add_to_cache(self, key, array):
+        """
+        Add array to LRU cache, remove oldest
+        arrays if cache full
+        """
+        if array.nbytes>self._cache_size:
+            return
+        self._cache[key] = array
+        self._cache_nbytes += array.nbytes
+        while self._cache_nbytes>self._cache_size:
+            old_key, old_array = self._cache.popitem(last=False)
+            self._cache_nbytes -= old_array.nbytes
+    
+        
+    def _convert_to_volt(self, array, file_index, chan_indices):
+        """
+        Convert ADC to volt
+        """
+        adc_metadata = self._adc_metadata_list[file_index]
+        coeffs = calibration_utils.get_calibration_coeffs(
+            adc_metadata['adc_conversion_factor'], chan_indices)
+        return calibration_utils.adc_to_volt(array, coeffs, dtype=self.dtype)
+
+
+    
+    def _normalize_index(self, key, size):
+        """
+        Convert index (integer, slice, list, boolean mask)
+        to array of positive indices
+        """
+
+        # slice
+        if isinstance(key, slice):
+            return np.arange(*key.indices(size), dtype=np.int64), False
+
+        # integer
+        if isinstance(key, (int, np.integer)):
+            index = int(key)
+            if index<0:
+                index += size
+            if index<0 or index>=size:
+                raise IndexError('Index ' + str(key) + ' out of bounds for size '
+                                 + str(size))
+            return np.array([index], dtype=np.int64), True
+
+        # list/array
+        indices = np.asarray(key)
+        if indices.dtype==bool:
+            if len(indices)!=size:
+                raise IndexError('Boolean index with wrong length')
+            indices = np.flatnonzero(indices)
+        indices = indices.astype(np.int64).ravel()
+        indices[indices<0] += size
+        if np.any(indices<0) or np.any(indices>=size):
+            raise IndexError('Index out of bounds for size ' + str(size))
+        return indices, False
+
+    
+
+    def _normalize_sample_index(self, key, size):
+        """
+        Convert sample index into a (positive step) slice
+        and optional array of indices within that slice
+        """
+
+        # slice with positive step -> direct hyperslab
+        if isinstance(key, slice):
+            start, stop, step = key.indices(size)
+            if step>0:
+                return slice(start, max(start, stop), step), None, False
+            
+        # other: read range then select
+        indices, drop = self._normalize_index(key, size)
+        if len(indices)==0:
+            return slice(0, 0, 1), None, drop
+        start = int(indices.min())
+        stop = int(indices.max()) + 1
+        return slice(start, stop, 1), indices-start, drop
@@ -0,0 +1,297 @@
+"""
+Sequential HDF5 event reader with background prefetching
+"""
+
+import copy
+import threading
+import queue
+from pytesdaq.io.hdf5 import H5Reader
+
+
+
+class H5PrefetchReader:
+    """
+    Sequential event reader with background prefetching: a thread reads
+    the next events (and opens the next file ahead of time) into a
+    bounded queue. Same "read_event" interface as H5Reader so that
+    playback/offline loops overlap file I/O with analysis.
+    """
+
+    def __init__(self, nb_prefetch_events=32, raise_errors=True, verbose=True):
+        """
+        Args:
+          nb_prefetch_events: integer
+             maximum number of events read ahead (queue size)
+        """
+        
+        self._raise_errors = raise_errors
+        self._verbose = verbose
+        self._nb_prefetch_events = max(1, int(nb_prefetch_events))
+
+        # file list
+        self._file_list = list()
+        
+        # reader used for metadata outside read thread
+        self._reader = H5Reader(raise_errors=raise_errors, verbose=verbose)
+
+        # read thread
+        self._thread = None
+        self._queue = None
+        self._stop_event = None
+        self._thread_config = None
+        self._start_index = 0
+
+        # current event info
+        self._current_file_name = None
+        self._current_file_metadata = dict()
+        self._global_event_counter = 0
+        
+        
+    def __del__(self):
+        self._stop_thread()
+
+        
+    def set_catalog(self, catalog):
+        """
+        Set run catalog (see H5Reader.set_catalog)
+        """
+        self._reader.set_catalog(catalog)
+
+        
+    def set_files(self, filepaths):
+        """
+        Set file namelist (see H5Reader.set_files)
+        """
+        self.clear()
+        self._reader.set_files(filepaths)
+        self._file_list = list(self._reader._file_list)
+        
+        
+
+    def close(self):
+        self._stop_thread()
+        self._reader.close()
+
+
+    def clear(self):
+        self._stop_thread()
+        self._reader.clear()
+        self._start_index = 0
+        self._current_file_name = None
+        self._current_file_metadata = dict()
+        self._global_event_counter = 0
+
+        
+    def rewind(self):
+        """
+        Rewind to beginning of file(s)
+        """
+        self._stop_thread()
+        self._start_index = 0
+        self._global_event_counter = 0
+
+
+
+    def read_event(self, include_metadata=False, adc_name='adc1',
+                   global_index=None, sample_range=None):
+        """
+        Get next event from prefetch queue or, if "global_index" 
+        provided, restart prefetching from a specific event
+
+        Args: see H5Reader.read_event
+        """
+
+        # check if files available
+        if not self._file_list:
+            error_msg = 'No file available!'
+            return error_msg, error_msg
+        
+        # restart read thread if needed
+        thread_config = (adc_name, include_metadata, sample_range)
+        if global_index is not None:
+            self._stop_thread()
+            self._start_index = global_index
+        elif thread_config!=self._thread_config:
+            self._stop_thread()
+            self._start_index = self._global_event_counter
+
+        if self._thread is None:
+            self._start_thread(thread_config)
+
+        # get event from queue
+        item = self._queue.get()
+
+        # error (end of files) or exception from read thread
+        if isinstance(item, Exception):
+            self._stop_thread()
+            if self._raise_errors:
+                raise item
+            error_msg = 'Problem reading next event: ' + str(item)
+            print('ERROR: ' + error_msg)
+            return error_msg, error_msg
+            
+        if isinstance(item, str):
+            # keep end message for next call
+            self._queue.put(item)
+            return item, item
+        
+        # event
+        array, info, file_name, metadata, global_counter = item
+        self._global_event_counter = global_counter
+        if file_name!=self._current_file_name:
+            self._current_file_name = file_name
+            self._current_file_metadata = metadata
+            
+        if include_metadata:
+            return array, info
+        return array
+        
+
+    
+    def get_current_file_name(self):
+        return self._current_file_name
+
+
+
+    def get_metadata(self, file_name=None, group_name=None, dataset_name=None, 
+                     include_dataset_metadata=False):
+        """
+        Get metadata (see H5Reader.get_metadata). Current file 
+        metadata (file of last event read) is read by the read thread.
+        """
+
+        if (file_name is None and group_name is None and dataset_name is None
+            and not include_dataset_metadata and self._current_file_metadata):
+            return copy.deepcopy(self._current_file_metadata)
+
+        if file_name is None:
+            file_name = self._current_file_name
+            if file_name is None:
+                error_msg = 'No event read and no "file_name" argument provided!'
+                if self._raise_errors:
+                    raise ValueError(error_msg)
+                print('ERROR: ' + error_msg)
+                return dict()
+            
+        return self._reader.get_metadata(file_name=file_name, group_name=group_name,
+                                         dataset_name=dataset_name,
+                                         include_dataset_metadata=include_dataset_metadata)
+        
+                
+
+    def get_detector_config(self, file_name=None, adc_name='adc1', use_chan_dict=True):
+        """
+        Get detector configuration (see H5Reader.get_detector_config)
+        """
+        metadata = self.get_metadata(file_name=file_name)
+        return self._reader.get_detector_config(adc_name=adc_name,
+                                                use_chan_dict=use_chan_dict,
+                                                metadata=metadata)
+    
+
+    def get_connection_dict(self, file_name=None, adc_name='adc1'):
+        """
+        Get connection dictionary (see H5Reader.get_connection_dict)
+        """
+        metadata = self.get_metadata(file_name=file_name)
+        return self._reader.get_connection_dict(adc_name=adc_name, metadata=metadata)
+
+
+
+    def _start_thread(self, thread_config):
+        """
+        Start read thread from event "self._start_index"
+        """
+
+        self._thread_config = thread_config
+        self._queue = queue.Queue(maxsize=self._nb_prefetch_events)
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._read_loop,
+                                        args=(self._queue, self._stop_event,
+                                              thread_config, self._start_index),
+                                        daemon=True)
+        self._thread.start()
+
+        
+
+    def _stop_thread(self):
+        """
+        Stop read thread and discard prefetched events
+        """
+
+        if self._thread is None:
+            return
+        
+        self._stop_event.set()
+
+        # empty queue so that thread is not blocked
+        while self._thread.is_alive():
+            try:
+                self._queue.get(timeout=0.01)
+            except queue.Empty:
+                pass
+        self._thread.join()
+        
+        self._thread = None
+        self._queue = None
+        self._stop_event = None
+        self._thread_config = None
+        
+
+
+    def _read_loop(self, event_queue, stop_event, thread_config, start_index):
+        """
+        Read thread: read events sequentially and store
+        them in queue (blocks when queue full)
+        """
+
+        adc_name, include_metadata, sample_range = thread_config
+
+        def put(item):
+            while not stop_event.is_set():
+                try:
+                    event_queue.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        reader = H5Reader(raise_errors=self._raise_errors, verbose=self._verbose)
+        reader._file_list = self._file_list
+        try:
+            # (first file: no random access index needed)
+            global_index = None
+            if start_index!=0:
+                global_index = start_index
+            while not stop_event.is_set():
+
+                output = reader.read_event(include_metadata=include_metadata,
+                                           adc_name=adc_name,
+                                           global_index=global_index,
+                                           sample_range=sample_range)
+                global_index = None
+
+                # error/end of files returned as (error_msg, error_msg)
+                # whether or not metadata included
+                info = None
+                if include_metadata:
+                    output, info = output
+                elif isinstance(output, tuple) and isinstance(output[0], str):
+                    output = output[0]
+
+                # error/end of files: single end marker
+                if isinstance(output, str):
+                    put(output)
+                    break
+
+                # file metadata (read once per file)
+                file_name = reader.get_current_file_name()
+                metadata = reader._current_file_metadata
+                if not put((output, info, file_name, metadata,
+                            reader._global_event_counter)):
+                    break
+                
+        except Exception as e:
+            put(e)
+        finally:
+            reader.close()
@@ -0,0 +1,647 @@
+"""
+Asynchronous HDF5 writer (one dataset per event or packed layout)
+"""
+
+import os
+import time
+import threading
+import queue
+import h5py
+import numpy as np
+from pytesdaq.utils import arg_utils
+from pytesdaq.io.hdf5 import (PACKED_DATASET_NAME, PACKED_ATTRS_GROUP_NAME,
+                              DELTA_ENCODING_ATTR_NAME, delta_encode,
+                              get_compression_filter)
+
+
+
+class H5Writer:
+    """
+    Asynchronous HDF5 writer (pydaqmx acquisition path). Produces
+    the same file layout and metadata as polaris (file attributes, 
+    ADC group attributes including connections, "detconfigN" groups
+    and one "event_N" dataset per event) so that files can be read
+    with H5Reader. Optionally writes the packed layout (see 
+    convert_to_packed).
+
+    Events are written by a dedicated thread: the acquisition fills
+    one of a fixed number of preallocated buffers (see get_buffer)
+    and queues it (see write_buffer). Buffers are returned to the
+    pool once written, so that acquisition never waits for the disk
+    (event is dropped if no buffer available). close() needs to be 
+    called to write remaining events and number of events metadata.
+    """
+
+    def __init__(self, nb_buffers=32, raise_errors=True, verbose=True):
+        """
+        Args:
+          nb_buffers: integer
+             number of preallocated event buffers per ADC 
+             (maximum number of events waiting to be written)
+        """
+        
+        self._raise_errors = raise_errors
+        self._verbose = verbose
+        self._nb_buffers = max(1, int(nb_buffers))
+
+        # compression / layout
+        self._filter_dict = dict()
+        self._delta = False
+        self._packed = False
+        self._chunk_size = 1e6
+        
+        # run configuration
+        self._run_config = dict()
+        self._adc_config = dict()
+        self._det_config = dict()
+
+        # buffers and write thread
+        self._free_queues = dict()
+        self._buffer_ids = dict()
+        self._write_queue = None
+        self._thread = None
+        self._thread_error = None
+
+        # file/events
+        self._file = None
+        self._file_list = list()
+        self._dump_num = 0
+        self._nb_events_file = dict()
+        self._event_counter = dict()
+        self._nb_events_written = 0
+        self._nb_events_dropped = 0
+        self._packed_attrs = dict()
+        
+
+
+    @property
+    def file_list(self):
+        return list(self._file_list)
+
+    @property
+    def is_open(self):
+        return self._thread is not None
+    
+    @property
+    def nb_events_written(self):
+        return self._nb_events_written
+
+    @property
+    def nb_events_dropped(self):
+        return self._nb_events_dropped
+
+    @property
+    def nb_events_queued(self):
+        if self._write_queue is None:
+            return 0
+        return self._write_queue.qsize()
+
+
+    
+    def set_compression(self, compression=None, compression_level=None,
+                        shuffle=False, delta=False, packed=False, chunk_size=1e6):
+        """
+        Set compression (see get_compression_filter) and layout,
+        e.g. set_compression(**config.get_hdf5_compression())
+
+        Args:
+          compression: string (optional)
+             compression filter ('gzip', 'lzf', 'lz4', 'zstd',...)
+
+          compression_level: integer (optional)
+
+          shuffle: bool
+             byte shuffle pre-filter 
+
+          delta: bool
+             delta encoding of traces (packed layout only)
+        
+          packed: bool
+             packed layout: single [event, chan, sample] dataset 
+             per ADC (default: False, polaris layout)
+
+          chunk_size: float
+             packed layout approximate chunk size in bytes (default 1MB)
+        """
+
+        if delta and not packed:
+            error_msg = 'Delta encoding only available with packed layout!'
+            if self._raise_errors:
+                raise ValueError(error_msg)
+            print('ERROR: ' + error_msg)
+            return
+
+        self._filter_dict = get_compression_filter(compression=compression,
+                                                   compression_level=compression_level,
+                                                   shuffle=shuffle)
+        self._delta = delta
+        self._packed = packed
+        self._chunk_size = chunk_size
+
+
+        
+    def open(self, data_path, adc_config, detector_config=None, data_prefix='raw',
+             run_type=1, run_comment=str(), run_purpose=None, facility=1,
+             nb_events_per_file=1000, series_name=None, series_num=None,
+             dump_num=1):
+        """
+        Start run: create first file and start write thread
+
+        Args:
+          data_path: string
+             output directory
+
+          adc_config: dict
+             ADC configuration {adc_name: dict}, dict with 'sample_rate',
+             'nb_samples', 'channel_list', optional 'adc_conversion_factor', 
+             'voltage_min', 'voltage_max', 'trigger_type', 
+             'connection[chan]' (see settings.get_adc_setup)...
+
+          detector_config: dict (optional)
+             detector configuration {adc_name: dict} 
+             (see control.read_all)
+
+          data_prefix: string
+             file name prefix (default: 'raw')
+
+          run_type: integer
+          run_comment: string
+          run_purpose: string (optional)
+          facility: integer
+
+          nb_events_per_file: integer
+             number of events per file (dump)
+
+          series_name: string (optional)
+             file name series "I[facility]_D[date]_T[time]" 
+             (default: from current time)
+
+          series_num: integer (optional)
+             series number (default: from current time)
+
+          dump_num: integer
+             first dump number (default: 1)
+        
+        Return:
+          bool
+        """
+        
+        if self._thread is not None:
+            self.close()
+
+        if not os.path.isdir(data_path):
+            error_msg = 'Data directory "' + str(data_path) + '" not found!'
+            if self._raise_errors:
+                raise ValueError(error_msg)
+            print('ERROR: ' + error_msg)
+            return False
+
+        # ADC configuration
+        self._adc_config = dict()
+        for adc_name, config in adc_config.items():
+            config = dict(config)
+            for param in ['sample_rate', 'nb_samples', 'channel_list']:
+                if param not in config:
+                    error_msg = 'Missing ADC configuration "' + param + '" for ' + adc_name + '!'
+                    if self._raise_errors:
+                        raise ValueError(error_msg)
+                    print('ERROR: ' + error_msg)
+                    return False
+            channel_list = config['channel_list']
+            if isinstance(channel_list, str):
+                channel_list = arg_utils.hyphen_range(channel_list)
+            config['channel_list'] = [int(chan) for chan in channel_list]
+            self._adc_config[adc_name] = config
+        
+        self._det_config = dict()
+        if detector_config is not None:
+            self._det_config = detector_config
+        
+        # run configuration (series: facility + date/time)
+        now = time.localtime()
+        self._run_config = dict()
+        self._run_config['data_path'] = data_path
+        self._run_config['prefix'] = data_prefix
+        self._run_config['run_type'] = int(run_type)
+        self._run_config['comment'] = run_comment
+        if run_purpose is not None:
+            self._run_config['run_purpose'] = run_purpose
+        self._run_config['facility'] = int(facility)
+        self._run_config['series_name'] = ('I' + str(int(facility))
+                                           + '_D' + time.strftime('%Y%m%d', now)
+                                           + '_T' + time.strftime('%H%M%S', now))
+        if series_name is not None:
+            self._run_config['series_name'] = series_name
+        self._run_config['series_num'] = int(str(int(facility))
+                                             + time.strftime('%y%m%d%H%M%S', now))
+        if series_num is not None:
+            self._run_config['series_num'] = int(series_num)
+        self._run_config['nb_events_per_file'] = max(1, int(nb_events_per_file))
+        
+        # buffers
+        self._free_queues = dict()
+        self._buffer_ids = dict()
+        for adc_name, config in self._adc_config.items():
+            shape = (len(config['channel_list']), int(config['nb_samples']))
+            self._free_queues[adc_name] = queue.Queue()
+            self._buffer_ids[adc_name] = set()
+            for ibuffer in range(self._nb_buffers):
+                buffer = np.zeros(shape, dtype=np.int16)
+                self._buffer_ids[adc_name].add(id(buffer))
+                self._free_queues[adc_name].put(buffer)
+        self._write_queue = queue.Queue(maxsize=self._nb_buffers*len(self._adc_config))
+
+        # counters
+        self._file_list = list()
+        self._dump_num = int(dump_num)-1
+        self._event_counter = {adc_name: 0 for adc_name in self._adc_config}
+        self._nb_events_written = 0
+        self._nb_events_dropped = 0
+        self._thread_error = None
+        
+        # first file
+        self._open_new_file()
+        
+        # start thread
+        self._thread = threading.Thread(target=self._write_loop, daemon=True)
+        self._thread.start()
+
+        return True
+
+
+    
+    def get_buffer(self, adc_name='adc1', timeout=0):
+        """
+        Get free preallocated buffer [chan, sample] (int16) to be filled
+        then queued with write_buffer
+
+        Args:
+          adc_name: string
+          
+          timeout: float
+             maximum waiting time in seconds (default: 0, no wait). 
+             None: wait until buffer available
+         
+        Return:
+          buffer: 2D ndarray (None if no buffer available)
+        """
+        
+        if self._thread is None:
+            error_msg = 'Writer not open!'
+            if self._raise_errors:
+                raise ValueError(error_msg)
+            print('ERROR: ' + error_msg)
+            return None
+        
+        try:
+            if timeout is not None and timeout<=0:
+                return self._free_queues[adc_name].get_nowait()
+            return self._free_queues[adc_name].get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+        
+
+    def write_buffer(self, buffer, adc_name='adc1', event_time=None, **attrs):
+        """
+        Queue buffer (see get_buffer) to be written by write thread.
+        Buffer should not be modified after this call. Other arrays
+        should be written with write_event.
+
+        Args:
+          buffer: 2D ndarray [chan, sample]
+          adc_name: string
+          event_time: float (default: current time)
+          **attrs: additional event attributes
+        """
+        
+        # buffer from free pool (returned to pool once written)
+        if id(buffer) not in self._buffer_ids.get(adc_name, set()):
+            error_msg = ('Buffer not obtained from get_buffer (ADC ' + adc_name
+                         + '), use write_event!')
+            if self._raise_errors:
+                raise ValueError(error_msg)
+            print('ERROR: ' + error_msg)
+            return
+        
+        if event_time is None:
+            event_time = time.time()
+        attrs['event_time'] = event_time
+
+        # queue size = number of buffers (no wait expected)
+        self._write_queue.put((adc_name, buffer, attrs))
+
+
+        
+    def write_event(self, data_array, adc_name='adc1', timeout=0, event_time=None,
+                    **attrs):
+        """
+        Copy event into free buffer and queue it 
+
+        Args:
+          data_array: 2D array [chan, sample]
+          adc_name: string
+          timeout: float
+             maximum waiting time for free buffer (default: 0, no wait)
+          event_time: float (default: current time)
+          **attrs: additional event attributes
+
+        Return:
+          bool: False if event dropped (no buffer available)
+        """
+
+        buffer = self.get_buffer(adc_name=adc_name, timeout=timeout)
+        if buffer is None:
+            self._nb_events_dropped += 1
+            return False
+
+        buffer[...] = data_array
+        self.write_buffer(buffer, adc_name=adc_name, event_time=event_time, **attrs)
+        return True
+
+
+    
+    def add_dropped_events(self, nb_events=1):
+        """
+        Account for events dropped by acquisition 
+        (e.g. no buffer available, see get_buffer)
+        """
+        self._nb_events_dropped += int(nb_events)
+
+
+        
+    def close(self):
+        """
+        Write queued events, stop thread and close file
+        
+        Return:
+          list of files written
+        """
+        
+        if self._thread is not None:
+            self._write_queue.put(None)
+            self._thread.join()
+            self._thread = None
+            
+        self._close_current_file()
+        self._write_queue = None
+        self._free_queues = dict()
+        self._buffer_ids = dict()
+
+        if self._verbose and self._file_list:
+            print('INFO: ' + str(self._nb_events_written) + ' event(s) written in '
+                  + str(len(self._file_list)) + ' file(s), '
+                  + str(self._nb_events_dropped) + ' event(s) dropped')
+        
+        if self._thread_error is not None:
+            error = self._thread_error
+            self._thread_error = None
+            if self._raise_errors:
+                raise error
+            print('ERROR: ' + str(error))
+            
+        return list(self._file_list)
+
+
+    
+    def _write_loop(self):
+        """
+        Write thread: write queued events and return 
+        buffers to free pool
+        """
+
+        while True:
+            item = self._write_queue.get()
+            if item is None:
+                break
+            
+            adc_name, buffer, attrs = item
+            try:
+                if self._thread_error is None:
+                    self._write_event(adc_name, buffer, attrs)
+            except Exception as e:
+                # stop writing, error reported by close()
+                print('ERROR: Unable to write event: ' + str(e))
+                self._thread_error = e
+            finally:
+                self._free_queues[adc_name].put(buffer)
+
+
+                
+    def _write_event(self, adc_name, buffer, attrs):
+        """
+        Write single event (write thread)
+        """
+        
+        # new file if all ADC reached number of events per file
+        nb_events_per_file = self._run_config['nb_events_per_file']
+        if min(self._nb_events_file.values())>=nb_events_per_file:
+            self._close_current_file()
+            self._open_new_file()
+
+        event_index = self._nb_events_file[adc_name]
+        self._event_counter[adc_name] += 1
+
+        # event attributes
+        event_attrs = dict()
+        event_attrs['event_num'] = self._event_counter[adc_name]
+        event_attrs['event_index'] = event_index
+        event_attrs['dump_num'] = self._dump_num
+        event_attrs['series_num'] = self._run_config['series_num']
+        if 'trigger_type' in self._adc_config[adc_name]:
+            event_attrs['trigger_type'] = int(self._adc_config[adc_name]['trigger_type'])
+        event_attrs.update(attrs)
+
+        group = self._file[adc_name]
+        if self._packed:
+
+            dataset = group[PACKED_DATASET_NAME]
+            if dataset.shape[0]<=event_index:
+                dataset.resize(dataset.shape[0]+dataset.chunks[0], axis=0)
+            if self._delta:
+                buffer = delta_encode(buffer.copy())
+            dataset.write_direct(buffer, dest_sel=np.s_[event_index])
+            
+            attrs_dict = self._packed_attrs[adc_name]
+            for key, value in event_attrs.items():
+                if key not in attrs_dict:
+                    attrs_dict[key] = [None]*event_index
+                attrs_dict[key].append(value)
+            for key in attrs_dict:
+                if len(attrs_dict[key])<event_index+1:
+                    attrs_dict[key].append(None)
+                    
+        else:
+            dataset = group.create_dataset('event_' + str(event_index+1), data=buffer,
+                                           **self._filter_dict)
+            _write_attrs(dataset.attrs, event_attrs)
+
+        self._nb_events_file[adc_name] += 1
+        self._nb_events_written += 1
+        
+
+            
+    def _open_new_file(self):
+        """
+        Create new file (next dump) with file/ADC/detector 
+        configuration metadata
+        """
+
+        self._dump_num += 1
+        file_name = (self._run_config['data_path'] + '/' + self._run_config['prefix'] + '_'
+                     + self._run_config['series_name'] + '_F' + str(self._dump_num).zfill(4)
+                     + '.hdf5')
+        if self._verbose:
+            print('INFO: Writing data in ' + file_name)
+            
+        self._file = h5py.File(file_name, 'w')
+        self._file_list.append(file_name)
+
+        # file attributes
+        file_attrs = dict()
+        for key in ['run_type', 'comment', 'run_purpose', 'facility', 'series_num']:
+            if key in self._run_config:
+                file_attrs[key] = self._run_config[key]
+        file_attrs['dump_num'] = self._dump_num
+        file_attrs['timestamp'] = int(time.time())
+        _write_attrs(self._file.attrs, file_attrs)
+
+        # ADC groups
+        self._nb_events_file = dict()
+        self._packed_attrs = dict()
+        for adc_name, config in self._adc_config.items():
+
+            group = self._file.create_group(adc_name)
+            nb_channels = len(config['channel_list'])
+            nb_samples = int(config['nb_samples'])
+            
+            group_attrs = dict()
+            for key, value in config.items():
+                if key=='channel_list' or key=='connection_table':
+                    continue
+                group_attrs[key] = value
+            group_attrs['nb_channels'] = nb_channels
+            group_attrs['nb_samples'] = nb_samples
+            group_attrs['nb_events'] = 0
+            group_attrs['adc_channel_indices'] = np.array(config['channel_list'], dtype=np.int32)
+            _write_attrs(group.attrs, group_attrs)
+
+            if self._packed:
+                event_bytes = nb_channels*nb_samples*2
+                chunk_events = int(max(1, self._chunk_size//event_bytes))
+                dataset = group.create_dataset(PACKED_DATASET_NAME,
+                                               shape=(0, nb_channels, nb_samples),
+                                               maxshape=(None, nb_channels, nb_samples),
+                                               chunks=(chunk_events, nb_channels, nb_samples),
+                                               dtype=np.int16, **self._filter_dict)
+                if self._delta:
+                    dataset.attrs[DELTA_ENCODING_ATTR_NAME] = True
+                self._packed_attrs[adc_name] = dict()
+                
+            self._nb_events_file[adc_name] = 0
+
+        # detector config
+        for adc_name, config in self._det_config.items():
+            group_name = adc_name
+            if adc_name[0:3]=='adc':
+                group_name = 'detconfig' + adc_name[3:]
+            group = self._file.create_group(group_name)
+            _write_attrs(group.attrs, config)
+
+            
+
+    def _close_current_file(self):
+        """
+        Update number of events, write packed layout 
+        per-event attributes and close file
+        """
+        
+        if self._file is None:
+            return
+
+        for adc_name, nb_events in self._nb_events_file.items():
+            group = self._file[adc_name]
+            group.attrs['nb_events'] = nb_events
+
+            if self._packed:
+                group[PACKED_DATASET_NAME].resize(nb_events, axis=0)
+                attrs_group = group.create_group(PACKED_ATTRS_GROUP_NAME)
+                if nb_events==0:
+                    continue
+                for key, values in self._packed_attrs[adc_name].items():
+
+                    # attribute missing for some events: fill value
+                    # (empty string, NaN or -1), stored as "fill_value"
+                    fill_value = None
+                    if any(value is None for value in values):
+                        fill_value = _get_fill_value(values)
+                        if fill_value is None:
+                            print('WARNING: Attribute "' + key + '" missing for some events '
+                                  'and no fill value available, not written!')
+                            continue
+                        values = [fill_value if value is None else value
+                                  for value in values]
+
+                    try:
+                        if isinstance(fill_value, str) or isinstance(values[0], (str, bytes)):
+                            dataset = attrs_group.create_dataset(
+                                key, data=np.array(values, dtype=object),
+                                dtype=h5py.string_dtype())
+                        else:
+                            dataset = attrs_group.create_dataset(key, data=np.asarray(values))
+                    except (TypeError, ValueError):
+                        print('WARNING: Unable to write attribute "' + key + '"!')
+                        continue
+                    if isinstance(fill_value, str):
+                        dataset.attrs['fill_value'] = fill_value
+                    elif fill_value is not None:
+                        dataset.attrs['fill_value'] = np.ravel(fill_value)[0]
+                        
+        self._file.close()
+        self._file = None
+
+
+
+def _get_fill_value(values):
+    """
+    Fill value of per-event attribute missing for some events
+    (None values): empty string, NaN (float) or -1 (integer),
+    same shape as available values. None if not supported
+    """
+    value = next((value for value in values if value is not None), None)
+    if value is None:
+        return None
+    if isinstance(value, (str, bytes)):
+        return str()
+    array = np.asarray(value)
+    if array.dtype.kind in ('f', 'c'):
+        fill = np.nan
+    elif array.dtype.kind=='i':
+        fill = -1
+    else:
+        return None
+    if array.ndim==0:
+        return array.dtype.type(fill)
+    return np.full(array.shape, fill, dtype=array.dtype)
+
+
+
+def _write_attrs(attributes, attrs_dict):
+    """
+    Write dictionary as HDF5 attributes (list of strings stored
+    as variable length string array, None values skipped)
+    """
+    for key, value in attrs_dict.items():
+        if value is None:
+            continue
+        if isinstance(value, (list, tuple, np.ndarray)):
+            array = np.asarray(value)
+            if array.dtype.kind in ('U', 'S', 'O'):
+                value = np.array([str(item) for item in np.ravel(array)],
+                                 dtype=h5py.string_dtype())
+            else:
+                value = array
+        try:
+            attributes[key] = value
+        except TypeError:
+            print('WARNING: Unable to write attribute "' + str(key) + '"!')
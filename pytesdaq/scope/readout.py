@@ -1,4 +1,7 @@
 import time
+import os
+import threading
+import queue
 import numpy as np
 import pickle
 from PyQt5.QtCore import QCoreApplication
@@ -9,6 +12,7 @@ import pytesdaq.instruments.control as instrument
 import pytesdaq.config.settings as settings
 import pytesdaq.io.redis as redis
 import pytesdaq.io.hdf5 as hdf5
+import pytesdaq.io.hdf5_prefetch as hdf5_prefetch
 from pytesdaq.analyzer import analyzer
 from pytesdaq.utils import  arg_utils
 
@@ -80,6 +84,13 @@ class Readout:
         # hdf5 file
         self._current_file_name = None
 
+        # hdf5 live (follow) mode
+        self._follow_path = None
+        self._follow_metadata = None
+        self._follow_queue = None
+        self._follow_stop = None
+        self._follow_thread = None
+
         
 
     def register_ui(self, axes, canvas, status_bar, colors,
@@ -123,7 +134,21 @@ class Readout:
     def configure(self, data_source, adc_name = 'adc1', channel_list=[],
                   sample_rate=[], trace_length=[],
                   voltage_min=[], voltage_max=[],trigger_type=4,
-                  file_list=[]):
+                  file_list=[], follow=False):
+        """
+        Configure data source
+
+        Args:
+          data_source: string
+             'niadc', 'redis' or 'hdf5'
+
+          file_list: list
+             hdf5 files, or directory (live mode)
+
+          follow: bool
+             hdf5 live mode: display events from files being written
+             (directory or single file polled, see H5Reader.follow)
+        """
         
 
         
@@ -147,6 +172,8 @@ class Readout:
         self._daq = None
         self._redis = None
         self._hdf5 = None
+        self._follow_path = None
+        self._follow_metadata = None
     
 
         
@@ -217,8 +244,17 @@ class Readout:
                 error_msg = 'ERROR from readout: No files provided'
                 return error_msg
 
-            self._hdf5 = hdf5.H5Reader()
-            self._hdf5.set_files(file_list)
+            if follow:
+                # live mode: files being written read by follow thread,
+                # reader used for metadata only
+                self._follow_path = file_list[0]
+                if len(file_list)>1:
+                    self._follow_path = os.path.dirname(file_list[0])
+                self._hdf5 = hdf5.H5Reader(raise_errors=False, verbose=False)
+            else:
+                # prefetching reader (next events/file read in background)
+                self._hdf5 = hdf5_prefetch.H5PrefetchReader()
+                self._hdf5.set_files(file_list)
             
                 
     
@@ -234,8 +270,11 @@ class Readout:
 
     def clear_daq(self):
         self._do_stop_run = True
+        self._stop_follow()
         if self._data_source == 'niadc':
             self._daq.clear()    
+        elif self._data_source == 'hdf5' and self._hdf5 is not None:
+            self._hdf5.close()
        
 
     def is_running(self):
@@ -339,6 +378,8 @@ class Readout:
             nb_samples =  self._adc_config['nb_samples']
             data_array = np.zeros((nb_channels,nb_samples), dtype=np.int16)
         
+        elif self._data_source == 'hdf5' and self._follow_path is not None:
+            self._start_follow()
             
 
         
@@ -375,6 +416,53 @@ class Readout:
                 self._daq.read_single_event(data_array, do_clear_task=False)
 
 
+            elif self._data_source == 'hdf5' and self._follow_path is not None:
+
+                # live mode: latest event from follow thread
+                try:
+                    data_array, self._adc_config, current_file = self._follow_queue.get(
+                        timeout=0.05)
+                except queue.Empty:
+                    continue
+
+                # add channel list
+                if isinstance(self._adc_config['adc_channel_indices'], np.int32):
+                    self._adc_config['channel_list'] = [self._adc_config['adc_channel_indices']]
+                else:
+                    self._adc_config['channel_list'] = list(self._adc_config['adc_channel_indices'])
+
+                # file metadata (new file), file being written: metadata
+                # read may fail -> next event
+                self._adc_config['file_name'] = current_file.split('/')[-1]
+                is_new_file = (self._current_file_name is None
+                               or self._current_file_name!=self._adc_config['file_name'])
+                if is_new_file:
+                    try:
+                        self._follow_metadata = self._hdf5.get_follow_metadata(current_file)
+                    except Exception:
+                        continue
+                    
+                # display
+                if 'event_num' in self._adc_config and self._is_qt_ui:
+                    self._status_bar.showMessage('INFO: File = '
+                                                 + self._adc_config['file_name']
+                                                 + ' (live), EventNumber = '
+                                                 + str(self._adc_config['event_num']))
+
+                # connection map
+                self._adc_config['connection_map'] = self._hdf5.get_connection_dict(
+                    adc_name=self._adc_name, metadata=self._follow_metadata)
+
+                # detector config
+                if is_new_file:
+                    self._current_file_name = self._adc_config['file_name']
+                    self._detector_config['settings'] = self._hdf5.get_detector_config(
+                        adc_name=self._adc_name, metadata=self._follow_metadata)
+                    self._detector_config['connection_map'] = self._adc_config['connection_map']
+                    self._do_get_norm = True
+                    self._do_get_sg = True
+                    self._do_get_fit_param = True
+                    
             elif self._data_source == 'hdf5':
 
                 data_array, self._adc_config = self._hdf5.read_event(include_metadata=True,
@@ -662,12 +750,68 @@ class Readout:
         # =========================
         if self._data_source == 'niadc':
             self._daq.clear()
+        self._stop_follow()
         
         self._is_running = False
         self._current_file_name = None
         self._adc_config = None
 
 
+
+    def _start_follow(self):
+        """
+        Start hdf5 live mode thread
+        """
+        self._stop_follow()
+        self._follow_queue = queue.Queue(maxsize=2)
+        self._follow_stop = threading.Event()
+        self._follow_thread = threading.Thread(target=self._follow_files,
+                                               args=(self._follow_path,
+                                                     self._follow_queue,
+                                                     self._follow_stop),
+                                               daemon=True)
+        self._follow_thread.start()
+        
+        
+
+    def _stop_follow(self):
+        """
+        Stop hdf5 live mode thread
+        """
+        if self._follow_stop is not None:
+            self._follow_stop.set()
+        if self._follow_thread is not None:
+            self._follow_thread.join()
+        self._follow_thread = None
+        self._follow_stop = None
+        
+        
+
+    def _follow_files(self, follow_path, event_queue, stop_event):
+        """
+        Follow thread: read new events from files being written
+        (H5Reader.follow), only latest events kept in queue
+        (display slower than acquisition)
+        """
+        reader = hdf5.H5Reader(raise_errors=False, verbose=False)
+        for data_array, info in reader.follow(follow_path, include_metadata=True,
+                                              adc_name=self._adc_name,
+                                              from_start=False,
+                                              poll_interval=0.2,
+                                              stop_event=stop_event):
+            item = (data_array, info, reader.get_current_file_name())
+            while not stop_event.is_set():
+                try:
+                    event_queue.put_nowait(item)
+                    break
+                except queue.Full:
+                    # drop oldest event
+                    try:
+                        event_queue.get_nowait()
+                    except queue.Empty:
+                        pass
+
+
     def save_data(self, filename):
         """
         Save data array
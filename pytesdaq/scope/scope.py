@@ -23,6 +23,7 @@ class MainWindow(QtWidgets.QMainWindow):
         self._data_source = 'niadc'
         self._file_list = list()
         self._select_hdf5_dir = False
+        self._hdf5_dir = None
         self._default_data_dir = './'
 
 
@@ -185,12 +186,21 @@ class MainWindow(QtWidgets.QMainWindow):
 
             elif self._data_source == 'hdf5':
                 
+                # live mode: follow files written in selected directory
+                if self._hdf5_live_checkbox.isChecked():
+                    if self._hdf5_dir is None:
+                        self.statusBar().showMessage('WARNING: No directory selected!')  
+                        return
+                    status = self._readout.configure('hdf5', file_list=[self._hdf5_dir],
+                                                     follow=True)
+                    
                 # check selection done
-                if not self._file_list:
+                elif not self._file_list:
                     self.statusBar().showMessage('WARNING: No files selected!')  
                     return
 
-                status = self._readout.configure('hdf5', file_list=self._file_list)
+                else:
+                    status = self._readout.configure('hdf5', file_list=self._file_list)
 
                 # error
                 if isinstance(status,str):
@@ -329,9 +339,14 @@ class MainWindow(QtWidgets.QMainWindow):
                                  
 
             if os.path.isdir(dir):
+                self._hdf5_dir = dir
                 files = glob(dir+'/*_F*.hdf5')
 
-        if not files:
+        if not files and self._select_hdf5_dir and self._hdf5_dir is not None:
+            # live mode: files not yet written
+            self.statusBar().showMessage('Directory selected (no files yet)')
+            self._file_list = list()
+        elif not files:
             self.statusBar().showMessage('No file have been selected!')
         else:
             self.statusBar().showMessage('Number of files selected = ' + str(len(files)))
@@ -752,6 +767,14 @@ class MainWindow(QtWidgets.QMainWindow):
         font.setWeight(75)
         self._hdf5_dir_radiobutton.setFont(font)
         self._hdf5_dir_radiobutton.setText('Directory')
+
+        self._hdf5_live_checkbox =  QtWidgets.QCheckBox(self._hdf5_tab)
+        self._hdf5_live_checkbox.setGeometry(QtCore.QRect(230, 65, 200, 25))
+        font = QtGui.QFont()
+        font.setBold(True)
+        font.setWeight(75)
+        self._hdf5_live_checkbox.setFont(font)
+        self._hdf5_live_checkbox.setText('Live (follow directory)')
         
 
 
@@ -0,0 +1,117 @@
+import numpy as np
+
+
+
+def get_calibration_coeffs(adc_conversion_factor, channel_indices=None,
+                           dtype=np.float64):
+    """
+    Get ADC calibration coefficient matrix [chan, coeff] from
+    "adc_conversion_factor" metadata (NI device scaling coefficients,
+    increasing power order: volt = c0 + c1*adc + c2*adc^2 + ...)
+
+    Args:
+      adc_conversion_factor: 2D array  [chan, coeff]
+         (1D array if single channel)
+
+      channel_indices: list (optional)
+         rows to select (default: all channels)
+
+      dtype: numpy dtype
+         coefficients type (default: float64)
+
+    Return:
+      coeffs: 2D ndarray [chan, coeff]
+    """
+
+    coeffs = np.array(adc_conversion_factor, dtype=dtype, ndmin=2)
+    if channel_indices is not None:
+        coeffs = coeffs[list(channel_indices),:]
+
+    return coeffs
+
+
+
+def adc_to_volt(data_array, coeffs, dtype=np.float64, out=None):
+    """
+    Convert ADC to volt for all channels/events in a single
+    vectorized pass (Horner evaluation of the calibration
+    polynomial of each channel)
+
+    Args:
+      data_array: ndarray [..., chan, sample]
+         ADC data, e.g. [chan, sample] or [event, chan, sample]
+
+      coeffs: 2D array [chan, coeff]
+         calibration coefficients (see get_calibration_coeffs)
+
+      dtype: numpy dtype
+         output type if "out" not provided (default: float64)
+
+      out: ndarray (optional)
+         output array, same shape as data_array. Should not
+         be data_array itself (use adc_to_volt_inplace)
+
+    Return:
+      out: ndarray [..., chan, sample]
+    """
+
+    if out is None:
+        out = np.empty(np.shape(data_array), dtype=dtype)
+
+    coeffs = np.asarray(coeffs, dtype=out.dtype)
+    nb_channels, nb_coeffs = coeffs.shape
+    if np.shape(data_array)[-2]!=nb_channels:
+        raise ValueError('Number of channels in data (' + str(np.shape(data_array)[-2])
+                         + ') and calibration coefficients (' + str(nb_channels)
+                         + ') differ!')
+
+    # Horner: (((c3*x + c2)*x + c1)*x + c0
+    coeffs = coeffs.reshape((nb_channels, nb_coeffs, 1))
+    if nb_coeffs==1:
+        out[...] = coeffs[:,0]
+        return out
+
+    np.multiply(data_array, coeffs[:,nb_coeffs-1], out=out)
+    for icoeff in range(nb_coeffs-2, -1, -1):
+        out += coeffs[:,icoeff]
+        if icoeff>0:
+            out *= data_array
+
+    return out
+
+
+
+def adc_to_volt_inplace(data_array, coeffs, max_block_size=100e6):
+    """
+    Convert ADC to volt in place (floating point data_array,
+    for example ADC values read directly into float array)
+
+    Args:
+      data_array: floating point ndarray [..., chan, sample]
+         data converted in place
+
+      coeffs: 2D array [chan, coeff]
+         calibration coefficients (see get_calibration_coeffs)
+
+      max_block_size: Float
+         maximum temporary copy size in bytes (default 100MB)
+
+    Return:
+      data_array: ndarray [..., chan, sample]
+    """
+
+    if not np.issubdtype(data_array.dtype, np.floating):
+        raise ValueError('In place conversion requires floating point array!')
+
+    if data_array.ndim<3:
+        adc_to_volt(data_array.copy(), coeffs, out=data_array)
+        return data_array
+
+    # loop blocks of events (copy of input values needed)
+    event_bytes = max(1, data_array[0].nbytes)
+    block_size = max(1, int(max_block_size//event_bytes))
+    for istart in range(0, data_array.shape[0], block_size):
+        block = data_array[istart:istart+block_size]
+        adc_to_volt(block.copy(), coeffs, out=block)
+
+    return data_array
@@ -0,0 +1,162 @@
+"""
+Lossless compression benchmark for int16 ADC traces: compression
+ratio, encode and decode throughput for each filter configuration
+(packed layout, see hdf5.convert_to_packed). 
+
+Traces are either simulated (TES noise or noise + pulses) or
+read from a raw data file. 
+
+Example:
+   python benchmark_compression.py --trace_type pulse
+   python benchmark_compression.py --input_file /data/raw/run1/file_F0001.hdf5
+"""
+
+import argparse
+import time
+import os
+import tempfile
+import shutil
+import h5py
+import numpy as np
+import pytesdaq.io.hdf5 as hdf5
+
+
+
+def simulate_traces(nb_events, nb_channels, nb_samples, sample_rate=1.25e6,
+                    with_pulses=False, seed=0):
+    """
+    Simulate ADC traces: baseline + white noise + 1/f like noise
+    (+ double exponential pulses)
+    """
+    rng = np.random.default_rng(seed)
+    shape = (nb_events, nb_channels, nb_samples)
+
+    # noise
+    traces = rng.normal(0, 8, shape)
+    lowfreq_noise = rng.normal(0, 1, shape)
+    alpha = 0.995
+    for isample in range(1, nb_samples):
+        lowfreq_noise[...,isample] = alpha*lowfreq_noise[...,isample-1] + lowfreq_noise[...,isample]
+    traces += 2*lowfreq_noise
+    traces += rng.uniform(-2000, 2000, (1, nb_channels, 1))
+
+    # pulses
+    if with_pulses:
+        time_array = np.arange(nb_samples)/sample_rate
+        pulse_time = time_array[nb_samples//4]
+        tau_rise = 20e-6
+        tau_fall = 300e-6
+        template = np.exp(-(time_array-pulse_time)/tau_fall) - np.exp(-(time_array-pulse_time)/tau_rise)
+        template[time_array<pulse_time] = 0
+        template /= np.max(template)
+        amplitudes = rng.uniform(200, 8000, (nb_events, nb_channels, 1))
+        traces += amplitudes*template
+
+    return np.clip(np.round(traces), -32768, 32767).astype(np.int16)
+    
+
+
+def benchmark(traces, work_dir, compression, compression_level, shuffle, delta,
+              chunk_size=1e6, nb_repeat=3):
+    """
+    Write/read traces with a filter configuration
+
+    Return:
+      ratio, encode MB/s, decode MB/s
+    """
+    file_name = os.path.join(work_dir, 'benchmark.hdf5')
+    nb_events, nb_channels, nb_samples = traces.shape
+    chunk_events = int(max(1, min(nb_events, chunk_size//traces[0].nbytes)))
+    filter_dict = hdf5.get_compression_filter(compression=compression,
+                                              compression_level=compression_level,
+                                              shuffle=shuffle)
+    raw_mb = traces.nbytes/1e6
+    
+    # encode
+    start_time = time.perf_counter()
+    with h5py.File(file_name, 'w') as h5file:
+        data = traces
+        if delta:
+            data = hdf5.delta_encode(traces.copy())
+        dataset = h5file.create_dataset('data', data=data,
+                                        chunks=(chunk_events, nb_channels, nb_samples),
+                                        **filter_dict)
+        if delta:
+            dataset.attrs[hdf5.DELTA_ENCODING_ATTR_NAME] = True
+        storage_size = dataset.id.get_storage_size()
+    encode_time = time.perf_counter()-start_time
+
+    # decode
+    output = np.zeros(traces.shape, dtype=np.int16)
+    decode_time = None
+    for irepeat in range(nb_repeat):
+        start_time = time.perf_counter()
+        with h5py.File(file_name, 'r') as h5file:
+            hdf5._read_packed_data(h5file['data'], slice(None), slice(None),
+                                   slice(None), output)
+        elapsed_time = time.perf_counter()-start_time
+        if decode_time is None or elapsed_time<decode_time:
+            decode_time = elapsed_time
+
+    if not np.array_equal(output, traces):
+        raise ValueError('Decoded traces differ from original traces!')
+
+    os.remove(file_name)
+    return traces.nbytes/storage_size, raw_mb/encode_time, raw_mb/decode_time
+
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Lossless int16 trace compression benchmark')
+    parser.add_argument('--input_file', type = str,
+                        help = 'Raw data file [default: simulated traces]')
+    parser.add_argument('--adc_name', type = str, default='adc1')
+    parser.add_argument('--trace_type', type = str, default='noise',
+                        help = 'Simulated traces: "noise" or "pulse" [default: noise]')
+    parser.add_argument('--nb_events', type = int, default=200)
+    parser.add_argument('--nb_channels', type = int, default=4)
+    parser.add_argument('--nb_samples', type = int, default=8192)
+    parser.add_argument('--nb_repeat', type = int, default=3)
+    args = parser.parse_args()
+
+    # traces
+    if args.input_file:
+        reader = hdf5.H5Reader()
+        traces = reader.read_many_events(filepath=[args.input_file], nevents=args.nb_events,
+                                         output_format=2, adc_name=args.adc_name)
+    else:
+        traces = simulate_traces(args.nb_events, args.nb_channels, args.nb_samples,
+                                 with_pulses=(args.trace_type=='pulse'))
+    print('Traces: ' + str(traces.shape) + ', {:.1f} MB'.format(traces.nbytes/1e6))
+
+    # filters configuration: (compression, level, shuffle, delta)
+    config_list = [(None, None, False, False),
+                   ('gzip', 4, False, False),
+                   ('gzip', 4, True, False),
+                   ('gzip', 4, True, True),
+                   ('lzf', None, True, False),
+                   ('lzf', None, True, True)]
+    if hdf5.hdf5plugin is not None:
+        config_list += [('lz4', None, True, False),
+                        ('lz4', None, True, True),
+                        ('zstd', 3, True, False),
+                        ('zstd', 3, True, True),
+                        ('blosc_lz4', 5, True, False),
+                        ('blosc_lz4', 5, True, True),
+                        ('blosc_zstd', 5, True, False),
+                        ('blosc_zstd', 5, True, True)]
+    else:
+        print('WARNING: hdf5plugin not installed, LZ4/Zstd/Blosc not tested!')
+
+    work_dir = tempfile.mkdtemp()
+    print('{:12s} {:>5s} {:>7s} {:>5s} | {:>6s} {:>12s} {:>12s}'.format(
+        'compression', 'level', 'shuffle', 'delta', 'ratio', 'encode MB/s', 'decode MB/s'))
+    for compression, level, shuffle, delta in config_list:
+        ratio, encode_rate, decode_rate = benchmark(traces, work_dir, compression, level,
+                                                    shuffle, delta, nb_repeat=args.nb_repeat)
+        print('{:12s} {:>5s} {:>7s} {:>5s} | {:6.2f} {:12.0f} {:12.0f}'.format(
+            str(compression), str(level), str(shuffle), str(delta),
+            ratio, encode_rate, decode_rate))
+
+    shutil.rmtree(work_dir)
@@ -0,0 +1,99 @@
+"""
+Compare reading speed of original layout (one dataset per event)
+and packed layout ([event, chan, sample] dataset). 
+
+Example:
+   python benchmark_hdf5_layout.py --input_path /data/raw/run1 --nb_files 5
+"""
+
+import argparse
+import time
+import os
+import tempfile
+import shutil
+import numpy as np
+import pytesdaq.io.hdf5 as hdf5
+from glob import glob
+
+def time_read(path, adc_name, nb_repeat, **kwargs):
+    """
+    Read all events, return best time (sec) and number of events
+    """
+    reader = hdf5.H5Reader()
+    best_time = None
+    nb_events = 0
+    for irepeat in range(nb_repeat):
+        start_time = time.perf_counter()
+        data = reader.read_many_events(filepath=[path], output_format=2,
+                                       adc_name=adc_name, **kwargs)
+        elapsed_time = time.perf_counter() - start_time
+        nb_events = data.shape[0]
+        if best_time is None or elapsed_time<best_time:
+            best_time = elapsed_time
+        del data
+    return best_time, nb_events
+
+        
+        
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='HDF5 layout read benchmark')
+    parser.add_argument('--input_path', type = str, help = 'Run directory')
+    parser.add_argument('--output_path', type = str,
+                        help = 'Packed files directory [default: temporary directory]')
+    parser.add_argument('--adc_name', type = str, default='adc1')
+    parser.add_argument('--nb_files', type = int, default=0,
+                        help = 'Number of files used [default: all]')
+    parser.add_argument('--chunk_size', type = float, default=1,
+                        help = 'Approximate chunk size in MB [default: 1]')
+    parser.add_argument('--compression', type = str)
+    parser.add_argument('--nb_repeat', type = int, default=3)
+    args = parser.parse_args()
+    
+    if not args.input_path or not os.path.isdir(args.input_path):
+        print('ERROR: Input run directory required!')
+        exit(1)
+
+    file_list = sorted(glob(os.path.join(args.input_path, '*.hdf5')))
+    if args.nb_files>0:
+        file_list = file_list[:args.nb_files]
+
+    # copy original files in separate directory (same file selection)
+    work_dir = tempfile.mkdtemp()
+    original_path = os.path.join(work_dir, 'original')
+    packed_path = args.output_path
+    if packed_path is None:
+        packed_path = os.path.join(work_dir, 'packed')
+    os.makedirs(original_path)
+    os.makedirs(packed_path, exist_ok=True)
+    
+    # convert
+    start_time = time.perf_counter()
+    for file_name in file_list:
+        os.symlink(os.path.abspath(file_name),
+                   os.path.join(original_path, os.path.basename(file_name)))
+        hdf5.convert_to_packed(file_name,
+                               os.path.join(packed_path, os.path.basename(file_name)),
+                               chunk_size=args.chunk_size*1e6,
+                               compression=args.compression)
+    print('Conversion time: {:.2f} s'.format(time.perf_counter()-start_time))
+
+    size_original = sum([os.path.getsize(file_name) for file_name in file_list])
+    size_packed = sum([os.path.getsize(file_name) for file_name in
+                       glob(os.path.join(packed_path, '*.hdf5'))])
+    print('Size: original = {:.1f} MB, packed = {:.1f} MB'.format(size_original/1e6,
+                                                                  size_packed/1e6))
+    
+    # benchmark
+    tests = [('all channels', dict()),
+             ('ADC to volt', dict(adctovolt=True, volt_dtype=np.float32))]
+    for test_name, kwargs in tests:
+        time_original, nb_events = time_read(original_path, args.adc_name,
+                                             args.nb_repeat, **kwargs)
+        time_packed, nb_events = time_read(packed_path, args.adc_name,
+                                           args.nb_repeat, **kwargs)
+        print('{:15s}: {:d} events, original = {:.3f} s, packed = {:.3f} s, speedup = {:.1f}x'.format(
+            test_name, nb_events, time_original, time_packed, time_original/time_packed))
+
+    # cleanup
+    shutil.rmtree(work_dir)
@@ -0,0 +1,170 @@
+"""
+RingBuffer: lossless readers hold slots (writer drops events),
+lossy readers overrun (events skipped), with concurrent readers
+"""
+
+import threading
+import time
+import numpy as np
+from pytesdaq.daq.ring_buffer import RingBuffer
+
+
+
+def write_events(ring, nb_events, delay=0):
+    """
+    Writer: slot filled with sequence number, dropped if
+    held by lossless reader
+    """
+    nb_committed = 0
+    for ievent in range(nb_events):
+        slot = ring.get_write_slot()
+        if slot is None:
+            ring.drop()
+        else:
+            slot[...] = ring.write_sequence
+            ring.commit(sample_counter=ievent)
+            nb_committed += 1
+        if delay>0 and ievent%100==0:
+            time.sleep(delay)
+    ring.close()
+    return nb_committed
+
+
+
+def read_events(reader, sequence_list, error_list, delay=0, out=None):
+    """
+    Consumer: read until ring buffer closed, check slot content
+    """
+    while True:
+        event = reader.read(timeout=None, out=out)
+        if event is None:
+            break
+        sequence, data, _, _ = event
+        if not np.all(data==sequence):
+            error_list.append(sequence)
+        sequence_list.append(sequence)
+        if delay>0 and sequence%50==0:
+            time.sleep(delay)
+        reader.release()
+
+
+
+def test_lossless_hold_and_drop():
+    ring = RingBuffer(4, 2, 8, dtype=np.int64)
+    reader = ring.add_reader(lossless=True)
+
+    # slot held by reader: 3 more events fit, then dropped
+    assert ring.write(np.zeros((2,8)))==0
+    assert reader.read()[0]==0
+    for ievent in range(3):
+        assert ring.write(np.zeros((2,8))) is not None
+    assert ring.write(np.zeros((2,8))) is None
+    assert ring.write(np.zeros((2,8))) is None
+    assert ring.nb_dropped==2
+
+    # released: writer continues
+    reader.release()
+    assert ring.write(np.zeros((2,8))) is not None
+    assert reader.nb_overruns==0
+
+    # removed reader does not hold slots anymore
+    reader.close()
+    for ievent in range(10):
+        assert ring.write(np.zeros((2,8))) is not None
+    assert ring.nb_dropped==2
+
+
+
+def test_lossy_overrun():
+    ring = RingBuffer(4, 2, 8, dtype=np.int64)
+    reader = ring.add_reader()
+    for ievent in range(10):
+        ring.write(np.full((2,8), ievent))
+
+    # oldest available: 10-4+1
+    sequence, data, _, _ = reader.read()
+    assert sequence==7 and np.all(data==7)
+    assert reader.nb_overruns==7
+    assert [reader.read()[0] for ievent in range(2)]==[8, 9]
+    assert reader.read() is None
+    assert ring.nb_dropped==0
+    assert reader.nb_read + reader.nb_overruns==10
+
+
+
+def test_threaded_accounting():
+    """
+    Slow lossless and lossy readers with concurrent writer: lossless
+    reader reads every committed event (none overwritten), dropped
+    events accounted by writer, lossy reader events read + overruns
+    = committed events
+    """
+    nb_events = 20000
+    ring = RingBuffer(8, 2, 16, dtype=np.int64)
+    lossless = ring.add_reader(lossless=True)
+    lossy = ring.add_reader()
+
+    lossless_sequences, lossless_errors = list(), list()
+    lossy_sequences, lossy_errors = list(), list()
+    threads = [threading.Thread(target=read_events,
+                                args=(lossless, lossless_sequences, lossless_errors, 1e-4)),
+               threading.Thread(target=read_events,
+                                args=(lossy, lossy_sequences, lossy_errors, 1e-4,
+                                      np.zeros((2,16), dtype=np.int64)))]
+    for thread in threads:
+        thread.start()
+    nb_committed = write_events(ring, nb_events)
+    for thread in threads:
+        thread.join()
+
+    assert ring.nb_dropped>0
+    assert nb_committed + ring.nb_dropped==nb_events
+
+    assert lossless_sequences==list(range(nb_committed))
+    assert not lossless_errors
+    assert lossless.nb_overruns==0
+
+    assert lossy.nb_overruns>0
+    assert lossy.nb_read + lossy.nb_overruns==nb_committed
+    assert not lossy_errors
+    assert lossy_sequences==sorted(set(lossy_sequences))
+
+
+
+def test_threaded_reader_removal():
+    """
+    Lossless readers added/removed by consumer threads while writing:
+    events read by registered lossless readers never overwritten
+    """
+    nb_events = 20000
+    ring = RingBuffer(8, 2, 16, dtype=np.int64)
+    error_list = list()
+    stop = threading.Event()
+
+    def churn():
+        while not stop.is_set():
+            reader = ring.add_reader(lossless=True)
+            sequence_list = list()
+            for iread in range(20):
+                event = reader.read(timeout=0.01)
+                if event is None:
+                    continue
+                sequence, data, _, _ = event
+                if not np.all(data==sequence):
+                    error_list.append(sequence)
+                sequence_list.append(sequence)
+            reader.close()
+            if (sequence_list
+                and sequence_list!=list(range(sequence_list[0], sequence_list[-1]+1))):
+                error_list.append(sequence_list)
+
+    threads = [threading.Thread(target=churn) for ithread in range(4)]
+    for thread in threads:
+        thread.start()
+    nb_committed = write_events(ring, nb_events, delay=1e-4)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    assert nb_committed + ring.nb_dropped==nb_events
+    assert not error_list
@@ -0,0 +1,136 @@
+"""
+SoftwareTrigger: events independent of block size (block
+boundaries, filter state, matched filter alignment, holdoff)
+"""
+
+import numpy as np
+import pytest
+from pytesdaq.daq.trigger import SoftwareTrigger
+
+
+SAMPLE_RATE = 1.25e6
+NB_SAMPLES = 200000
+TRACE_LENGTH = 2048
+PRETRIGGER_LENGTH = 512
+BLOCK_SIZES = [NB_SAMPLES, 10000, 4096, 1000, 777]
+
+# template start (channel 0, pulse rise 512 samples later):
+# 49_480 rise straddles 10000 samples blocks boundary,
+# 120_000/122_100 closer than template trigger holdoff
+PULSE_STARTS = [15_000, 49_480, 90_000, 120_000, 122_100, 160_777]
+
+
+
+def get_template(length=2048, start=512):
+    time = np.arange(length)
+    template = np.where(time>=start,
+                        np.exp(-(time-start)/300.0)-np.exp(-(time-start)/15.0), 0)
+    return template/np.max(template)
+
+
+
+def get_stream(amplitude=100.0):
+    """
+    2 channels stream (int16, baseline 2000) with template
+    shaped pulses on channel 0
+    """
+    rng = np.random.default_rng(1)
+    data = 2000 + rng.normal(0, 3, (2, NB_SAMPLES))
+    template = get_template()
+    for start in PULSE_STARTS:
+        data[0, start:start+len(template)] += amplitude*template[:NB_SAMPLES-start]
+    return np.round(data).astype(np.int16)
+
+
+
+def create_trigger(mode):
+    trigger = SoftwareTrigger(2, SAMPLE_RATE, TRACE_LENGTH, PRETRIGGER_LENGTH)
+    if mode=='filter':
+        trigger.set_filter(lowpass_freq=50e3, highpass_freq=1e3)
+        trigger.set_threshold([40, None])
+    elif mode=='template':
+        trigger.set_template(get_template())
+        trigger.set_threshold([30, None], holdoff=3000)
+    elif mode=='random':
+        trigger.set_random_rate(100, seed=5)
+    return trigger
+
+
+
+def process_stream(trigger, data, block_size):
+    """
+    Process stream in blocks, return concatenated events
+    """
+    index_list, type_list, amplitude_list, trace_list = list(), list(), list(), list()
+    for start in range(0, data.shape[1], block_size):
+        event_dict = trigger.process(data[:, start:start+block_size],
+                                     sample_counter=start)
+        index_list.append(event_dict['trigger_index'])
+        type_list.append(event_dict['trigger_type'])
+        amplitude_list.append(event_dict['trigger_amplitude'])
+        trace_list.append(event_dict['traces'])
+    return (np.concatenate(index_list), np.concatenate(type_list),
+            np.concatenate(amplitude_list), np.concatenate(trace_list))
+
+
+
+@pytest.mark.parametrize('mode', ['filter', 'template', 'random'])
+def test_block_size_independent(mode):
+    data = get_stream()
+    reference = process_stream(create_trigger(mode), data, NB_SAMPLES)
+    assert len(reference[0])>0
+    for block_size in BLOCK_SIZES[1:]:
+        events = process_stream(create_trigger(mode), data, block_size)
+        np.testing.assert_array_equal(events[0], reference[0])
+        np.testing.assert_array_equal(events[1], reference[1])
+        np.testing.assert_allclose(events[2], reference[2], rtol=1e-9)
+        np.testing.assert_array_equal(events[3], reference[3])
+
+
+
+@pytest.mark.parametrize('mode', ['filter', 'template', 'random'])
+def test_traces_from_stream(mode):
+    data = get_stream()
+    index, _, _, traces = process_stream(create_trigger(mode), data, 777)
+    for ievent, trigger_index in enumerate(index):
+        start = trigger_index - PRETRIGGER_LENGTH
+        np.testing.assert_array_equal(traces[ievent], data[:, start:start+TRACE_LENGTH])
+
+
+
+@pytest.mark.parametrize('block_size', BLOCK_SIZES)
+def test_template_alignment_and_holdoff(block_size):
+    """
+    Matched filter trigger at template maximum, amplitude in template
+    units, second pulse of close pair within holdoff rejected
+    """
+    data = get_stream(amplitude=100.0)
+    index, types, amplitude, _ = process_stream(create_trigger('template'), data,
+                                                block_size)
+    offset = int(np.argmax(get_template()))
+    expected = [start+offset for start in PULSE_STARTS if start!=122_100]
+    np.testing.assert_array_equal(types, 4)
+    assert len(index)==len(expected)
+    assert np.all(np.abs(index-expected)<=1)
+    np.testing.assert_allclose(amplitude, 100.0, rtol=0.05)
+
+
+
+def test_pulse_straddling_blocks():
+    """
+    Pulse rising across block boundary (short block in between):
+    single trigger, complete trace
+    """
+    data = get_stream()
+    trigger = create_trigger('template')
+    index_list = list()
+    for start, stop in [(40000, 49990), (49990, 50010), (50010, 60000), (60000, 70000)]:
+        event_dict = trigger.process(data[:, start:stop], sample_counter=start)
+        index_list.append(event_dict['trigger_index'])
+        for ievent, trigger_index in enumerate(event_dict['trigger_index']):
+            trace_start = trigger_index - PRETRIGGER_LENGTH
+            np.testing.assert_array_equal(event_dict['traces'][ievent],
+                                          data[:, trace_start:trace_start+TRACE_LENGTH])
+    index = np.concatenate(index_list)
+    assert len(index)==1
+    assert abs(index[0]-(49_480+int(np.argmax(get_template()))))<=1